@@ -9,6 +9,9 @@ start cmd /k "cd /d %~dp0lume_django && venv\Scripts\activate && echo Django Bac
 
 timeout /t 3 /nobreak > NUL
 
+echo Starting Background Job Worker...
+start cmd /k "cd /d %~dp0lume_django && venv\Scripts\activate && echo Job Worker Starting... && python manage.py run_jobs"
+
 echo Starting Next.js Frontend...
 start cmd /k "cd /d %~dp0lume_frontend && echo Next.js Frontend Starting... && npm run dev"
 
@@ -16,10 +19,11 @@ timeout /t 2 /nobreak > NUL
 
 echo.
 echo ========================================
-echo Both servers are starting!
+echo All servers are starting!
 echo.
 echo Django Backend: http://localhost:8000
 echo Next.js Frontend: http://localhost:3000
+echo Job Worker: running in its own window
 echo.
 echo Open http://localhost:3000 in your browser
 echo ========================================
@@ -0,0 +1,326 @@
+"""
+Concurrent execution of the Google actions behind a chat turn.
+
+Each detected service the user has granted becomes one action. Actions fetch
+in a shared thread pool, so a turn that touches Gmail, Calendar and Tasks
+waits for the slowest service rather than the sum of all three. Where one
+service needs several calls (message metadata, tasks per list) they go out as
+a single batch HTTP request. Only the network part runs in the pool; reading
+and writing local stores (``prepare``/``finish``) stays in the request thread,
+which owns the DB connection. A turn that asks to add or complete a task has
+it written to Google in the pool and through to the cache in ``finish``.
+
+Every turn has a deadline (``ACTION_DEADLINE_SECONDS``). Services that have
+not answered by then are reported as ``timeout`` and the others are returned
+as they are; HTTP timeouts are derived from the same deadline, so stragglers
+stop soon after.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from django.conf import settings
+
+from . import gcalendar, gmail, google_api, gtasks, keep, readthrough
+from .google_api import DeadlineExceeded, GoogleAPIError, NotConnected, remaining
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAMES = {
+    'email': 'Gmail',
+    'calendar': 'Google Calendar',
+    'tasks': 'Google Tasks',
+    'keep': 'Google Keep',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ACTION_MAX_WORKERS', 16),
+                    thread_name_prefix='google-actions',
+                )
+    return _executor
+
+
+# Live listings, used until a local store has synced: (token, message, deadline) -> data
+
+def email_job(token, message, deadline):
+    listing = google_api.get_json(
+        token, 'gmail', '/gmail/v1/users/me/messages',
+        params={'maxResults': 5, 'labelIds': 'INBOX'}, timeout=remaining(deadline),
+    )
+    ids = [item['id'] for item in listing.get('messages', [])]
+    parts = google_api.batch(token, 'gmail', [
+        ('GET', f'/gmail/v1/users/me/messages/{message_id}?format=metadata'
+                '&metadataHeaders=From&metadataHeaders=Subject')
+        for message_id in ids
+    ], timeout=remaining(deadline))
+    return {'messages': [
+        {
+            'id': body['id'],
+            'thread_id': body['threadId'],
+            'from': gmail.header(body, 'From'),
+            'subject': gmail.header(body, 'Subject'),
+            'snippet': body.get('snippet', ''),
+        }
+        for status, body in parts if status == 200
+    ]}
+
+
+def calendar_job(token, message, deadline):
+    now = datetime.now(timezone.utc)
+    listing = google_api.get_json(
+        token, 'calendar', '/calendar/v3/calendars/primary/events',
+        params={
+            'timeMin': now.isoformat(),
+            'timeMax': (now + timedelta(days=7)).isoformat(),
+            'singleEvents': 'true',
+            'orderBy': 'startTime',
+            'maxResults': 10,
+        },
+        timeout=remaining(deadline),
+    )
+    return {'events': [
+        {
+            'id': event['id'],
+            'summary': event.get('summary', ''),
+            'start': event['start'].get('dateTime') or event['start'].get('date'),
+            'end': event['end'].get('dateTime') or event['end'].get('date'),
+        }
+        for event in listing.get('items', [])
+    ]}
+
+
+class Action:
+    """
+    One service's work for a chat turn.
+
+    ``prepare`` and ``finish`` run in the request thread and may use the DB;
+    ``fetch`` runs in the pool and must only talk to Google.
+    """
+
+    def prepare(self, user):
+        return None
+
+    def fetch(self, token, context, message, deadline):
+        raise NotImplementedError
+
+    def finish(self, user, context, fetched):
+        return fetched
+
+
+class MailboxAction(Action):
+    """
+    Gmail from the local mailbox store: fetch the history delta, apply it and
+    read locally. Until the mailbox has been backfilled the inbox is listed live.
+    """
+
+    def prepare(self, user):
+        return gmail.synced_history_id(user)
+
+    def fetch(self, token, history_id, message, deadline):
+        if history_id is None:
+            return email_job(token, message, deadline)
+        return gmail.fetch_history(token, history_id, deadline=deadline)
+
+    def finish(self, user, history_id, fetched):
+        if history_id is None:
+            return fetched
+        if fetched:
+            gmail.apply_changes(user, fetched)
+        return {'messages': gmail.recent_messages(user, limit=5)}
+
+
+class CalendarAction(Action):
+    """
+    Calendar from the local event store, kept fresh with its sync token.
+    Lists live until the first full sync, or when the token has expired.
+    """
+
+    def prepare(self, user):
+        return gcalendar.synced_sync_token(user)
+
+    def fetch(self, token, sync_token, message, deadline):
+        if sync_token is not None:
+            try:
+                return gcalendar.fetch_changes(token, sync_token, deadline=deadline)
+            except gcalendar.SyncTokenExpired:
+                pass
+        return calendar_job(token, message, deadline)
+
+    def finish(self, user, sync_token, fetched):
+        if not isinstance(fetched, gcalendar.CalendarChanges):
+            if sync_token is not None:
+                gcalendar.expire_sync_token(user)
+            return fetched
+        gcalendar.apply_changes(user, fetched)
+        return {'events': gcalendar.upcoming_events(user, days=7, limit=10)}
+
+
+class ReadThroughAction(Action):
+    """Tasks and Keep through the read-through cache; ``module`` is gtasks or keep"""
+
+    def __init__(self, module, read):
+        self.module = module
+        self.read = read
+
+    def prepare(self, user):
+        return readthrough.load(user, self.module.PREFIX)
+
+    def fetch(self, token, cached, message, deadline):
+        return self.module.revalidate(token, cached, deadline=deadline)
+
+    def finish(self, user, cached, result):
+        readthrough.save(user, result)
+        return self.read(result)
+
+
+class TasksAction(ReadThroughAction):
+    """Tasks through the read-through cache, plus the task change the message asks for"""
+
+    def __init__(self):
+        super().__init__(gtasks, lambda result: {'tasks': gtasks.open_tasks(result)})
+
+    def fetch(self, token, cached, message, deadline):
+        result = gtasks.revalidate(token, cached, deadline=deadline)
+        change = gtasks.parse_write(message)
+        written = gtasks.write(token, result, change, deadline=deadline) if change else None
+        return result, change, written
+
+    def finish(self, user, cached, fetched):
+        result, change, written = fetched
+        readthrough.save(user, result)
+        if written:
+            gtasks.store_write(user, result, written)
+        data = self.read(result)
+        if written:
+            data[{'create': 'created', 'complete': 'completed'}[change[0]]] = written[1]['title']
+        return data
+
+
+ACTIONS = {
+    'email': MailboxAction(),
+    'calendar': CalendarAction(),
+    'tasks': TasksAction(),
+    'keep': ReadThroughAction(keep, lambda result: {
+        'notes': [{'name': note['name'], 'title': note['title']} for note in keep.notes(result)],
+    }),
+}
+
+
+def _failure(service, error):
+    # Called from an except block, so unexpected errors keep their traceback.
+    if isinstance(error, (DeadlineExceeded, httpx.TimeoutException)):
+        return {'status': 'timeout'}
+    if isinstance(error, (GoogleAPIError, httpx.HTTPError)):
+        logger.warning("%s action failed: %s", service, error)
+        return {'status': 'error', 'error': str(error)}
+    # A malformed payload or a failed local store write: only this service fails.
+    logger.exception("%s action failed", service)
+    return {'status': 'error', 'error': 'unexpected error'}
+
+
+def _fetch(service, action, token, context, message, deadline):
+    started = time.monotonic()
+    try:
+        result = {'status': 'ok', 'fetched': action.fetch(token, context, message, deadline)}
+    except Exception as e:
+        result = _failure(service, e)
+    result['elapsed_ms'] = round((time.monotonic() - started) * 1000)
+    return result
+
+
+def _finish(service, user, context, result):
+    fetched = result.pop('fetched', None)
+    if result['status'] != 'ok':
+        return result
+    try:
+        result['data'] = ACTIONS[service].finish(user, context, fetched)
+    except Exception as e:
+        return {**_failure(service, e), 'elapsed_ms': result['elapsed_ms']}
+    return result
+
+
+def run_actions(user, detected_services, message='', timeout=None):
+    """
+    Run the actions for the detected services the user has granted.
+
+    Returns ``{service: result}``; each result has a ``status`` of ``ok``
+    (with ``data``), ``error`` (with ``error``) or ``timeout``. Users without
+    Google credentials get no actions.
+    """
+    services = [
+        service for service, detected in detected_services.items()
+        if detected and service in ACTIONS and user.has_service_permission(service)
+    ]
+    if not services or not user.access_token:
+        return {}
+    try:
+        token = google_api.access_token(user)
+    except NotConnected as e:
+        return {service: {'status': 'error', 'error': str(e)} for service in services}
+
+    if timeout is None:
+        timeout = getattr(settings, 'ACTION_DEADLINE_SECONDS', 3.0)
+    deadline = time.monotonic() + timeout
+    contexts = {service: ACTIONS[service].prepare(user) for service in services}
+    futures = {
+        _pool().submit(_fetch, service, ACTIONS[service], token, contexts[service], message, deadline): service
+        for service in services
+    }
+    done, _ = wait(futures, timeout=timeout)
+
+    results = {}
+    for future, service in futures.items():
+        if future in done:
+            results[service] = _finish(service, user, contexts[service], future.result())
+        else:
+            future.cancel()
+            results[service] = {'status': 'timeout', 'elapsed_ms': round(timeout * 1000)}
+    logger.info(
+        "Actions for user %s: %s", user.pk,
+        ', '.join(f"{service}={result['status']}" for service, result in results.items()),
+    )
+    return results
+
+
+def describe(service, result):
+    """One sentence summarizing an action result for the assistant reply"""
+    name = SERVICE_NAMES.get(service, service)
+    if result['status'] == 'timeout':
+        return f"{name} is taking too long to respond, so I'll leave it out for now."
+    if result['status'] == 'error':
+        return f"I couldn't reach {name} ({result['error']})."
+
+    data = result['data']
+    if service == 'email':
+        messages = data['messages']
+        if not messages:
+            return "Your inbox has no recent messages."
+        latest = messages[0]
+        return f"You have {len(messages)} recent emails; the latest is \"{latest['subject']}\" from {latest['from']}."
+    if service == 'calendar':
+        events = data['events']
+        if not events:
+            return "Your calendar is clear for the next 7 days."
+        return f"You have {len(events)} events in the next 7 days; next up is \"{events[0]['summary']}\"."
+    if service == 'tasks':
+        if 'created' in data:
+            return f"I added \"{data['created']}\" to your tasks; you have {len(data['tasks'])} open."
+        if 'completed' in data:
+            return f"I marked \"{data['completed']}\" as done; you have {len(data['tasks'])} open tasks left."
+        return f"You have {len(data['tasks'])} open tasks."
+    if service == 'keep':
+        return f"You have {len(data['notes'])} notes in Keep."
+    return f"{name} is ready."
@@ -0,0 +1,60 @@
+from django.contrib import admin
+from .models import (
+    CachedResource, CalendarEvent, CalendarState, Contact, ContactsState, MailboxState, MailMessage,
+)
+
+
+@admin.register(MailboxState)
+class MailboxStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'history_id', 'backfilled_at', 'synced_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('history_id', 'backfilled_at', 'synced_at')
+
+
+@admin.register(MailMessage)
+class MailMessageAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'sender', 'user', 'is_unread', 'in_inbox', 'received_at')
+    list_filter = ('is_unread', 'in_inbox')
+    list_select_related = ('user',)
+    search_fields = ('subject', 'sender', 'user__email')
+    raw_id_fields = ('user',)
+
+
+@admin.register(CalendarState)
+class CalendarStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'generation', 'synced_at', 'resynced_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('sync_token', 'page_token', 'generation', 'max_event_seconds', 'synced_at', 'resynced_at')
+
+
+@admin.register(CalendarEvent)
+class CalendarEventAdmin(admin.ModelAdmin):
+    list_display = ('summary', 'user', 'start', 'end', 'all_day', 'busy')
+    list_filter = ('all_day', 'busy')
+    list_select_related = ('user',)
+    search_fields = ('summary', 'user__email')
+    raw_id_fields = ('user',)
+
+
+@admin.register(ContactsState)
+class ContactsStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'version', 'synced_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('sync_token', 'version', 'synced_at')
+
+
+@admin.register(Contact)
+class ContactAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'resource_name')
+    list_select_related = ('user',)
+    search_fields = ('name', 'user__email')
+    raw_id_fields = ('user',)
+
+
+@admin.register(CachedResource)
+class CachedResourceAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'size', 'synced_at', 'last_used_at')
+    list_select_related = ('user',)
+    search_fields = ('key', 'user__email')
+    raw_id_fields = ('user',)
+    readonly_fields = ('etag', 'size', 'synced_at', 'last_used_at')
@@ -0,0 +1,128 @@
+"""
+Google batch HTTP (multipart/mixed) encoding.
+
+A batch packs several API calls into one request. Each part is an
+``application/http`` message tagged with a Content-ID; Google may answer the
+parts in any order, so responses are matched back by Content-ID. The
+server-side helpers are used by the fake Google service in tests.
+"""
+
+import json
+import re
+import uuid
+from http import HTTPStatus
+
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?')
+_ITEM_RE = re.compile(r'<(?:response-)?item(\d+)>')
+
+
+class Part:
+    """One decoded response of a batch"""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+def _split(body, content_type):
+    match = _BOUNDARY_RE.search(content_type)
+    if not match:
+        raise ValueError(f"No multipart boundary in {content_type!r}")
+    delimiter = b'--' + match.group(1).encode()
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith(b'--'):
+            break
+        yield chunk.strip(b'\r\n')
+
+
+def _parse_message(raw):
+    # Returns (first line, headers, body) of an HTTP message or MIME part.
+    head, _, body = raw.replace(b'\r\n', b'\n').partition(b'\n\n')
+    lines = head.decode().split('\n')
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return lines[0], headers, body.strip(b'\n')
+
+
+def _parse_part(raw):
+    # MIME headers, then the embedded HTTP message
+    head, _, message = raw.replace(b'\r\n', b'\n').partition(b'\n\n')
+    mime = {}
+    for line in head.decode().split('\n'):
+        name, _, value = line.partition(':')
+        mime[name.strip().lower()] = value.strip()
+    return mime, message
+
+
+def encode_request(requests):
+    """
+    Encode ``[(method, path), ...]`` as a batch body.
+
+    Returns ``(body, content_type)``.
+    """
+    boundary = f'batch_{uuid.uuid4().hex}'
+    lines = []
+    for index, (method, path) in enumerate(requests):
+        lines += [
+            f'--{boundary}',
+            'Content-Type: application/http',
+            f'Content-ID: <item{index}>',
+            '',
+            f'{method} {path} HTTP/1.1',
+            '',
+        ]
+    lines.append(f'--{boundary}--')
+    return '\r\n'.join(lines).encode(), f'multipart/mixed; boundary={boundary}'
+
+
+def decode_response(body, content_type):
+    """Decode a batch response into ``{request index: Part}``; missing parts are absent"""
+    parts = {}
+    for raw in _split(body, content_type):
+        mime, message = _parse_part(raw)
+        status_line, headers, payload = _parse_message(message)
+        match = _ITEM_RE.search(mime.get('content-id', ''))
+        index = int(match.group(1)) if match else len(parts)
+        parts[index] = Part(int(status_line.split()[1]), headers, payload)
+    return parts
+
+
+def decode_request(body, content_type):
+    """Server side: decode a batch body into ``[(method, path), ...]``"""
+    requests = []
+    for raw in _split(body, content_type):
+        _, message = _parse_part(raw)
+        request_line, _, _ = _parse_message(message)
+        method, path, _ = request_line.split(' ', 2)
+        requests.append((method, path))
+    return requests
+
+
+def encode_response(responses):
+    """
+    Server side: encode ``[(status, payload), ...]`` as a batch response.
+
+    Returns ``(body, content_type)``.
+    """
+    boundary = f'batch_{uuid.uuid4().hex}'
+    lines = []
+    for index, (status, payload) in enumerate(responses):
+        body = json.dumps(payload) if payload is not None else ''
+        lines += [
+            f'--{boundary}',
+            'Content-Type: application/http',
+            f'Content-ID: <response-item{index}>',
+            '',
+            f'HTTP/1.1 {status} {HTTPStatus(status).phrase}',
+            'Content-Type: application/json; charset=UTF-8',
+            '',
+            body,
+        ]
+    lines.append(f'--{boundary}--')
+    return '\r\n'.join(lines).encode(), f'multipart/mixed; boundary={boundary}'
@@ -0,0 +1,257 @@
+"""
+Local contacts index for resolving recipients ("email Alice", "meeting with Bob").
+
+Connections are pulled from the People API in bulk after login and refreshed
+incrementally with sync tokens; rows live in ``Contact``. Lookups go to an
+in-memory ``ContactIndex`` built from those rows and kept per process, keyed
+by the user's ``ContactsState.version`` so a sync that changed anything
+invalidates it. Checking the version is one primary-key query; the lookup
+itself is a couple of binary searches.
+
+The index holds every name word and email part in one sorted array, a
+compact stand-in for a prefix trie: all terms starting with a prefix form one
+contiguous slice. Queries without any prefix match fall back to trigram
+overlap, which tolerates typos ("smyth" -> Smith). Contacts use the
+``contacts.readonly`` scope requested at login; there is no service flag.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from lume_django.db import upsert_unique_fields
+from . import google_api
+from .google_api import GoogleAPIError, remaining
+from .models import Contact, ContactsState
+
+logger = logging.getLogger(__name__)
+
+CONTACTS_SCOPE = 'https://www.googleapis.com/auth/contacts.readonly'
+CONNECTIONS_PATH = '/v1/people/me/connections'
+
+_WORD_RE = re.compile(r'[^\w@.]+')
+_EMAIL_PARTS_RE = re.compile(r'[@._+-]+')
+
+
+class SyncTokenExpired(Exception):
+    """Raised when the People API no longer accepts a sync token."""
+
+
+def _fold(text):
+    # Lowercase and strip accents, so "José" matches "jose"
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def _terms(name, emails):
+    terms = set(_WORD_RE.sub(' ', _fold(name)).split())
+    for email in emails:
+        email = _fold(email)
+        terms.add(email)
+        terms.update(part for part in _EMAIL_PARTS_RE.split(email) if part)
+    return terms
+
+
+def _trigrams(text):
+    text = f'  {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ContactIndex:
+    """Prefix and trigram index over one user's contacts"""
+
+    def __init__(self, contacts):
+        # Positions are alphabetical ranks, so "best first" is "lowest position first".
+        ranked = sorted(((_fold(name), name, tuple(emails)) for name, emails in contacts), key=lambda c: c[:2])
+        self.contacts = [(name, emails) for _, name, emails in ranked]
+        self._folded = [folded for folded, _, _ in ranked]
+        self._contact_terms = [_terms(name, emails) for name, emails in self.contacts]
+        entries = sorted(
+            (term, position)
+            for position, terms in enumerate(self._contact_terms)
+            for term in terms
+        )
+        self._terms = [term for term, _ in entries]
+        self._positions = array('I', (position for _, position in entries))
+        grams = defaultdict(set)
+        for position, (name, emails) in enumerate(self.contacts):
+            for term in self._folded[position].split() + [_fold(email).split('@')[0] for email in emails]:
+                for gram in _trigrams(_WORD_RE.sub('', term)):
+                    grams[gram].add(position)
+        self._grams = {gram: array('I', sorted(positions)) for gram, positions in grams.items()}
+
+    def __len__(self):
+        return len(self.contacts)
+
+    def _range(self, keys, prefix):
+        start = bisect_left(keys, prefix)
+        return start, bisect_left(keys, prefix + '\uffff', start)
+
+    def _prefixed(self, words, exclude, limit):
+        # Contacts where every word prefixes one of their terms, lowest positions first.
+        slices = sorted((self._range(self._terms, word) for word in words), key=lambda r: r[1] - r[0])
+        start, end = slices[0]
+        others = [word for word in words if self._range(self._terms, word) != (start, end)]
+        candidates = self._positions[start:end]
+        # A contact appears once per matching term; a few extra cover the duplicates.
+        for size in (limit * 4, len(candidates)):
+            found = []
+            for position in dict.fromkeys(heapq.nsmallest(size, candidates)):
+                if position in exclude:
+                    continue
+                terms = self._contact_terms[position]
+                if all(any(term.startswith(word) for term in terms) for word in others):
+                    found.append(position)
+                    if len(found) == limit:
+                        return found
+            if size >= len(candidates):
+                return found
+        return found
+
+    def _fuzzy(self, query):
+        grams = _trigrams(query)
+        scores = Counter()
+        for gram in grams:
+            scores.update(self._grams.get(gram, ()))
+        threshold = max(2, len(grams) / 2)
+        return [position for position, score in scores.most_common() if score >= threshold]
+
+    def search(self, query, limit=8):
+        """Contacts matching ``query``, best first, as ``(name, emails)`` pairs"""
+        words = _WORD_RE.sub(' ', _fold(query)).split()
+        if not words:
+            return []
+        # Names that start with the query first (one contiguous range), then other matches
+        start, end = self._range(self._folded, ' '.join(words))
+        ranked = list(range(start, min(end, start + limit)))
+        if len(ranked) < limit:
+            ranked += self._prefixed(words, set(ranked), limit - len(ranked))
+        if not ranked and len(''.join(words)) >= 3:
+            ranked = self._fuzzy(''.join(words))
+        return [self.contacts[position] for position in ranked[:limit]]
+
+
+_indexes = OrderedDict()  # user id -> (version, ContactIndex), least recently used first
+_indexes_lock = threading.Lock()
+
+
+def get_index(user):
+    """The user's ContactIndex, rebuilt only when their contacts changed"""
+    version = ContactsState.objects.filter(user=user).values_list('version', flat=True).first() or 0
+    with _indexes_lock:
+        cached = _indexes.get(user.pk)
+        if cached and cached[0] == version:
+            _indexes.move_to_end(user.pk)
+            return cached[1]
+    index = ContactIndex(Contact.objects.filter(user=user).values_list('name', 'emails'))
+    with _indexes_lock:
+        _indexes[user.pk] = (version, index)
+        _indexes.move_to_end(user.pk)
+        while len(_indexes) > getattr(settings, 'CONTACTS_INDEX_CACHE_USERS', 1000):
+            _indexes.popitem(last=False)
+    return index
+
+
+def autocomplete(user, query, limit=8):
+    """Contacts for a partial name or email; empty without the contacts scope"""
+    if not user.has_scope(CONTACTS_SCOPE):
+        return []
+    return [
+        {'name': name, 'email': emails[0] if emails else '', 'emails': list(emails)}
+        for name, emails in get_index(user).search(query, limit)
+    ]
+
+
+# Sync
+
+class ContactChanges:
+    def __init__(self, people, sync_token, reset):
+        self.people = people
+        self.sync_token = sync_token
+        self.reset = reset  # replace every stored contact
+
+
+def fetch_connections(token, sync_token='', deadline=None):
+    """Fetch all connections, or only those changed since ``sync_token``"""
+    params = {
+        'personFields': 'names,emailAddresses',
+        'pageSize': 1000,
+        'requestSyncToken': 'true',
+    }
+    if sync_token:
+        params['syncToken'] = sync_token
+    people = []
+    while True:
+        try:
+            page = google_api.get_json(token, 'people', CONNECTIONS_PATH, params=params, timeout=remaining(deadline))
+        except GoogleAPIError as e:
+            if sync_token and e.status in (400, 410):
+                raise SyncTokenExpired() from e
+            raise
+        people += page.get('connections', [])
+        if 'nextPageToken' not in page:
+            return ContactChanges(people, page.get('nextSyncToken', ''), reset=not sync_token)
+        params['pageToken'] = page['nextPageToken']
+
+
+def _row(user, person):
+    names = person.get('names', [])
+    emails = [item['value'] for item in person.get('emailAddresses', []) if item.get('value')]
+    return Contact(
+        user=user,
+        resource_name=person['resourceName'],
+        name=(names[0].get('displayName', '') if names else '')[:255],
+        emails=emails,
+    )
+
+
+def apply_changes(user, changes):
+    with transaction.atomic(using=router.db_for_write(Contact)):
+        state, _ = ContactsState.objects.select_for_update().get_or_create(user=user)
+        contacts = Contact.objects.filter(user=user)
+        if changes.reset:
+            contacts.delete()
+        deleted = [p['resourceName'] for p in changes.people if p.get('metadata', {}).get('deleted')]
+        if deleted:
+            contacts.filter(resource_name__in=deleted).delete()
+        rows = [_row(user, p) for p in changes.people if not p.get('metadata', {}).get('deleted')]
+        if rows:
+            Contact.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=upsert_unique_fields(Contact, ['user', 'resource_name']),
+                update_fields=['name', 'emails'],
+            )
+        if changes.reset or changes.people:
+            state.version += 1
+        state.sync_token = changes.sync_token
+        state.synced_at = timezone.now()
+        state.save()
+    return state
+
+
+def sync_contacts(user, deadline=None):
+    """
+    Bring the user's contacts up to date: in bulk the first time, by sync token after.
+
+    Returns the ContactsState, or None without the contacts scope.
+    """
+    if not user.access_token or not user.has_scope(CONTACTS_SCOPE):
+        return None
+    token = google_api.access_token(user)
+    sync_token = ContactsState.objects.filter(user=user).values_list('sync_token', flat=True).first() or ''
+    try:
+        changes = fetch_connections(token, sync_token, deadline=deadline)
+    except SyncTokenExpired:
+        logger.info("Contacts sync token of user %s expired, resyncing", user.pk)
+        changes = fetch_connections(token, deadline=deadline)
+    return apply_changes(user, changes)
@@ -0,0 +1,603 @@
+"""
+In-memory stand-in for the Google APIs, for tests and load tests.
+
+``FakeGoogle`` answers the subset of Gmail, Calendar, Tasks, Keep and People
+that the integrations use, including batch requests, Gmail history and sync
+tokens, and the OAuth endpoints of a login: authorization (which consents at
+once and redirects back with a code), token exchange and refresh, and
+userinfo. Per-API latency can be injected to simulate a slow service.
+
+Use ``transport()`` with an ``httpx.Client``, and point ``GOOGLE_API_ENDPOINTS``
+at ``fake_google.ENDPOINTS``; or ``serve()`` it over HTTP, for code that does
+not go through httpx (oauthlib) or runs in another process (see
+``manage.py fake_google``).
+"""
+
+import hashlib
+import json
+import math
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit
+
+import httpx
+
+from . import batch as batch_http
+
+BASE_URL = 'https://google.test'
+
+ENDPOINTS = {api: BASE_URL for api in ('gmail', 'calendar', 'tasks', 'keep', 'people', 'oauth2')}
+
+AUTH_PATH = '/o/oauth2/auth'
+TOKEN_PATH = '/token'
+USERINFO_PATH = '/oauth2/v2/userinfo'
+
+# Called without a bearer token
+PUBLIC_PATHS = {AUTH_PATH, TOKEN_PATH}
+
+
+def _rfc3339(value):
+    value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f'{value.microsecond // 1000:03d}Z'
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class FakeGoogle:
+    BASE_URL = BASE_URL
+
+    # Gmail historyTypes -> key of the matching history record field
+    HISTORY_KEYS = {
+        'messageAdded': 'messagesAdded',
+        'messageDeleted': 'messagesDeleted',
+        'labelAdded': 'labelsAdded',
+        'labelRemoved': 'labelsRemoved',
+    }
+
+    def __init__(self, latency=None):
+        self.latency = dict(latency or {})  # api -> seconds per request
+        self.requests = []  # (method, path) of every HTTP request received
+        self.calls = []  # (api, method, path) of every API call, batch parts included
+        self.statuses = []  # status of every API call, batch parts included
+        self.messages = {}
+        self.history_id = 1000  # Gmail mailbox historyId
+        self.history = []  # Gmail history records, oldest first
+        self.history_floor = 0  # history at or below this id has expired
+        self.events = {}
+        self.event_changes = {}  # event id -> calendar change counter when last changed
+        self.calendar_seq = 0
+        self.sync_token_floor = 0  # sync tokens older than this answer 410
+        self.tasklists = {}
+        self.tasks = {}  # tasklist id -> {task id: task}
+        self.notes = {}
+        self.people = {}  # resource name -> person (deleted ones as tombstones)
+        self.people_changes = {}  # resource name -> people change counter when last changed
+        self.people_seq = 0
+        self.people_token_floor = 0
+        self.codes = {}  # authorization code -> granted scope
+        self.quotas = {}  # api -> (capacity, calls per second) enforced with 429s
+        self._buckets = {}  # api -> (tokens, time.monotonic() of last call)
+        self._injected = {}  # api -> [(status, retry_after)] answered to the next calls
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._routes = [
+            ('GET', re.compile(r'^/o/oauth2/auth$'), self._authorize),
+            ('POST', re.compile(r'^/token$'), self._token),
+            ('GET', re.compile(r'^/oauth2/v2/userinfo$'), self._userinfo),
+            ('POST', re.compile(r'^/batch/(gmail|calendar|tasks)/v\d+$'), self._batch),
+            ('GET', re.compile(r'^/gmail/v1/users/me/profile$'), self._gmail_profile),
+            ('GET', re.compile(r'^/gmail/v1/users/me/history$'), self._gmail_history),
+            ('GET', re.compile(r'^/gmail/v1/users/me/messages$'), self._gmail_list),
+            ('GET', re.compile(r'^/gmail/v1/users/me/messages/([^/]+)$'), self._gmail_get),
+            ('GET', re.compile(r'^/calendar/v3/calendars/([^/]+)/events$'), self._calendar_list),
+            ('GET', re.compile(r'^/tasks/v1/users/@me/lists$'), self._tasklists_list),
+            ('GET', re.compile(r'^/tasks/v1/lists/([^/]+)/tasks$'), self._tasks_list),
+            ('POST', re.compile(r'^/tasks/v1/lists/([^/]+)/tasks$'), self._tasks_insert),
+            ('PATCH', re.compile(r'^/tasks/v1/lists/([^/]+)/tasks/([^/]+)$'), self._tasks_patch),
+            ('GET', re.compile(r'^/v1/notes$'), self._notes_list),
+            ('GET', re.compile(r'^/v1/people/me/connections$'), self._connections_list),
+        ]
+
+    # Test data
+
+    def seed(self, messages=50, events=20):
+        """A mailbox and a calendar to serve load tests: recent mail, and meetings over the coming days"""
+        subjects = ['Quarterly report', 'Lunch on Friday?', 'Invoice 4411', 'Meeting notes', 'Travel plans']
+        now = datetime.now(timezone.utc)
+        for i in range(messages):
+            self.add_message(
+                f'{subjects[i % len(subjects)]} #{i}', sender=f'sender{i % 7}@example.com',
+                received=now - timedelta(hours=i),
+            )
+        for i in range(events):
+            start = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=3 + 7 * i)
+            self.add_event(f'Meeting #{i}', start, start + timedelta(minutes=30))
+
+    def _id(self, prefix):
+        with self._lock:
+            self._next_id += 1
+            return f'{prefix}{self._next_id}'
+
+    def add_message(self, subject, sender='alice@example.com', snippet='', labels=('INBOX',),
+                    thread_id=None, received=None):
+        message_id = self._id('m')
+        received = received or datetime.now(timezone.utc)
+        message = {
+            'id': message_id,
+            'threadId': thread_id or message_id,
+            'labelIds': list(labels),
+            'snippet': snippet or subject,
+            'internalDate': str(int(received.timestamp() * 1000)),
+            'payload': {'headers': [
+                {'name': 'Subject', 'value': subject},
+                {'name': 'From', 'value': sender},
+                {'name': 'Date', 'value': received.strftime('%a, %d %b %Y %H:%M:%S +0000')},
+            ]},
+        }
+        self.messages[message_id] = message
+        self._record_history('messagesAdded', message)
+        return message_id
+
+    def delete_message(self, message_id):
+        message = self.messages.pop(message_id)
+        self._record_history('messagesDeleted', message)
+
+    def modify_labels(self, message_id, add=(), remove=()):
+        message = self.messages[message_id]
+        message['labelIds'] = [label for label in message['labelIds'] if label not in remove]
+        message['labelIds'] += [label for label in add if label not in message['labelIds']]
+        if add:
+            self._record_history('labelsAdded', message, labelIds=list(add))
+        if remove:
+            self._record_history('labelsRemoved', message, labelIds=list(remove))
+
+    def expire_history(self):
+        """Forget all Gmail history so far, as Gmail does after about a week"""
+        self.history_floor = self.history_id
+
+    def _record_history(self, kind, message, **extra):
+        with self._lock:
+            self.history_id += 1
+            message['historyId'] = str(self.history_id)
+            summary = {key: message[key] for key in ('id', 'threadId', 'labelIds')}
+            self.history.append({'id': str(self.history_id), kind: [{'message': summary, **extra}]})
+
+    def add_event(self, summary, start, end, calendar_id='primary', status='confirmed'):
+        event_id = self._id('e')
+        self.events.setdefault(calendar_id, {})[event_id] = {
+            'id': event_id,
+            'summary': summary,
+            'status': status,
+            'start': {'dateTime': _rfc3339(start)},
+            'end': {'dateTime': _rfc3339(end)},
+        }
+        self._touch_event(event_id, calendar_id)
+        return event_id
+
+    def update_event(self, event_id, calendar_id='primary', start=None, end=None, **fields):
+        event = self.events[calendar_id][event_id]
+        event.update(fields)
+        if start:
+            event['start'] = {'dateTime': _rfc3339(start)}
+        if end:
+            event['end'] = {'dateTime': _rfc3339(end)}
+        self._touch_event(event_id, calendar_id)
+
+    def cancel_event(self, event_id, calendar_id='primary'):
+        self.update_event(event_id, calendar_id, status='cancelled')
+
+    def expire_sync_tokens(self):
+        """Invalidate every Calendar sync token handed out so far"""
+        self.sync_token_floor = self.calendar_seq + 1
+
+    def _touch_event(self, event_id, calendar_id):
+        with self._lock:
+            self.calendar_seq += 1
+            self.event_changes[event_id] = self.calendar_seq
+        self.events[calendar_id][event_id]['updated'] = _rfc3339(datetime.now(timezone.utc))
+
+    def add_task(self, title, tasklist='Tasks', status='needsAction', due=None):
+        list_id = next((key for key, value in self.tasklists.items() if value['title'] == tasklist), None)
+        if list_id is None:
+            list_id = self._id('l')
+            self.tasklists[list_id] = {'id': list_id, 'title': tasklist, 'updated': _rfc3339(datetime.now(timezone.utc))}
+        task_id = self._id('t')
+        task = {'id': task_id, 'title': title, 'status': status, 'updated': _rfc3339(datetime.now(timezone.utc))}
+        if due:
+            task['due'] = _rfc3339(due)
+        self.tasks.setdefault(list_id, {})[task_id] = task
+        return task_id
+
+    def tasklist_id(self, title):
+        return next(key for key, value in self.tasklists.items() if value['title'] == title)
+
+    def update_task(self, list_id, task_id, **fields):
+        task = self.tasks[list_id][task_id]
+        task.update(fields, updated=_rfc3339(datetime.now(timezone.utc)))
+        return task
+
+    def delete_task(self, list_id, task_id):
+        self.update_task(list_id, task_id, deleted=True)
+
+    def add_note(self, title, text=''):
+        name = f"notes/{self._id('n')}"
+        self.notes[name] = {
+            'name': name,
+            'title': title,
+            'body': {'text': {'text': text}},
+            'updateTime': _rfc3339(datetime.now(timezone.utc)),
+        }
+        return name
+
+    def add_contact(self, name, *emails):
+        resource_name = f"people/{self._id('c')}"
+        self.people[resource_name] = {'resourceName': resource_name}
+        self.update_contact(resource_name, name, emails)
+        return resource_name
+
+    def update_contact(self, resource_name, name=None, emails=None):
+        person = self.people[resource_name]
+        if name is not None:
+            person['names'] = [{'displayName': name}]
+        if emails is not None:
+            person['emailAddresses'] = [{'value': email} for email in emails]
+        self._touch_person(resource_name)
+
+    def delete_contact(self, resource_name):
+        self.people[resource_name] = {'resourceName': resource_name, 'metadata': {'deleted': True}}
+        self._touch_person(resource_name)
+
+    def expire_people_sync_tokens(self):
+        """Invalidate every People API sync token handed out so far"""
+        self.people_token_floor = self.people_seq + 1
+
+    def _touch_person(self, resource_name):
+        with self._lock:
+            self.people_seq += 1
+            self.people_changes[resource_name] = self.people_seq
+
+    # Transport
+
+    def transport(self):
+        """An httpx transport that serves requests from this fake"""
+        def handler(request):
+            status, headers, body = self.handle(
+                request.method, request.url.raw_path.decode(), request.headers, request.content
+            )
+            return httpx.Response(status, headers=headers, content=body)
+        return httpx.MockTransport(handler)
+
+    def handle(self, method, target, headers, body):
+        """Answer one HTTP request; returns ``(status, headers, body)``"""
+        url = urlsplit(target)
+        self.requests.append((method, url.path))
+        status, payload, extra_headers = self._dispatch(method, url.path, parse_qs(url.query), headers, body)
+        if isinstance(payload, bytes):
+            return status, extra_headers, payload
+        response_headers = {'Content-Type': 'application/json; charset=UTF-8', **extra_headers}
+        return status, response_headers, json.dumps(payload).encode() if payload is not None else b''
+
+    def _api(self, path):
+        if path in PUBLIC_PATHS or path.startswith('/oauth2/'):
+            return 'oauth2'
+        if path.startswith('/batch/'):
+            return path.split('/')[2]
+        if path.startswith('/gmail/'):
+            return 'gmail'
+        if path.startswith('/calendar/'):
+            return 'calendar'
+        if path.startswith('/tasks/'):
+            return 'tasks'
+        if path.startswith('/v1/notes'):
+            return 'keep'
+        return 'people'
+
+    def _dispatch(self, method, path, query, headers, body, in_batch=False):
+        api = self._api(path)
+        self.calls.append((api, method, path))
+        if not in_batch and self.latency.get(api):
+            time.sleep(self.latency[api])
+        if path not in PUBLIC_PATHS and not headers.get('authorization', '').startswith('Bearer '):
+            return 401, {'error': {'code': 401, 'message': 'Login Required'}}, {}
+        # Batches are throttled part by part, like Google does
+        result = None if path.startswith('/batch/') else self._throttle(api)
+        if result is None:
+            result = self._route(method, path, query, headers, body)
+        if not path.startswith('/batch/'):
+            self.statuses.append(result[0])
+        return result
+
+    # Rate limits
+
+    def set_quota(self, api, per_second, burst=None):
+        """Answer calls to ``api`` beyond ``per_second`` (bursts of ``burst``) with 429"""
+        self.quotas[api] = (burst or per_second, per_second)
+
+    def throttle(self, api, times=1, status=429, retry_after=None):
+        """Answer the next ``times`` calls to ``api`` as rate limited (429, or 403 rateLimitExceeded)"""
+        with self._lock:
+            self._injected.setdefault(api, []).extend([(status, retry_after)] * times)
+
+    def _rate_limited(self, status, retry_after):
+        reason = 'rateLimitExceeded'
+        body = {'error': {'code': status, 'message': 'Rate Limit Exceeded', 'errors': [{'reason': reason}]}}
+        return status, body, {'Retry-After': str(retry_after)} if retry_after is not None else {}
+
+    def _throttle(self, api):
+        with self._lock:
+            if self._injected.get(api):
+                return self._rate_limited(*self._injected[api].pop(0))
+            if api not in self.quotas:
+                return None
+            capacity, rate = self.quotas[api]
+            now = time.monotonic()
+            tokens, stamp = self._buckets.get(api, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                self._buckets[api] = (tokens - 1, now)
+                return None
+            self._buckets[api] = (tokens, now)
+            return self._rate_limited(429, math.ceil((1 - tokens) / rate))
+
+    def _route(self, method, path, query, headers, body):
+        for route_method, pattern, view in self._routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                return view(query, headers, body, *match.groups())
+        return 404, {'error': {'code': 404, 'message': f'Not found: {path}'}}, {}
+
+    def _batch(self, query, headers, body, api):
+        responses = []
+        for method, target in batch_http.decode_request(body, headers['content-type']):
+            url = urlsplit(target)
+            status, payload, _ = self._dispatch(
+                method, url.path, parse_qs(url.query), headers, b'', in_batch=True
+            )
+            responses.append((status, payload))
+        content, content_type = batch_http.encode_response(responses)
+        return 200, content, {'Content-Type': content_type}
+
+    def _with_etag(self, headers, payload):
+        etag = '"%s"' % hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        if headers.get('if-none-match') == etag:
+            return 304, None, {'ETag': etag}
+        return 200, payload, {'ETag': etag}
+
+    # OAuth
+    #
+    # Users are identified by the local part of their email address. An
+    # authorization code is "<identity>~<nonce>" and tokens are "access-<identity>"
+    # and "refresh-<identity>", so the token and userinfo endpoints need no state
+    # and also accept codes made up by a test.
+
+    def _authorize(self, query, headers, body):
+        email = query.get('login_hint', [''])[0]
+        identity = email.split('@')[0] if email else f'user-{secrets.token_hex(6)}'
+        code = f'{identity}~{secrets.token_urlsafe(8)}'
+        with self._lock:
+            self.codes[code] = query.get('scope', [''])[0]
+        params = {'code': code, 'scope': query.get('scope', [''])[0]}
+        if 'state' in query:
+            params['state'] = query['state'][0]
+        return 302, b'', {'Location': f"{query['redirect_uri'][0]}?{urlencode(params)}"}
+
+    def _token(self, query, headers, body):
+        form = dict(parse_qsl(body.decode()))
+        if form.get('grant_type') == 'refresh_token':
+            identity = form.get('refresh_token', '').removeprefix('refresh-')
+            scope = ''
+        else:
+            identity = form.get('code', '').split('~')[0]
+            with self._lock:
+                scope = self.codes.pop(form.get('code', ''), '')
+        if not identity:
+            return 400, {'error': 'invalid_grant'}, {}
+        return 200, {
+            'access_token': f'access-{identity}',
+            'refresh_token': f'refresh-{identity}',
+            'expires_in': 3600,
+            'scope': scope or 'openid',
+            'token_type': 'Bearer',
+        }, {}
+
+    def _userinfo(self, query, headers, body):
+        identity = headers['authorization'].removeprefix('Bearer ').removeprefix('access-')
+        return 200, {
+            'id': identity,
+            'email': f'{identity}@example.com',
+            'verified_email': True,
+            'name': identity,
+        }, {}
+
+    # Gmail
+
+    def _page(self, items, query, default_size):
+        offset = int(query.get('pageToken', ['0'])[0])
+        size = int((query.get('maxResults') or query.get('pageSize') or [default_size])[0])
+        page = {}
+        if offset + size < len(items):
+            page['nextPageToken'] = str(offset + size)
+        return items[offset:offset + size], page
+
+    def _gmail_profile(self, query, headers, body):
+        return 200, {
+            'emailAddress': 'me@example.com',
+            'messagesTotal': len(self.messages),
+            'historyId': str(self.history_id),
+        }, {}
+
+    def _gmail_history(self, query, headers, body):
+        start = int(query['startHistoryId'][0])
+        if start < self.history_floor:
+            return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}, {}
+        keys = {self.HISTORY_KEYS[kind] for kind in query.get('historyTypes', [])}
+        records = [
+            record for record in self.history
+            if int(record['id']) > start and (not keys or keys & record.keys())
+        ]
+        records, page = self._page(records, query, 100)
+        if records:
+            page['history'] = records
+        return 200, {**page, 'historyId': str(self.history_id)}, {}
+
+    def _gmail_list(self, query, headers, body):
+        messages = sorted(self.messages.values(), key=lambda m: int(m['internalDate']), reverse=True)
+        labels = query.get('labelIds', [])
+        if labels:
+            messages = [m for m in messages if set(labels) <= set(m['labelIds'])]
+        if 'q' in query:
+            needle = query['q'][0].lower()
+            messages = [m for m in messages if needle in json.dumps(m).lower()]
+        listed, page = self._page(messages, query, 100)
+        return 200, {
+            'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in listed],
+            'resultSizeEstimate': len(messages),
+            **page,
+        }, {}
+
+    def _gmail_get(self, query, headers, body, message_id):
+        message = self.messages.get(message_id)
+        if message is None:
+            return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}, {}
+        return 200, message, {}
+
+    # Calendar
+
+    def _calendar_list(self, query, headers, body, calendar_id):
+        events = list(self.events.get(calendar_id, {}).values())
+        if 'syncToken' in query:
+            since = int(query['syncToken'][0].split('-')[1])
+            if since < self.sync_token_floor:
+                return 410, {'error': {'code': 410, 'message': 'Sync token is no longer valid, a full sync is required.'}}, {}
+            events = [e for e in events if self.event_changes[e['id']] > since]
+            events.sort(key=lambda e: self.event_changes[e['id']])
+            return self._calendar_page(events, query)
+        if query.get('showDeleted', ['false'])[0] != 'true':
+            events = [e for e in events if e['status'] != 'cancelled']
+        if 'timeMin' in query:
+            time_min = _parse_time(query['timeMin'][0])
+            events = [e for e in events if _parse_time(e['end']['dateTime']) > time_min]
+        if 'timeMax' in query:
+            time_max = _parse_time(query['timeMax'][0])
+            events = [e for e in events if _parse_time(e['start']['dateTime']) < time_max]
+        events.sort(key=lambda e: e['start']['dateTime'])
+        return self._calendar_page(events, query)
+
+    def _calendar_page(self, events, query):
+        items, page = self._page(events, query, 250)
+        if 'nextPageToken' not in page and 'orderBy' not in query:
+            page['nextSyncToken'] = f'sync-{self.calendar_seq}'
+        return 200, {'items': items, **page}, {}
+
+    # Tasks
+
+    def _tasklists_list(self, query, headers, body):
+        return self._with_etag(headers, {'items': list(self.tasklists.values())})
+
+    def _tasks_list(self, query, headers, body, list_id):
+        if list_id not in self.tasklists:
+            return 404, {'error': {'code': 404, 'message': 'Task list not found'}}, {}
+        tasks = list(self.tasks.get(list_id, {}).values())
+        if query.get('showDeleted', ['false'])[0] != 'true':
+            tasks = [t for t in tasks if not t.get('deleted')]
+        if query.get('showCompleted', ['true'])[0] == 'false':
+            tasks = [t for t in tasks if t['status'] != 'completed']
+        if 'updatedMin' in query:
+            updated_min = _parse_time(query['updatedMin'][0])
+            tasks = [t for t in tasks if _parse_time(t['updated']) >= updated_min]
+        items, page = self._page(tasks, query, 100)
+        return 200, {'items': items, **page}, {}
+
+    def _tasks_insert(self, query, headers, body, list_id):
+        fields = json.loads(body)
+        task_id = self.add_task(fields['title'], tasklist=self.tasklists[list_id]['title'])
+        return 200, self.update_task(list_id, task_id, **fields), {}
+
+    def _tasks_patch(self, query, headers, body, list_id, task_id):
+        if task_id not in self.tasks.get(list_id, {}):
+            return 404, {'error': {'code': 404, 'message': 'Task not found'}}, {}
+        return 200, self.update_task(list_id, task_id, **json.loads(body)), {}
+
+    # Keep
+
+    def _notes_list(self, query, headers, body):
+        notes, page = self._page(list(self.notes.values()), query, 100)
+        return self._with_etag(headers, {'notes': notes, **page})
+
+    # People
+
+    def _connections_list(self, query, headers, body):
+        people = sorted(self.people.values(), key=lambda p: self.people_changes[p['resourceName']])
+        if 'syncToken' in query:
+            since = int(query['syncToken'][0].split('-')[1])
+            if since < self.people_token_floor:
+                return 410, {'error': {'code': 410, 'message': 'Sync token is expired. Clear local cache and retry call without the sync token.'}}, {}
+            people = [p for p in people if self.people_changes[p['resourceName']] > since]
+        else:
+            people = [p for p in people if not p.get('metadata', {}).get('deleted')]
+        items, page = self._page(people, query, 100)
+        result = {'connections': items, 'totalItems': len(people), **page}
+        if 'nextPageToken' not in page and query.get('requestSyncToken', ['false'])[0] == 'true':
+            result['nextSyncToken'] = f'people-{self.people_seq}'
+        return 200, result, {}
+
+
+class _Headers(dict):
+    """Request headers with lower-case names, as FakeGoogle expects"""
+
+    def __init__(self, message):
+        super().__init__((name.lower(), value) for name, value in message.items())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def _serve(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, content = self.fake.handle(self.command, self.path, _Headers(self.headers), body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeGoogleServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def settings(self):
+        """Settings pointing Lume at this server"""
+        return {
+            'GOOGLE_AUTH_URI': self.url + AUTH_PATH,
+            'GOOGLE_TOKEN_URI': self.url + TOKEN_PATH,
+            'GOOGLE_USERINFO_URI': self.url + USERINFO_PATH,
+            'GOOGLE_API_ENDPOINTS': {api: self.url for api in ENDPOINTS},
+        }
+
+
+def serve(fake, host='127.0.0.1', port=0):
+    """Serve ``fake`` over HTTP from a background thread; stop it with ``server.shutdown()``"""
+    handler = type('Handler', (_Handler,), {'fake': fake})
+    server = FakeGoogleServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='fake-google', daemon=True).start()
+    return server
@@ -0,0 +1,294 @@
+"""
+Local store of a user's primary calendar, kept fresh with Calendar sync tokens.
+
+A full sync lists events (recurring events expanded into instances) from
+``CALENDAR_SYNC_PAST_DAYS`` ago onwards, one page of ``CALENDAR_SYNC_PAGE_SIZE``
+events per transaction. The page token is saved after each page, so a resync
+that runs out of time or pages resumes where it stopped instead of starting
+over; rows written by the resync carry a new generation and the rows of older
+generations are dropped only once the last page is in. The ``nextSyncToken``
+of that last page drives incremental syncs from then on; when Google answers
+410 the token has expired and a full resync starts.
+
+Overlap queries ("what's on between X and Y") use the ``(user, start)`` index:
+an event can only overlap ``[X, Y)`` if it starts before Y and no earlier than
+X minus the longest stored event, so the scan is a bounded index range rather
+than everything that started before Y.
+
+As with the mailbox, ``fetch_*`` is network only and ``apply_*`` writes.
+Everything is gated on ``User.calendar_permission``.
+"""
+
+import logging
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import DurationField, ExpressionWrapper, F, Max
+from django.utils import timezone
+
+from lume_django.db import upsert_unique_fields
+from . import google_api
+from .google_api import GoogleAPIError, remaining
+from .models import CalendarEvent, CalendarState
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/calendar/v3/calendars/primary/events'
+
+
+class SyncTokenExpired(Exception):
+    """Raised when Google no longer accepts a sync token (410 Gone)."""
+
+
+class CalendarChanges:
+    """Changed events and where to continue from"""
+
+    def __init__(self, events, sync_token='', page_token=''):
+        self.events = events  # event resources; cancelled ones are deletions
+        self.sync_token = sync_token
+        self.page_token = page_token
+
+    def __bool__(self):
+        return bool(self.events)
+
+
+def _list(token, params, deadline):
+    try:
+        return google_api.get_json(token, 'calendar', EVENTS_PATH, params=params, timeout=remaining(deadline))
+    except GoogleAPIError as e:
+        if e.status == 410:
+            raise SyncTokenExpired() from e
+        raise
+
+
+def fetch_changes(token, sync_token, deadline=None):
+    """Fetch every event changed since ``sync_token``"""
+    params = {'syncToken': sync_token, 'singleEvents': 'true', 'maxResults': 250}
+    events = []
+    while True:
+        page = _list(token, params, deadline)
+        events += page.get('items', [])
+        if 'nextPageToken' not in page:
+            return CalendarChanges(events, sync_token=page.get('nextSyncToken', sync_token))
+        params['pageToken'] = page['nextPageToken']
+
+
+def fetch_resync_page(token, page_token='', deadline=None):
+    """Fetch one page of a full resync"""
+    past_days = getattr(settings, 'CALENDAR_SYNC_PAST_DAYS', 30)
+    # Whole days, so every page of a resync repeats the same query
+    time_min = (timezone.now() - timedelta(days=past_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    params = {
+        'singleEvents': 'true',
+        'showDeleted': 'false',
+        'timeMin': time_min.isoformat(),
+        'maxResults': getattr(settings, 'CALENDAR_SYNC_PAGE_SIZE', 250),
+    }
+    if page_token:
+        params['pageToken'] = page_token
+    page = _list(token, params, deadline)
+    return CalendarChanges(
+        page.get('items', []),
+        sync_token=page.get('nextSyncToken', ''),
+        page_token=page.get('nextPageToken', ''),
+    )
+
+
+def _time(value):
+    # Returns (aware datetime, all_day)
+    if 'dateTime' in value:
+        return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')), False
+    return datetime.combine(date.fromisoformat(value['date']), dt_time.min, tzinfo=dt_timezone.utc), True
+
+
+def _row(user, event, generation):
+    start, all_day = _time(event['start'])
+    end, _ = _time(event['end'])
+    return CalendarEvent(
+        user=user,
+        event_id=event['id'],
+        summary=event.get('summary', '')[:255],
+        start=start,
+        end=max(end, start),
+        all_day=all_day,
+        busy=event.get('transparency', 'opaque') != 'transparent',
+        generation=generation,
+    )
+
+
+def _store(user, state, events):
+    """Upsert live events and delete cancelled ones, tracking the longest duration"""
+    cancelled = [event['id'] for event in events if event.get('status') == 'cancelled']
+    if cancelled:
+        CalendarEvent.objects.filter(user=user, event_id__in=cancelled).delete()
+    rows = [_row(user, event, state.generation) for event in events if event.get('status') != 'cancelled']
+    if not rows:
+        return
+    CalendarEvent.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=upsert_unique_fields(CalendarEvent, ['user', 'event_id']),
+        update_fields=['summary', 'start', 'end', 'all_day', 'busy', 'generation'],
+    )
+    longest = max(int((row.end - row.start).total_seconds()) for row in rows)
+    state.max_event_seconds = max(state.max_event_seconds, longest)
+
+
+def apply_changes(user, changes):
+    """Write an incremental sync and store its next sync token"""
+    with transaction.atomic(using=router.db_for_write(CalendarEvent)):
+        state, _ = CalendarState.objects.select_for_update().get_or_create(user=user)
+        _store(user, state, changes.events)
+        state.sync_token = changes.sync_token
+        state.synced_at = timezone.now()
+        state.save()
+    return state
+
+
+def apply_resync_page(user, changes, start=False):
+    """
+    Write one page of a full resync.
+
+    ``start`` opens a new resync generation. After the last page, rows left
+    over from earlier generations are removed and the sync token is stored.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=router.db_for_write(CalendarEvent)):
+        state, _ = CalendarState.objects.select_for_update().get_or_create(user=user)
+        if start:
+            state.generation += 1
+            state.sync_token = ''
+        _store(user, state, changes.events)
+        state.page_token = changes.page_token
+        if not changes.page_token:
+            stale = CalendarEvent.objects.filter(user=user, generation__lt=state.generation)
+            stale.delete()
+            state.max_event_seconds = _longest_seconds(user)
+            state.sync_token = changes.sync_token
+            state.synced_at = state.resynced_at = now
+        state.save()
+    return state
+
+
+def _longest_seconds(user):
+    longest = CalendarEvent.objects.filter(user=user).aggregate(
+        longest=Max(ExpressionWrapper(F('end') - F('start'), output_field=DurationField()))
+    )['longest']
+    return int(longest.total_seconds()) if longest else 0
+
+
+def forget_calendar(user):
+    """Drop everything stored for the user, e.g. after Calendar access was revoked"""
+    CalendarEvent.objects.filter(user=user).delete()
+    CalendarState.objects.filter(user=user).delete()
+
+
+def synced_sync_token(user):
+    """The user's sync token, or None until a full sync has completed"""
+    return CalendarState.objects.filter(user=user).exclude(sync_token='').values_list('sync_token', flat=True).first()
+
+
+def expire_sync_token(user):
+    """Make the next sync a full resync"""
+    CalendarState.objects.filter(user=user).update(sync_token='', page_token='')
+
+
+def sync_calendar(user, deadline=None, max_pages=None):
+    """
+    Bring the user's store up to date.
+
+    Incremental when a sync token is stored; otherwise (re)starts or resumes a
+    full resync, fetching at most ``max_pages`` pages. Returns the
+    CalendarState, or None when the user has not granted Calendar access.
+    """
+    if not user.calendar_permission:
+        forget_calendar(user)
+        return None
+    token = google_api.access_token(user)
+    state, _ = CalendarState.objects.get_or_create(user=user)
+
+    if state.sync_token:
+        try:
+            changes = fetch_changes(token, state.sync_token, deadline=deadline)
+        except SyncTokenExpired:
+            logger.info("Calendar sync token of user %s expired, resyncing", user.pk)
+            expire_sync_token(user)
+            state.page_token = ''
+        else:
+            return apply_changes(user, changes)
+
+    pages = 0
+    page_token = state.page_token
+    while max_pages is None or pages < max_pages:
+        try:
+            changes = fetch_resync_page(token, page_token, deadline=deadline)
+        except SyncTokenExpired:
+            # The page token of an interrupted resync went stale; start over.
+            page_token = ''
+            changes = fetch_resync_page(token, deadline=deadline)
+        state = apply_resync_page(user, changes, start=not page_token)
+        pages += 1
+        page_token = changes.page_token
+        if not page_token:
+            break
+    return state
+
+
+# Reads
+
+def events_between(user, start, end):
+    """Stored events overlapping ``[start, end)``, in start order; empty without Calendar access"""
+    if not user.calendar_permission:
+        return CalendarEvent.objects.none()
+    longest = CalendarState.objects.filter(user=user).values_list('max_event_seconds', flat=True).first() or 0
+    return CalendarEvent.objects.filter(
+        user=user,
+        start__gte=start - timedelta(seconds=longest),
+        start__lt=end,
+        end__gt=start,
+    ).order_by('start')
+
+
+def serialize(event):
+    return {
+        'id': event.event_id,
+        'summary': event.summary,
+        'start': event.start.isoformat(),
+        'end': event.end.isoformat(),
+        'all_day': event.all_day,
+        'busy': event.busy,
+    }
+
+
+def upcoming_events(user, days=7, limit=10):
+    now = timezone.now()
+    return [serialize(event) for event in events_between(user, now, now + timedelta(days=days))[:limit]]
+
+
+def busy_intervals(user, start, end):
+    """Merged ``(start, end)`` intervals within ``[start, end)`` where the user is busy"""
+    merged = []
+    for event_start, event_end in events_between(user, start, end).filter(busy=True).values_list('start', 'end'):
+        event_start, event_end = max(event_start, start), min(event_end, end)
+        if merged and event_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], event_end))
+        else:
+            merged.append((event_start, event_end))
+    return merged
+
+
+def free_slots(user, start, end, min_duration=timedelta(minutes=30)):
+    """Gaps of at least ``min_duration`` between busy intervals in ``[start, end)``"""
+    slots = []
+    cursor = start
+    for busy_start, busy_end in busy_intervals(user, start, end) + [(end, end)]:
+        if busy_start - cursor >= min_duration:
+            slots.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    return slots
+
+
+def conflicts(user, start, end):
+    """Busy events that would clash with something scheduled for ``[start, end)``"""
+    return [serialize(event) for event in events_between(user, start, end).filter(busy=True)]
@@ -0,0 +1,273 @@
+"""
+Local Gmail metadata store, kept fresh with history-based sync.
+
+The first sync backfills the newest ``GMAIL_BACKFILL_MESSAGES`` messages
+(list, then metadata in batches of ``GMAIL_BATCH_SIZE``) and records the
+mailbox ``historyId`` taken *before* listing, so anything that arrives during
+the backfill is replayed later. Every later sync asks ``history.list`` for
+what changed since then: added messages are fetched, deleted ones dropped and
+label changes applied from the history records themselves. If Gmail no
+longer has history that old (404) the store is rebuilt from a new backfill.
+
+Fetching (``fetch_*``) is network only and may run in a worker thread;
+``apply_changes`` writes the result and belongs in a thread that owns a DB
+connection. Reads never touch the network. Everything is gated on
+``User.gmail_permission``.
+"""
+
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from lume_django.db import upsert_unique_fields
+from . import google_api
+from .google_api import GoogleAPIError, remaining
+from .models import MailboxState, MailMessage
+
+logger = logging.getLogger(__name__)
+
+METADATA_HEADERS = ('From', 'To', 'Subject')
+HISTORY_TYPES = ('messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved')
+
+
+class MailboxChanges:
+    """What a fetch found: messages to store, label updates, deletions and the new historyId"""
+
+    def __init__(self, history_id, reset=False):
+        self.history_id = history_id
+        self.reset = reset  # replace the whole store (backfill)
+        self.messages = []  # message metadata resources
+        self.labels = {}  # gmail id -> current label ids
+        self.deleted = set()
+
+    def __bool__(self):
+        return self.reset or bool(self.messages or self.labels or self.deleted)
+
+
+def _metadata_path(message_id):
+    headers = ''.join(f'&metadataHeaders={name}' for name in METADATA_HEADERS)
+    return f'/gmail/v1/users/me/messages/{message_id}?format=metadata{headers}'
+
+
+def _fetch_metadata(token, message_ids, changes, deadline):
+    size = getattr(settings, 'GMAIL_BATCH_SIZE', 50)
+    for start in range(0, len(message_ids), size):
+        chunk = message_ids[start:start + size]
+        parts = google_api.batch(
+            token, 'gmail', [('GET', _metadata_path(message_id)) for message_id in chunk],
+            timeout=remaining(deadline),
+        )
+        for message_id, (status, body) in zip(chunk, parts):
+            if status == 200:
+                changes.messages.append(body)
+            elif status == 404:
+                # Deleted since it was listed
+                changes.deleted.add(message_id)
+            else:
+                raise GoogleAPIError(status, body.get('error', {}).get('message', '') if body else '')
+
+
+def fetch_backfill(token, limit=None, deadline=None):
+    """Fetch metadata of the newest ``limit`` messages"""
+    if limit is None:
+        limit = getattr(settings, 'GMAIL_BACKFILL_MESSAGES', 200)
+    profile = google_api.get_json(token, 'gmail', '/gmail/v1/users/me/profile', timeout=remaining(deadline))
+    changes = MailboxChanges(int(profile['historyId']), reset=True)
+
+    message_ids = []
+    params = {'maxResults': min(limit, 500)}
+    while len(message_ids) < limit:
+        listing = google_api.get_json(
+            token, 'gmail', '/gmail/v1/users/me/messages', params=params, timeout=remaining(deadline),
+        )
+        message_ids += [item['id'] for item in listing.get('messages', [])]
+        if 'nextPageToken' not in listing:
+            break
+        params['pageToken'] = listing['nextPageToken']
+    _fetch_metadata(token, message_ids[:limit], changes, deadline)
+    return changes
+
+
+def fetch_history(token, start_history_id, deadline=None):
+    """
+    Fetch what changed since ``start_history_id``.
+
+    Falls back to a backfill when Gmail has expired that history.
+    """
+    params = {'startHistoryId': start_history_id, 'historyTypes': list(HISTORY_TYPES), 'maxResults': 500}
+    added = {}
+    changes = None
+    while True:
+        try:
+            page = google_api.get_json(
+                token, 'gmail', '/gmail/v1/users/me/history', params=params, timeout=remaining(deadline),
+            )
+        except GoogleAPIError as e:
+            if e.status != 404:
+                raise
+            logger.info("Gmail history %s expired, backfilling", start_history_id)
+            return fetch_backfill(token, deadline=deadline)
+        if changes is None:
+            changes = MailboxChanges(int(page['historyId']))
+
+        for record in page.get('history', []):
+            for item in record.get('messagesAdded', []):
+                message_id = item['message']['id']
+                added[message_id] = True
+                changes.deleted.discard(message_id)
+            for item in record.get('messagesDeleted', []):
+                message_id = item['message']['id']
+                added.pop(message_id, None)
+                changes.labels.pop(message_id, None)
+                changes.deleted.add(message_id)
+            for item in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                message = item['message']
+                if message['id'] not in changes.deleted:
+                    changes.labels[message['id']] = message.get('labelIds', [])
+
+        if 'nextPageToken' not in page:
+            break
+        params['pageToken'] = page['nextPageToken']
+
+    # Added messages are fetched whole, which already includes their labels.
+    for message_id in added:
+        changes.labels.pop(message_id, None)
+    _fetch_metadata(token, list(added), changes, deadline)
+    return changes
+
+
+def header(message, name):
+    """Value of a header in a Gmail message resource, or '' if absent"""
+    for item in message.get('payload', {}).get('headers', []):
+        if item['name'].lower() == name.lower():
+            return item['value']
+    return ''
+
+
+def _row(user, message):
+    labels = message.get('labelIds', [])
+    return MailMessage(
+        user=user,
+        gmail_id=message['id'],
+        thread_id=message['threadId'],
+        sender=header(message, 'From')[:255],
+        recipients=header(message, 'To')[:512],
+        subject=header(message, 'Subject')[:255],
+        snippet=message.get('snippet', '')[:512],
+        label_ids=labels,
+        is_unread='UNREAD' in labels,
+        in_inbox='INBOX' in labels,
+        received_at=datetime.fromtimestamp(int(message['internalDate']) / 1000, tz=dt_timezone.utc),
+    )
+
+
+def apply_changes(user, changes):
+    """Write fetched changes to the user's store and advance its historyId"""
+    now = timezone.now()
+    with transaction.atomic(using=router.db_for_write(MailMessage)):
+        state, _ = MailboxState.objects.select_for_update().get_or_create(user=user)
+        if not changes.reset and state.history_id is not None and changes.history_id < state.history_id:
+            # A concurrent sync got further already
+            return state
+
+        messages = MailMessage.objects.filter(user=user)
+        if changes.reset:
+            messages.delete()
+        elif changes.deleted:
+            messages.filter(gmail_id__in=changes.deleted).delete()
+
+        if changes.messages:
+            MailMessage.objects.bulk_create(
+                [_row(user, message) for message in changes.messages],
+                update_conflicts=True,
+                unique_fields=upsert_unique_fields(MailMessage, ['user', 'gmail_id']),
+                update_fields=['thread_id', 'sender', 'recipients', 'subject', 'snippet',
+                               'label_ids', 'is_unread', 'in_inbox', 'received_at'],
+            )
+        for gmail_id, labels in changes.labels.items():
+            messages.filter(gmail_id=gmail_id).update(
+                label_ids=labels, is_unread='UNREAD' in labels, in_inbox='INBOX' in labels,
+            )
+
+        state.history_id = changes.history_id
+        state.synced_at = now
+        if changes.reset:
+            state.backfilled_at = now
+        state.save()
+    return state
+
+
+def forget_mailbox(user):
+    """Drop everything stored for the user, e.g. after Gmail access was revoked"""
+    MailMessage.objects.filter(user=user).delete()
+    MailboxState.objects.filter(user=user).delete()
+
+
+def synced_history_id(user):
+    """The historyId the user's store is synced to, or None before the first backfill"""
+    return MailboxState.objects.filter(user=user).values_list('history_id', flat=True).first()
+
+
+def sync_mailbox(user, deadline=None):
+    """
+    Bring the user's store up to date: a backfill the first time, a history delta after that.
+
+    Returns the MailboxState, or None when the user has not granted Gmail access.
+    """
+    if not user.gmail_permission:
+        forget_mailbox(user)
+        return None
+    token = google_api.access_token(user)
+    history_id = synced_history_id(user)
+    if history_id is None:
+        changes = fetch_backfill(token, deadline=deadline)
+    else:
+        changes = fetch_history(token, history_id, deadline=deadline)
+    return apply_changes(user, changes)
+
+
+# Reads
+
+def mailbox(user):
+    """The user's stored messages, newest first; empty without Gmail access"""
+    if not user.gmail_permission:
+        return MailMessage.objects.none()
+    return MailMessage.objects.filter(user=user).order_by('-received_at')
+
+
+def serialize(message):
+    return {
+        'id': message.gmail_id,
+        'thread_id': message.thread_id,
+        'from': message.sender,
+        'subject': message.subject,
+        'snippet': message.snippet,
+        'labels': message.label_ids,
+        'unread': message.is_unread,
+        'received_at': message.received_at.isoformat(),
+    }
+
+
+def recent_messages(user, limit=20, inbox_only=True, unread_only=False):
+    messages = mailbox(user)
+    if inbox_only:
+        messages = messages.filter(in_inbox=True)
+    if unread_only:
+        messages = messages.filter(is_unread=True)
+    return [serialize(m) for m in messages[:limit]]
+
+
+def thread_messages(user, thread_id):
+    return [serialize(m) for m in mailbox(user).filter(thread_id=thread_id).order_by('received_at')]
+
+
+def search_messages(user, text, limit=20):
+    """Messages whose sender, subject or snippet contains ``text``"""
+    messages = mailbox(user).filter(
+        Q(sender__icontains=text) | Q(subject__icontains=text) | Q(snippet__icontains=text)
+    )
+    return [serialize(m) for m in messages[:limit]]
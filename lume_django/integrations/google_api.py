@@ -0,0 +1,264 @@
+"""
+Synchronous access to the Google REST APIs on behalf of a user.
+
+All calls share one pooled ``httpx.Client`` per process, so concurrent jobs
+reuse keep-alive connections. API base URLs come from ``GOOGLE_API_ENDPOINTS``
+so tests and load tests can point them at a fake. Every call is paced against
+the client-side quota and retried with backoff when throttled (see
+integrations/quota.py).
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+from lume_django import metrics as prometheus
+from . import batch as batch_http, quota
+
+DEFAULT_ENDPOINTS = {
+    'gmail': 'https://gmail.googleapis.com',
+    'calendar': 'https://www.googleapis.com',
+    'tasks': 'https://tasks.googleapis.com',
+    'keep': 'https://keep.googleapis.com',
+    'people': 'https://people.googleapis.com',
+    'oauth2': 'https://www.googleapis.com',
+}
+
+# Batch endpoints, relative to the API's base URL. Keep has none.
+BATCH_PATHS = {
+    'gmail': '/batch/gmail/v1',
+    'calendar': '/batch/calendar/v3',
+    'tasks': '/batch/tasks/v1',
+}
+
+# Refresh access tokens this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(seconds=60)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class GoogleAPIError(Exception):
+    """Raised for error responses from a Google API."""
+
+    def __init__(self, status, message='', retry_after=None, reason=''):
+        super().__init__(f"{status}: {message}" if message else str(status))
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason  # e.g. rateLimitExceeded
+
+
+class NotConnected(GoogleAPIError):
+    """Raised when the user has no usable Google credentials."""
+
+    def __init__(self, message='Google account not connected'):
+        super().__init__(401, message)
+
+
+class QuotaExhausted(GoogleAPIError):
+    """Raised instead of calling Google when the client-side quota would not allow the call in time."""
+
+    def __init__(self, api, scope, wait):
+        super().__init__(429, f'{api} {scope} quota exhausted', retry_after=wait, reason='rateLimitExceeded')
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call is about to start after its deadline has passed."""
+
+
+def remaining(deadline):
+    """Seconds left until a ``time.monotonic()`` deadline, for use as a timeout; None means no deadline"""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left
+
+
+def endpoint(api):
+    return getattr(settings, 'GOOGLE_API_ENDPOINTS', {}).get(api, DEFAULT_ENDPOINTS[api])
+
+
+def http_client():
+    """The process-wide pooled HTTP client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    timeout=getattr(settings, 'GOOGLE_HTTP_TIMEOUT', 10),
+                    limits=httpx.Limits(
+                        max_connections=getattr(settings, 'GOOGLE_HTTP_MAX_CONNECTIONS', 100),
+                        max_keepalive_connections=20,
+                    ),
+                )
+    return _client
+
+
+def access_token(user):
+    """
+    Return a valid access token for ``user``, refreshing it if it is about to expire.
+
+    Call this from the request thread before fanning out; it may write to the DB.
+    """
+    if not user.access_token:
+        raise NotConnected()
+    expires_at = user.token_expires_at
+    if expires_at is not None and timezone.is_naive(expires_at):
+        # google-auth reports expiry as naive UTC
+        expires_at = timezone.make_aware(expires_at, timezone.utc)
+    if expires_at is None or expires_at - TOKEN_REFRESH_MARGIN > timezone.now():
+        return user.access_token
+    if not user.refresh_token:
+        raise NotConnected('Google access token expired')
+
+    response = http_client().post(
+        getattr(settings, 'GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
+        data={
+            'grant_type': 'refresh_token',
+            'refresh_token': user.refresh_token,
+            'client_id': getattr(settings, 'GOOGLE_CLIENT_ID', ''),
+            'client_secret': getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
+        },
+    )
+    if response.status_code != 200:
+        raise NotConnected(f'Token refresh failed ({response.status_code})')
+    payload = response.json()
+    user.access_token = payload['access_token']
+    user.token_expires_at = timezone.now() + timedelta(seconds=payload.get('expires_in', 3600))
+    user.save(update_fields=['access_token', 'token_expires_at', 'updated_at'])
+    return user.access_token
+
+
+def _reason(body):
+    # Google puts the machine-readable cause in error.errors[].reason (v1 style) or error.status
+    error = (body or {}).get('error', {})
+    if not isinstance(error, dict):
+        return ''
+    errors = error.get('errors') or [{}]
+    return errors[0].get('reason') or error.get('status', '')
+
+
+def _error(response):
+    try:
+        body = response.json()
+        message = body.get('error', {}).get('message', '')
+    except (ValueError, AttributeError):
+        body, message = None, ''
+    try:
+        retry_after = float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        retry_after = None
+    return GoogleAPIError(response.status_code, message, retry_after, _reason(body))
+
+
+def _wait_to_retry(api, attempt, error, deadline):
+    """
+    Sleep before a retry; returns False when the retry would not fit before the
+    deadline or, for calls without one, when it would wait longer than
+    ``GOOGLE_API_BACKOFF_MAX`` (a long ``Retry-After`` would block the request).
+    """
+    if attempt >= getattr(settings, 'GOOGLE_API_MAX_RETRIES', 3):
+        return False
+    delay = quota.backoff(attempt, error.retry_after)
+    if deadline is None:
+        if delay > getattr(settings, 'GOOGLE_API_BACKOFF_MAX', 8):
+            return False
+    elif time.monotonic() + delay >= deadline:
+        return False
+    quota.record(api, retries=1)
+    time.sleep(delay)
+    return True
+
+
+def call(token, api, method, path, params=None, json=None, content=None, headers=None, timeout=None, cost=1):
+    """
+    Make one API call and return the ``httpx.Response``.
+
+    Raises GoogleAPIError for error statuses; 304 is returned as-is. Throttled
+    calls are retried within ``timeout``, which covers every attempt.
+    ``cost`` is the number of quota tokens the call uses (one per batch part).
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    request_headers = {'Authorization': f'Bearer {token}'}
+    if headers:
+        request_headers.update(headers)
+    attempt = 0
+    while True:
+        quota.acquire(api, token, deadline, cost)
+        started = time.monotonic()
+        response = http_client().request(
+            method, endpoint(api) + path, params=params, json=json, content=content, headers=request_headers,
+            timeout=remaining(deadline) if deadline is not None else httpx.USE_CLIENT_DEFAULT,
+        )
+        elapsed = time.monotonic() - started
+        quota.record(api, calls=1, seconds=elapsed)
+        prometheus.observe('lume_google_api_request_duration_seconds', elapsed, api=api, status=response.status_code)
+        if response.status_code < 400:
+            return response
+        error = _error(response)
+        throttled = quota.is_throttled(error.status, error.reason)
+        quota.record(api, errors=1, throttled=int(throttled))
+        if not quota.is_retryable(error.status, error.reason, method) or not _wait_to_retry(
+            api, attempt, error, deadline,
+        ):
+            raise error
+        attempt += 1
+
+
+def get_json(token, api, path, params=None, timeout=None):
+    """GET ``path`` and return the decoded JSON body"""
+    return call(token, api, 'GET', path, params=params, timeout=timeout).json()
+
+
+def batch(token, api, requests, timeout=None):
+    """
+    Send several calls to one API in a single batch HTTP request.
+
+    ``requests`` is a list of ``(method, path)`` pairs, paths including their
+    query string. Returns a list of ``(status, body)`` in the same order.
+    APIs without a batch endpoint get their calls made one by one.
+    """
+    if not requests:
+        return []
+    if api not in BATCH_PATHS or len(requests) == 1:
+        results = []
+        for method, path in requests:
+            try:
+                results.append((200, call(token, api, method, path, timeout=timeout).json()))
+            except GoogleAPIError as e:
+                results.append((e.status, {'error': {'message': str(e)}}))
+        return results
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    results = [None] * len(requests)
+    pending = list(range(len(requests)))
+    attempt = 0
+    while True:
+        body, content_type = batch_http.encode_request([requests[i] for i in pending])
+        response = call(
+            token, api, 'POST', BATCH_PATHS[api], content=body, headers={'Content-Type': content_type},
+            timeout=remaining(deadline) if deadline is not None else None, cost=len(pending),
+        )
+        parts = batch_http.decode_response(response.content, response.headers['Content-Type'])
+        missing = [position for position in range(len(pending)) if position not in parts]
+        if missing:
+            raise GoogleAPIError(502, f'{api} batch response is missing {len(missing)} of {len(pending)} parts')
+        throttled = []
+        for position, i in enumerate(pending):
+            part = parts[position]
+            results[i] = (part.status, part.json())
+            if quota.is_throttled(part.status, _reason(results[i][1])):
+                throttled.append(i)
+        if throttled:
+            quota.record(api, throttled=len(throttled))
+        # Parts are throttled one by one; resend only those
+        if not throttled or not _wait_to_retry(api, attempt, GoogleAPIError(429), deadline):
+            return results
+        pending = throttled
+        attempt += 1
@@ -0,0 +1,235 @@
+"""
+Google Tasks through the read-through cache (see integrations/readthrough.py).
+
+The task lists are one cached collection, revalidated with If-None-Match.
+Each list's tasks are another, revalidated with ``updatedMin`` (deleted and
+hidden tasks included, so completions and deletions arrive as changes) and
+merged by task id; all lists that need it go out in one batch request.
+Tasks we create or complete ourselves, from a chat turn (``parse_write``,
+``write``) or through ``create_task``/``complete_task``, are written through
+to the cache. Everything is gated on ``User.tasks_permission``.
+"""
+
+import re
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.utils import timezone
+
+from . import google_api, readthrough
+from .google_api import GoogleAPIError, NotConnected, remaining
+
+PREFIX = 'tasks:'
+LISTS_KEY = 'tasks:lists'
+
+# updatedMin overlaps the previous sync by this much, so clock skew can't drop changes
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def list_key(tasklist_id):
+    return f'tasks:list:{tasklist_id}'
+
+
+def _task(task):
+    return {
+        'id': task['id'],
+        'title': task.get('title', ''),
+        'status': task.get('status', 'needsAction'),
+        'due': task.get('due'),
+    }
+
+
+def _tasks_path(tasklist_id, updated_min=None):
+    params = {'showCompleted': 'true', 'showHidden': 'true', 'maxResults': 100}
+    if updated_min is not None:
+        params['showDeleted'] = 'true'
+        params['updatedMin'] = (updated_min - SYNC_OVERLAP).isoformat()
+    return f'/tasks/v1/lists/{tasklist_id}/tasks?{urlencode(params)}'
+
+
+def revalidate(token, cached, deadline=None):
+    """
+    Bring cached task lists and tasks up to date; network only.
+
+    ``cached`` comes from ``readthrough.load(user, PREFIX)``. Returns a
+    Revalidation; when everything is fresh no call is made.
+    """
+    now = timezone.now()
+    result = readthrough.Revalidation(cached)
+    lists_row = cached.get(LISTS_KEY)
+    if readthrough.is_fresh(lists_row, now) and all(
+        readthrough.is_fresh(cached.get(list_key(tasklist['id'])), now) for tasklist in lists_row.payload['items']
+    ):
+        return result
+
+    headers = {'If-None-Match': lists_row.etag} if lists_row and lists_row.etag else None
+    response = google_api.call(
+        token, 'tasks', 'GET', '/tasks/v1/users/@me/lists', headers=headers, timeout=remaining(deadline),
+    )
+    if response.status_code == 304:
+        result.confirmed.append(LISTS_KEY)
+    else:
+        tasklists = [{'id': item['id'], 'title': item.get('title', '')} for item in response.json().get('items', [])]
+        result.entries[LISTS_KEY] = ({'items': tasklists}, response.headers.get('ETag'), now)
+
+    tasklists = result.payload(LISTS_KEY)['items']
+    live = {list_key(tasklist['id']) for tasklist in tasklists}
+    result.removed = [key for key in cached if key != LISTS_KEY and key not in live]
+
+    stale = [
+        (tasklist['id'], cached.get(list_key(tasklist['id'])))
+        for tasklist in tasklists if not readthrough.is_fresh(cached.get(list_key(tasklist['id'])), now)
+    ]
+    parts = google_api.batch(token, 'tasks', [
+        ('GET', _tasks_path(tasklist_id, row.synced_at if row else None)) for tasklist_id, row in stale
+    ], timeout=remaining(deadline))
+    for (tasklist_id, row), (status, body) in zip(stale, parts):
+        if status != 200:
+            raise GoogleAPIError(status, (body or {}).get('error', {}).get('message', ''))
+        changed = body.get('items', [])
+        page_token = body.get('nextPageToken')
+        while page_token:
+            page = google_api.get_json(
+                token, 'tasks', _tasks_path(tasklist_id, row.synced_at if row else None),
+                params={'pageToken': page_token}, timeout=remaining(deadline),
+            )
+            changed += page.get('items', [])
+            page_token = page.get('nextPageToken')
+
+        items = dict(row.payload['items']) if row else {}
+        for task in changed:
+            if task.get('deleted'):
+                items.pop(task['id'], None)
+            else:
+                items[task['id']] = _task(task)
+        result.entries[list_key(tasklist_id)] = ({'items': items}, '', now)
+    return result
+
+
+def open_tasks(result):
+    """Open tasks of every list in a Revalidation, soonest due first"""
+    tasks = [
+        {'id': task['id'], 'title': task['title'], 'list': tasklist['title'], 'due': task['due']}
+        for tasklist in result.payload(LISTS_KEY)['items']
+        for task in result.payload(list_key(tasklist['id']))['items'].values()
+        if task['status'] != 'completed'
+    ]
+    tasks.sort(key=lambda task: (task['due'] is None, task['due'] or '', task['title']))
+    return tasks
+
+
+def get_open_tasks(user, deadline=None):
+    """Read-through: the user's open tasks, revalidated as needed"""
+    if not user.tasks_permission:
+        readthrough.forget(user, PREFIX)
+        return []
+    cached = readthrough.load(user, PREFIX)
+    result = revalidate(google_api.access_token(user), cached, deadline=deadline)
+    readthrough.save(user, result)
+    return open_tasks(result)
+
+
+# Write-through
+
+def _token(user):
+    if not user.tasks_permission:
+        raise NotConnected('Google Tasks access not granted')
+    return google_api.access_token(user)
+
+
+def _store_task(user, tasklist_id, task):
+    def change(payload):
+        payload['items'][task['id']] = task
+    readthrough.update(user, list_key(tasklist_id), change)
+
+
+def _insert_task(token, tasklist_id, title, due=None, deadline=None):
+    body = {'title': title}
+    if due is not None:
+        body['due'] = due.isoformat()
+    return _task(google_api.call(
+        token, 'tasks', 'POST', f'/tasks/v1/lists/{tasklist_id}/tasks', json=body, timeout=remaining(deadline),
+    ).json())
+
+
+def _complete_task(token, tasklist_id, task_id, deadline=None):
+    return _task(google_api.call(
+        token, 'tasks', 'PATCH', f'/tasks/v1/lists/{tasklist_id}/tasks/{task_id}',
+        json={'status': 'completed'}, timeout=remaining(deadline),
+    ).json())
+
+
+def create_task(user, tasklist_id, title, due=None):
+    task = _insert_task(_token(user), tasklist_id, title, due)
+    _store_task(user, tasklist_id, task)
+    return task
+
+
+def complete_task(user, tasklist_id, task_id):
+    task = _complete_task(_token(user), tasklist_id, task_id)
+    _store_task(user, tasklist_id, task)
+    return task
+
+
+# Chat turns: "add a task to ...", "remind me to ...", "mark ... as done"
+
+_CREATE_RE = re.compile(
+    r'\b(?:(?:add|create|make)\s+(?:a\s+)?(?:new\s+)?(?:task|to-?do)(?:\s+(?:to|for|called|named))?|remind me to)'
+    r'[\s:]+(?P<title>.+)',
+    re.IGNORECASE,
+)
+_COMPLETE_RE = re.compile(
+    r'^(?:(?:please|can you|could you)\s+)?(?:mark|complete|finish|check off|tick off)\s+'
+    r'(?:the\s+)?(?:task\s+)?(?P<title>.+?)'
+    r'(?:\s+(?:as\s+)?(?:done|complete|completed|finished))?$',
+    re.IGNORECASE,
+)
+# A title ends at the end of its clause: "add a task to X, then email Y"
+_CLAUSE_END_RE = re.compile(r'[,.;!?]|\s+(?:and\s+)?then\s+', re.IGNORECASE)
+
+
+def _title(text):
+    return _CLAUSE_END_RE.split(text, 1)[0].strip(' \'"')
+
+
+def parse_write(message):
+    """
+    The task change a chat message asks for: ``('create', title)``,
+    ``('complete', title)`` or None.
+    """
+    match = _CREATE_RE.search(message)
+    if match and _title(match.group('title')):
+        return 'create', _title(match.group('title'))
+    for clause in _CLAUSE_END_RE.split(message):
+        match = _COMPLETE_RE.search(clause.strip())
+        if match and _title(match.group('title')):
+            return 'complete', _title(match.group('title'))
+    return None
+
+
+def write(token, result, change, deadline=None):
+    """
+    Make a ``parse_write`` change against the lists in a Revalidation; network only.
+
+    New tasks go to the first (default) list; completions need an open task of
+    that title. Returns ``(tasklist_id, task)`` for ``store_write``, or None
+    when there is nothing to change.
+    """
+    verb, title = change
+    tasklists = result.payload(LISTS_KEY)['items']
+    if verb == 'create':
+        if not tasklists:
+            return None
+        return tasklists[0]['id'], _insert_task(token, tasklists[0]['id'], title, deadline=deadline)
+    for tasklist in tasklists:
+        for task in result.payload(list_key(tasklist['id']))['items'].values():
+            if task['status'] != 'completed' and task['title'].casefold() == title.casefold():
+                return tasklist['id'], _complete_task(token, tasklist['id'], task['id'], deadline=deadline)
+    return None
+
+
+def store_write(user, result, written):
+    """Write a task returned by ``write`` through to the cache and into ``result``; after ``readthrough.save``"""
+    tasklist_id, task = written
+    result.payload(list_key(tasklist_id))['items'][task['id']] = task
+    _store_task(user, tasklist_id, task)
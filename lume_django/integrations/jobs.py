@@ -0,0 +1,74 @@
+"""
+Background jobs of the integrations app (see jobs/queue.py).
+"""
+
+import logging
+
+from django.conf import settings
+
+from jobs.queue import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, job
+from oauth.models import User
+from . import contacts, gcalendar, gmail, gtasks, keep, warmup
+
+logger = logging.getLogger(__name__)
+
+# How each service's local store is brought up to date off the request
+REFRESHERS = {
+    'email': gmail.sync_mailbox,
+    'calendar': gcalendar.sync_calendar,
+    'tasks': gtasks.get_open_tasks,
+    'keep': keep.get_notes,
+}
+
+
+def _user(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.access_token:
+        return None
+    return user
+
+
+@job('integrations.sync_contacts', priority=PRIORITY_LOW, timeout=120)
+def sync_contacts(user_id):
+    """Pull the user's contacts, e.g. after login"""
+    user = _user(user_id)
+    if user is not None:
+        contacts.sync_contacts(user)
+
+
+@job('integrations.refresh_service', timeout=120)
+def refresh_service(user_id, service):
+    """Finish syncing a service's store, e.g. after a chat turn ran out of time for it"""
+    user = _user(user_id)
+    if user is not None and user.has_service_permission(service):
+        REFRESHERS[service](user)
+
+
+def refresh_after_turn(user, actions):
+    """Queue a refresh for each action of a chat turn that timed out, so the next turn is served warm"""
+    for service, result in actions.items():
+        if result['status'] == 'timeout' and service in REFRESHERS:
+            refresh_service.enqueue(user.pk, service, dedup_key=f'refresh:{service}:{user.pk}')
+
+
+@job('integrations.warm_up', timeout=60, max_attempts=1)
+def warm_up(user_id, services):
+    """Prefetch what the user's next turn will need (see integrations/warmup.py)"""
+    user = _user(user_id)
+    if user is not None:
+        warmup.warm_up(user, services)
+
+
+def warm_up_later(user, services, granted=False):
+    """
+    Queue a warmup of ``services``: after a login, or ahead of the queue when
+    they were just ``granted`` and the user is about to use them.
+    """
+    services = sorted(service for service in services if user.has_service_permission(service))
+    if not services or not getattr(settings, 'WARMUP_ENABLED', True):
+        return
+    warm_up.enqueue(
+        user.pk, services,
+        dedup_key=f"warmup:{user.pk}:{','.join(services)}",
+        priority=PRIORITY_HIGH if granted else PRIORITY_NORMAL,
+    )
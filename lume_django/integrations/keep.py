@@ -0,0 +1,71 @@
+"""
+Google Keep notes through the read-through cache (see integrations/readthrough.py).
+
+The notes list is one cached collection, fetched page by page and revalidated
+with If-None-Match while it fits on one page. Keep is read-only: the app is
+granted ``keep.readonly``. Everything is gated on ``User.keep_permission``.
+"""
+
+from django.utils import timezone
+
+from . import google_api, readthrough
+from .google_api import remaining
+
+PREFIX = 'keep:'
+NOTES_KEY = 'keep:notes'
+PAGE_SIZE = 100
+
+
+def _note(note):
+    return {'name': note['name'], 'title': note.get('title', ''), 'updated': note.get('updateTime')}
+
+
+def revalidate(token, cached, deadline=None):
+    """Bring the cached notes up to date; network only"""
+    now = timezone.now()
+    result = readthrough.Revalidation(cached)
+    row = cached.get(NOTES_KEY)
+    if readthrough.is_fresh(row, now):
+        return result
+
+    # The ETag only covers the first page, so it can only confirm a one-page list.
+    headers = None
+    if row and row.etag and row.payload.get('pages', 1) == 1:
+        headers = {'If-None-Match': row.etag}
+    params = {'pageSize': PAGE_SIZE}
+    response = google_api.call(
+        token, 'keep', 'GET', '/v1/notes', params=params, headers=headers, timeout=remaining(deadline),
+    )
+    if response.status_code == 304:
+        result.confirmed.append(NOTES_KEY)
+        return result
+
+    etag, notes, pages = response.headers.get('ETag'), [], 0
+    while True:
+        body = response.json()
+        notes.extend(_note(note) for note in body.get('notes', []) if not note.get('trashed'))
+        pages += 1
+        if not body.get('nextPageToken'):
+            break
+        response = google_api.call(
+            token, 'keep', 'GET', '/v1/notes', params={**params, 'pageToken': body['nextPageToken']},
+            timeout=remaining(deadline),
+        )
+    result.entries[NOTES_KEY] = ({'items': notes, 'pages': pages}, etag, now)
+    return result
+
+
+def notes(result):
+    return result.payload(NOTES_KEY)['items']
+
+
+def get_notes(user, deadline=None):
+    """Read-through: the user's notes, revalidated as needed"""
+    if not user.keep_permission:
+        readthrough.forget(user, PREFIX)
+        return []
+    cached = readthrough.load(user, PREFIX)
+    result = revalidate(google_api.access_token(user), cached, deadline=deadline)
+    readthrough.save(user, result)
+    return notes(result)
+
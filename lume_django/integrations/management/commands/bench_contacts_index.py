@@ -0,0 +1,36 @@
+import random
+import string
+import time
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from integrations.contacts import ContactIndex
+
+FIRST = ['Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy', 'José', 'Mallory']
+LAST = ['Smith', 'Jones', 'Garcia', 'Miller', 'Davis', 'Martínez', 'Lopez', 'Wilson', 'Anderson', 'Taylor']
+
+
+class Command(BaseCommand):
+    help = "Measure building and querying the in-memory contacts index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contacts', type=int, default=5000)
+        parser.add_argument('--number', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        contacts = []
+        for i in range(options['contacts']):
+            first, last = rng.choice(FIRST), rng.choice(LAST)
+            suffix = ''.join(rng.choices(string.ascii_lowercase, k=3))
+            contacts.append((f'{first} {last} {suffix}', [f'{first.lower()}.{last.lower()}{i}@example.com']))
+
+        started = time.perf_counter()
+        index = ContactIndex(contacts)
+        self.stdout.write(f"Built index of {len(index)} contacts in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        number = options['number']
+        for query in ('al', 'alice sm', 'garcia', 'bob.jones1', 'jonse'):
+            best = min(timeit.repeat(lambda: index.search(query), number=number, repeat=3))
+            self.stdout.write(f"{query!r}: {best / number * 1e6:.1f} us per lookup")
@@ -0,0 +1,33 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from integrations.fake_google import ENDPOINTS, FakeGoogle, serve
+
+
+class Command(BaseCommand):
+    help = "Serve a fake Google (OAuth, userinfo, Gmail, Calendar, Tasks, Keep, People) for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=int, default=50, help="Latency per call")
+        parser.add_argument('--messages', type=int, default=50, help="Messages in the shared mailbox")
+        parser.add_argument('--events', type=int, default=20, help="Events in the shared calendar")
+
+    def handle(self, *args, **options):
+        fake = FakeGoogle(latency=dict.fromkeys(ENDPOINTS, options['latency_ms'] / 1000))
+        fake.seed(options['messages'], options['events'])
+        server = serve(fake, options['host'], options['port'])
+        settings = server.settings()
+        self.stdout.write("Fake Google at %s; start the deployment under test with:" % server.url)
+        for name in ('GOOGLE_AUTH_URI', 'GOOGLE_TOKEN_URI', 'GOOGLE_USERINFO_URI'):
+            self.stdout.write(f"  {name}={settings[name]}")
+        self.stdout.write(f"  GOOGLE_API_BASE_URL={server.url}")
+        self.stdout.write("  OAUTHLIB_INSECURE_TRANSPORT=1 OAUTHLIB_RELAX_TOKEN_SCOPE=1")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from integrations.gcalendar import sync_calendar
+from integrations.google_api import GoogleAPIError
+from oauth.models import User
+
+
+class Command(BaseCommand):
+    help = "Sync the local Calendar event store of users who granted Calendar access"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only sync the user with this email")
+        parser.add_argument('--max-pages', type=int, default=None,
+                            help="Pages of a full resync to fetch per user per run")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(calendar_permission=True).exclude(access_token__isnull=True).exclude(access_token='')
+        if options['user']:
+            users = users.filter(email=options['user'])
+
+        synced = pending = failed = 0
+        for user in users.iterator():
+            try:
+                state = sync_calendar(user, max_pages=options['max_pages'])
+            except GoogleAPIError as e:
+                failed += 1
+                self.stderr.write(f"{user.email}: {e}")
+                continue
+            if state.sync_token:
+                synced += 1
+            else:
+                pending += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {synced} calendars, {pending} resyncs still in progress ({failed} failed)"
+        ))
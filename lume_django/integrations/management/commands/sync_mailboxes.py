@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from integrations.gmail import sync_mailbox
+from integrations.google_api import GoogleAPIError
+from oauth.models import User
+
+
+class Command(BaseCommand):
+    help = "Sync the local Gmail metadata store of users who granted Gmail access"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only sync the user with this email")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(gmail_permission=True).exclude(access_token__isnull=True).exclude(access_token='')
+        if options['user']:
+            users = users.filter(email=options['user'])
+
+        synced = failed = 0
+        for user in users.iterator():
+            try:
+                sync_mailbox(user)
+            except GoogleAPIError as e:
+                failed += 1
+                self.stderr.write(f"{user.email}: {e}")
+                continue
+            synced += 1
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} mailboxes ({failed} failed)"))
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("oauth", "0008_rate_limit_bucket"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailboxState",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="mailbox",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("history_id", models.BigIntegerField(blank=True, null=True)),
+                ("backfilled_at", models.DateTimeField(blank=True, null=True)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="MailMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gmail_id", models.CharField(max_length=64)),
+                ("thread_id", models.CharField(max_length=64)),
+                ("sender", models.CharField(blank=True, max_length=255)),
+                ("recipients", models.CharField(blank=True, max_length=512)),
+                ("subject", models.CharField(blank=True, max_length=255)),
+                ("snippet", models.CharField(blank=True, max_length=512)),
+                ("label_ids", models.JSONField(default=list)),
+                ("is_unread", models.BooleanField(default=False)),
+                ("in_inbox", models.BooleanField(default=False)),
+                ("received_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-received_at"],
+                        name="integration_user_id_880f14_idx",
+                    ),
+                    models.Index(
+                        fields=["user", "thread_id"],
+                        name="integration_user_id_185d49_idx",
+                    ),
+                ],
+                "unique_together": {("user", "gmail_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth", "0008_rate_limit_bucket"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("integrations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CalendarState",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="calendar_state",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("sync_token", models.CharField(blank=True, max_length=512)),
+                ("page_token", models.CharField(blank=True, max_length=512)),
+                ("generation", models.PositiveIntegerField(default=0)),
+                ("max_event_seconds", models.PositiveIntegerField(default=0)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+                ("resynced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CalendarEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_id", models.CharField(max_length=255)),
+                ("summary", models.CharField(blank=True, max_length=255)),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                ("all_day", models.BooleanField(default=False)),
+                ("busy", models.BooleanField(default=True)),
+                ("generation", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "start"], name="integration_user_id_c145f6_idx"
+                    )
+                ],
+                "unique_together": {("user", "event_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth", "0008_rate_limit_bucket"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("integrations", "0002_calendar"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContactsState",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="contacts_state",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("sync_token", models.CharField(blank=True, max_length=512)),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Contact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resource_name", models.CharField(max_length=64)),
+                ("name", models.CharField(blank=True, max_length=255)),
+                ("emails", models.JSONField(default=list)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "resource_name")},
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("integrations", "0003_contacts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedResource",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=191)),
+                ("etag", models.CharField(blank=True, max_length=255)),
+                ("payload", models.JSONField(default=dict)),
+                ("size", models.PositiveIntegerField(default=0)),
+                ("synced_at", models.DateTimeField()),
+                ("last_used_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "last_used_at"],
+                        name="integration_user_id_b8bd49_idx",
+                    )
+                ],
+                "unique_together": {("user", "key")},
+            },
+        ),
+    ]
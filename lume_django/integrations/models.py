@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db import models
+
+
+class MailboxState(models.Model):
+    """
+    Sync position of a user's local Gmail metadata store (see integrations/gmail.py).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='mailbox')
+    history_id = models.BigIntegerField(null=True, blank=True)  # Gmail historyId the store is synced to
+    backfilled_at = models.DateTimeField(null=True, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Mailbox of {self.user_id} @ {self.history_id}"
+
+
+class MailMessage(models.Model):
+    """
+    Metadata of one Gmail message: headers, snippet and labels, no bodies.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    gmail_id = models.CharField(max_length=64)
+    thread_id = models.CharField(max_length=64)
+    sender = models.CharField(max_length=255, blank=True)
+    recipients = models.CharField(max_length=512, blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    snippet = models.CharField(max_length=512, blank=True)
+    label_ids = models.JSONField(default=list)
+    is_unread = models.BooleanField(default=False)
+    in_inbox = models.BooleanField(default=False)
+    received_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'gmail_id']
+        indexes = [
+            models.Index(fields=['user', '-received_at']),
+            models.Index(fields=['user', 'thread_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.sender}: {self.subject}"
+
+
+class CalendarState(models.Model):
+    """
+    Sync position of a user's local primary-calendar store (see integrations/gcalendar.py).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='calendar_state')
+    sync_token = models.CharField(max_length=512, blank=True)  # empty until a full sync completes
+    page_token = models.CharField(max_length=512, blank=True)  # next page of a full resync in progress
+    generation = models.PositiveIntegerField(default=0)  # bumped by every full resync
+    max_event_seconds = models.PositiveIntegerField(default=0)  # longest stored event, bounds overlap scans
+    synced_at = models.DateTimeField(null=True, blank=True)
+    resynced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Calendar of {self.user_id}"
+
+
+class CalendarEvent(models.Model):
+    """
+    One event (or recurring instance) of a user's primary calendar.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    event_id = models.CharField(max_length=255)
+    summary = models.CharField(max_length=255, blank=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    all_day = models.BooleanField(default=False)
+    busy = models.BooleanField(default=True)  # False for events marked "free" (transparent)
+    generation = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'event_id']
+        indexes = [
+            models.Index(fields=['user', 'start']),
+        ]
+
+    def __str__(self):
+        return f"{self.summary} ({self.start:%Y-%m-%d %H:%M})"
+
+
+class ContactsState(models.Model):
+    """
+    Sync position of a user's local contacts (see integrations/contacts.py).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='contacts_state')
+    sync_token = models.CharField(max_length=512, blank=True)
+    version = models.PositiveIntegerField(default=0)  # bumped on every change, invalidates in-memory indexes
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Contacts of {self.user_id} v{self.version}"
+
+
+class Contact(models.Model):
+    """
+    One People API connection: display name and email addresses.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    resource_name = models.CharField(max_length=64)  # people/c123...
+    name = models.CharField(max_length=255, blank=True)
+    emails = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ['user', 'resource_name']
+
+    def __str__(self):
+        return self.name or self.resource_name
+
+
+class CachedResource(models.Model):
+    """
+    A cached Google API collection (a task list's tasks, Keep notes...), see integrations/readthrough.py.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=191)  # e.g. "tasks:lists", "tasks:list:<id>", "keep:notes"
+    etag = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField(default=dict)
+    size = models.PositiveIntegerField(default=0)  # bytes of the serialized payload
+    synced_at = models.DateTimeField()  # when the payload was last confirmed with Google
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'key']
+        indexes = [
+            models.Index(fields=['user', 'last_used_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} of {self.user_id}"
@@ -0,0 +1,114 @@
+"""
+Client-side quota for Google API calls, applied by ``google_api.call``.
+
+Google enforces per-user and per-project request quotas and answers calls
+over them with 429, or 403 ``rateLimitExceeded``. Retrying those blindly turns
+one burst into a retry storm, so calls are paced ahead of the limit instead:
+
+- Pacing: before each call a token is taken from the API's buckets in
+  ``GOOGLE_API_QUOTAS`` (``user``: per access token, ``project``: shared by
+  all users), a batch taking one per part. When a bucket is empty the call
+  waits for it, as long as its deadline (or ``GOOGLE_API_MAX_PACING_WAIT``)
+  allows; otherwise QuotaExhausted is raised without calling Google. Buckets
+  live in the rate limiter's store (``RATE_LIMIT_STORE``), so project buckets
+  are shared across processes with Redis and per process otherwise.
+- Backoff: throttled calls, and failed idempotent ones with a 5xx, are retried
+  up to ``GOOGLE_API_MAX_RETRIES`` times after a jittered exponential delay,
+  or after ``Retry-After`` when Google sends a longer one.
+
+Per-API counters of calls, throttling, retries and pacing are kept per process
+(``metrics()``) and exported to /metrics (see lume_django/metrics.py).
+"""
+
+import hashlib
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from lume_django import metrics as prometheus
+from lume_django.ratelimit import get_store, parse_rate
+
+# 403 reasons that mean "slow down" rather than "forbidden"
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+
+# Safe to retry after a server error
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE'}
+
+_metrics = defaultdict(Counter)
+_metrics_lock = threading.Lock()
+
+
+def record(api, **counts):
+    with _metrics_lock:
+        _metrics[api].update(counts)
+    for name, value in counts.items():
+        prometheus.inc(f'lume_google_api_{name}_total', value, api=api)
+
+
+def metrics():
+    """Per-API counters since the process started (or ``reset_metrics``)"""
+    with _metrics_lock:
+        return {api: dict(counts) for api, counts in _metrics.items()}
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def is_throttled(status, reason=''):
+    return status == 429 or (status == 403 and reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable(status, reason, method):
+    return is_throttled(status, reason) or (status >= 500 and method in IDEMPOTENT_METHODS)
+
+
+def backoff(attempt, retry_after=None):
+    """Delay before retry number ``attempt + 1``: jittered exponential, at least ``Retry-After``"""
+    base = getattr(settings, 'GOOGLE_API_BACKOFF', 0.5)
+    cap = getattr(settings, 'GOOGLE_API_BACKOFF_MAX', 8)
+    delay = min(cap, base * 2 ** attempt) * random.uniform(0.5, 1)
+    return max(delay, retry_after or 0)
+
+
+def _user_key(token):
+    # Calls carry a token rather than a user; it stands in for the user until it is refreshed.
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def acquire(api, token, deadline=None, cost=1):
+    """
+    Take ``cost`` tokens from the API's user and project buckets, waiting for them if need be.
+
+    Raises QuotaExhausted (from google_api) when the wait would outlast the deadline.
+    """
+    from .google_api import QuotaExhausted
+
+    if not getattr(settings, 'GOOGLE_API_QUOTA_ENABLED', True):
+        return
+    limits = getattr(settings, 'GOOGLE_API_QUOTAS', {}).get(api)
+    if not limits:
+        return
+    store = get_store()
+    # User buckets first: they run out far more often, and a token taken from
+    # the shared project bucket while waiting on them would be wasted.
+    for scope in sorted(limits, key=lambda scope: scope != 'user'):
+        key = f"gq:{api}:user:{_user_key(token)}" if scope == 'user' else f"gq:{api}:{scope}"
+        capacity, refill = parse_rate(limits[scope])
+        while True:
+            allowed, wait = store.take(key, capacity, refill, cost)
+            if allowed:
+                break
+            if deadline is not None:
+                max_wait = deadline - time.monotonic()
+            else:
+                max_wait = getattr(settings, 'GOOGLE_API_MAX_PACING_WAIT', 2)
+            if wait > max_wait:
+                record(api, rejected=1)
+                raise QuotaExhausted(api, scope, wait)
+            record(api, paced=1, paced_seconds=wait)
+            time.sleep(wait)
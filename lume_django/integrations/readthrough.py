@@ -0,0 +1,144 @@
+"""
+Per-user read-through cache of Google API collections (Tasks, Keep).
+
+Each collection is one ``CachedResource`` row holding the payload, the ETag it
+came with and when it was last confirmed with Google. Callers revalidate in
+three steps, cheapest first:
+
+- confirmed less than ``READTHROUGH_FRESH_SECONDS`` ago: served as is, no call;
+- otherwise revalidated with ``If-None-Match`` (a 304 costs no body) or with an
+  ``updatedMin`` delta that is merged into the payload;
+- missing or evicted: fetched in full.
+
+Rows count against a per-user budget of ``READTHROUGH_MAX_ENTRIES`` rows and
+``READTHROUGH_MAX_BYTES`` payload bytes; when a write goes over it, the least
+recently used rows are evicted, never the ones just written. Writes we make
+ourselves update the cached payload directly (``update``) instead of
+invalidating it.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from lume_django.responses import dumps
+from .models import CachedResource
+
+logger = logging.getLogger(__name__)
+
+
+class Revalidation:
+    """The outcome of revalidating cached rows; produced off-thread, saved with ``save``"""
+
+    def __init__(self, cached):
+        self.cached = cached  # key -> CachedResource as loaded
+        self.entries = {}  # key -> (payload, etag, synced_at) fetched anew
+        self.confirmed = []  # keys Google confirmed unchanged
+        self.removed = []  # keys that no longer exist
+
+    def payload(self, key):
+        if key in self.entries:
+            return self.entries[key][0]
+        return self.cached[key].payload
+
+
+def load(user, prefix):
+    """The user's cached rows whose key starts with ``prefix``, by key"""
+    return {row.key: row for row in CachedResource.objects.filter(user=user, key__startswith=prefix)}
+
+
+def _fresh_for():
+    return timedelta(seconds=getattr(settings, 'READTHROUGH_FRESH_SECONDS', 60))
+
+
+def is_fresh(row, now=None):
+    """Whether a cached row may be served without asking Google"""
+    return row is not None and (now or timezone.now()) - row.synced_at < _fresh_for()
+
+
+def save(user, revalidation):
+    """Write a Revalidation in one transaction and mark the rows it served as used"""
+    now = timezone.now()
+    entries, confirmed = revalidation.entries, revalidation.confirmed
+    # Rows served unchanged are touched at most once per freshness window.
+    served = [
+        key for key, row in revalidation.cached.items()
+        if key not in entries and key not in confirmed and key not in revalidation.removed
+        and now - row.last_used_at >= _fresh_for()
+    ]
+    with transaction.atomic():
+        if revalidation.removed:
+            CachedResource.objects.filter(user=user, key__in=revalidation.removed).delete()
+        if confirmed:
+            CachedResource.objects.filter(user=user, key__in=confirmed).update(synced_at=now, last_used_at=now)
+        if served:
+            CachedResource.objects.filter(user=user, key__in=served).update(last_used_at=now)
+        for key, (payload, etag, synced_at) in entries.items():
+            CachedResource.objects.update_or_create(user=user, key=key, defaults={
+                'payload': payload,
+                'etag': etag or '',
+                'size': len(dumps(payload)),
+                'synced_at': synced_at,
+                'last_used_at': now,
+            })
+        if entries:
+            evict(user, keep=entries)
+
+
+def update(user, key, change):
+    """
+    Write-through: apply ``change(payload)`` to a cached payload in place.
+
+    Does nothing when the collection is not cached; it will be fetched in full
+    on the next read anyway.
+    """
+    with transaction.atomic():
+        row = CachedResource.objects.select_for_update().filter(user=user, key=key).first()
+        if row is None:
+            return
+        change(row.payload)
+        row.size = len(dumps(row.payload))
+        row.last_used_at = timezone.now()
+        row.save(update_fields=['payload', 'size', 'last_used_at'])
+    evict(user, keep=[key])
+
+
+def evict(user, keep=()):
+    """
+    Drop least recently used rows until the user is within budget; returns how many.
+
+    Rows under the ``keep`` keys, just written by the caller, are never evicted:
+    dropping them would refetch the collection in full on every read.
+    """
+    max_entries = getattr(settings, 'READTHROUGH_MAX_ENTRIES', 50)
+    max_bytes = getattr(settings, 'READTHROUGH_MAX_BYTES', 512 * 1024)
+    rows = CachedResource.objects.filter(user=user)
+    totals = rows.aggregate(count=Count('pk'), total=Sum('size'))
+    count, total = totals['count'], totals['total'] or 0
+    if count <= max_entries and total <= max_bytes:
+        return 0
+
+    evicted = []
+    candidates = rows.exclude(key__in=list(keep)).order_by('last_used_at', 'pk').values_list('pk', 'size')
+    for pk, size in candidates:
+        if count <= max_entries and total <= max_bytes:
+            break
+        evicted.append(pk)
+        count -= 1
+        total -= size
+    CachedResource.objects.filter(pk__in=evicted).delete()
+    if count > max_entries or total > max_bytes:
+        logger.warning(
+            "Read-through cache for user %s is over budget with %d rows, %d bytes; "
+            "raise READTHROUGH_MAX_ENTRIES or READTHROUGH_MAX_BYTES", user.pk, count, total,
+        )
+    return len(evicted)
+
+
+def forget(user, prefix):
+    """Drop the user's cached rows under ``prefix``, e.g. after access was revoked"""
+    CachedResource.objects.filter(user=user, key__startswith=prefix).delete()
@@ -0,0 +1,798 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import httpx
+from django.db import DatabaseError
+from django.test import override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from lume_django.ratelimit import get_store
+from lume_django.testing import LumeTestCase
+from oauth.models import User
+from . import batch, contacts, fake_google, gcalendar, gmail, google_api, gtasks, keep, quota, readthrough, warmup
+from .actions import describe, run_actions
+from .jobs import refresh_after_turn, warm_up_later
+from .fake_google import FakeGoogle
+from .models import (
+    CachedResource, CalendarEvent, CalendarState, Contact, MailboxState, MailMessage,
+)
+
+
+class GoogleTestCase(LumeTestCase):
+    """Runs Google calls against a FakeGoogle"""
+
+    latency = None
+
+    def setUp(self):
+        self.google = FakeGoogle(latency=self.latency)
+        patcher = mock.patch(
+            'integrations.google_api.http_client',
+            return_value=httpx.Client(transport=self.google.transport()),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings = override_settings(GOOGLE_API_ENDPOINTS=fake_google.ENDPOINTS)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def make_user(self, username='gina', **permissions):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            access_token='token', token_expires_at=timezone.now() + timedelta(hours=1),
+            granted_scopes=json.dumps([contacts.CONTACTS_SCOPE]),
+            **permissions
+        )
+
+
+class BatchEncodingTests(LumeTestCase):
+    def test_round_trip(self):
+        requests = [('GET', '/gmail/v1/users/me/messages/1?format=metadata'), ('GET', '/gmail/v1/users/me/messages/2')]
+        body, content_type = batch.encode_request(requests)
+        self.assertEqual(batch.decode_request(body, content_type), requests)
+
+        body, content_type = batch.encode_response([(200, {'id': '1'}), (404, {'error': {'code': 404}})])
+        parts = batch.decode_response(body, content_type)
+        self.assertEqual([parts[i].status for i in range(2)], [200, 404])
+        self.assertEqual(parts[0].json(), {'id': '1'})
+
+    def test_responses_matched_by_content_id(self):
+        body = (
+            b'--b\r\nContent-Type: application/http\r\nContent-ID: <response-item1>\r\n\r\n'
+            b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{"n": 1}\r\n'
+            b'--b\r\nContent-Type: application/http\r\nContent-ID: <response-item0>\r\n\r\n'
+            b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{"n": 0}\r\n--b--'
+        )
+        parts = batch.decode_response(body, 'multipart/mixed; boundary=b')
+        self.assertEqual({i: part.json()['n'] for i, part in parts.items()}, {0: 0, 1: 1})
+
+
+class ActionExecutorTests(GoogleTestCase):
+    everything = {'email': True, 'calendar': True, 'tasks': True, 'keep': True}
+
+    def setUp(self):
+        super().setUp()
+        now = datetime.now(dt_timezone.utc)
+        for i in range(3):
+            self.google.add_message(f'Report {i}', sender='john@example.com', received=now - timedelta(hours=i))
+        self.google.add_event('Standup', now + timedelta(hours=1), now + timedelta(hours=2))
+        self.google.add_task('Write docs', tasklist='Work')
+        self.google.add_task('Buy milk', tasklist='Home')
+        self.google.add_note('Ideas')
+        self.user = self.make_user(
+            gmail_permission=True, calendar_permission=True, tasks_permission=True, keep_permission=True
+        )
+
+    def test_runs_every_granted_service(self):
+        results = run_actions(self.user, self.everything, 'what is on my plate')
+        self.assertEqual({service: result['status'] for service, result in results.items()},
+                         {'email': 'ok', 'calendar': 'ok', 'tasks': 'ok', 'keep': 'ok'})
+        self.assertEqual(results['email']['data']['messages'][0]['subject'], 'Report 0')
+        self.assertEqual(results['calendar']['data']['events'][0]['summary'], 'Standup')
+        self.assertEqual(sorted(t['title'] for t in results['tasks']['data']['tasks']), ['Buy milk', 'Write docs'])
+        self.assertEqual(results['keep']['data']['notes'][0]['title'], 'Ideas')
+
+    def test_several_calls_to_one_service_are_batched(self):
+        run_actions(self.user, {'email': True, 'tasks': True})
+        # One list plus one batch per service instead of one request per message or list.
+        self.assertEqual(sorted(self.google.requests), [
+            ('GET', '/gmail/v1/users/me/messages'),
+            ('GET', '/tasks/v1/users/@me/lists'),
+            ('POST', '/batch/gmail/v1'),
+            ('POST', '/batch/tasks/v1'),
+        ])
+        self.assertEqual(sum(1 for api, method, _ in self.google.calls if api == 'gmail' and method == 'GET'), 4)
+
+    def test_skips_services_without_permission(self):
+        self.user.keep_permission = False
+        self.assertNotIn('keep', run_actions(self.user, self.everything))
+
+    def test_malformed_payload_fails_only_that_service(self):
+        for message in self.google.messages.values():
+            del message['threadId']
+        with self.assertLogs('integrations.actions', 'ERROR'):
+            results = run_actions(self.user, {'email': True, 'calendar': True})
+        self.assertEqual(results['email'], {'status': 'error', 'error': 'unexpected error', 'elapsed_ms': mock.ANY})
+        self.assertEqual(results['calendar']['status'], 'ok')
+
+    def test_store_error_fails_only_that_service(self):
+        with mock.patch('integrations.gtasks.open_tasks', side_effect=DatabaseError('locked')), \
+                self.assertLogs('integrations.actions', 'ERROR'):
+            results = run_actions(self.user, {'tasks': True, 'keep': True})
+        self.assertEqual(results['tasks']['status'], 'error')
+        self.assertEqual(results['keep']['status'], 'ok')
+
+    def test_users_without_credentials_get_no_actions(self):
+        user = User.objects.create_user(username='hank', email='hank@example.com', gmail_permission=True)
+        self.assertEqual(run_actions(user, {'email': True}), {})
+
+
+class ActionDeadlineTests(GoogleTestCase):
+    latency = {'gmail': 0.2, 'calendar': 0.2, 'tasks': 0.2}
+
+    def setUp(self):
+        super().setUp()
+        self.google.add_message('Hello')
+        self.google.add_task('Write docs')
+        self.user = self.make_user(gmail_permission=True, calendar_permission=True, tasks_permission=True)
+
+    def test_services_run_concurrently(self):
+        started = time.monotonic()
+        results = run_actions(self.user, {'email': True, 'calendar': True, 'tasks': True}, timeout=5)
+        elapsed = time.monotonic() - started
+        self.assertTrue(all(result['status'] == 'ok' for result in results.values()))
+        # Run one after another this would take 5 round trips (1 s).
+        self.assertLess(elapsed, 0.8)
+
+    def test_slow_service_returns_partial_results(self):
+        self.google.latency['calendar'] = 2
+        started = time.monotonic()
+        results = run_actions(self.user, {'email': True, 'calendar': True}, timeout=0.6)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(results['email']['status'], 'ok')
+        self.assertEqual(results['calendar']['status'], 'timeout')
+
+    @override_settings(JOBS_EAGER=False)
+    def test_timed_out_service_is_refreshed_later(self):
+        actions = {'email': {'status': 'ok'}, 'calendar': {'status': 'timeout'}}
+        refresh_after_turn(self.user, actions)
+        refresh_after_turn(self.user, actions)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args), ('integrations.refresh_service', [self.user.pk, 'calendar']))
+
+
+class SendMessageActionsTests(GoogleTestCase):
+    def test_reply_is_built_from_action_results(self):
+        self.google.add_event('Dentist', datetime.now(dt_timezone.utc) + timedelta(days=1),
+                              datetime.now(dt_timezone.utc) + timedelta(days=1, hours=1))
+        user = self.make_user(calendar_permission=True)
+        self.client.force_login(user)
+
+        response = self.client.post(
+            '/api/chat/send/', json.dumps({'message': 'Check my calendar'}), content_type='application/json'
+        )
+        data = response.json()
+        self.assertEqual(data['actions']['calendar']['status'], 'ok')
+        self.assertIn('"Dentist"', data['assistant_message']['content'])
+
+
+class MailboxSyncTests(GoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        now = datetime.now(dt_timezone.utc)
+        self.ids = [
+            self.google.add_message(f'Report {i}', sender='john@example.com', received=now - timedelta(hours=i),
+                                    labels=('INBOX', 'UNREAD'), thread_id='t1' if i < 2 else None)
+            for i in range(5)
+        ]
+        self.user = self.make_user(gmail_permission=True)
+
+    def subjects(self):
+        return [m['subject'] for m in gmail.recent_messages(self.user)]
+
+    @override_settings(GMAIL_BACKFILL_MESSAGES=3)
+    def test_backfill_is_bounded(self):
+        state = gmail.sync_mailbox(self.user)
+        self.assertEqual(self.subjects(), ['Report 0', 'Report 1', 'Report 2'])
+        self.assertEqual(state.history_id, self.google.history_id)
+        self.assertIsNotNone(state.backfilled_at)
+        # Profile, one listing and one metadata batch
+        self.assertEqual(len(self.google.requests), 3)
+
+    def test_sync_applies_history_deltas(self):
+        gmail.sync_mailbox(self.user)
+        self.google.requests.clear()
+
+        new_id = self.google.add_message('Lunch?', sender='amy@example.com')
+        self.google.modify_labels(self.ids[0], remove=['UNREAD'])
+        self.google.modify_labels(self.ids[1], remove=['INBOX'])
+        self.google.delete_message(self.ids[2])
+        gmail.sync_mailbox(self.user)
+
+        self.assertEqual(self.subjects(), ['Lunch?', 'Report 0', 'Report 3', 'Report 4'])
+        self.assertFalse(MailMessage.objects.get(gmail_id=self.ids[0]).is_unread)
+        self.assertTrue(MailMessage.objects.filter(gmail_id=self.ids[1], in_inbox=False).exists())
+        # The history page, then only the new message is fetched.
+        self.assertEqual(self.google.requests, [('GET', '/gmail/v1/users/me/history'),
+                                                ('GET', f'/gmail/v1/users/me/messages/{new_id}')])
+        self.assertEqual(MailboxState.objects.get(user=self.user).history_id, self.google.history_id)
+
+    def test_expired_history_triggers_backfill(self):
+        gmail.sync_mailbox(self.user)
+        self.google.delete_message(self.ids[0])
+        self.google.expire_history()
+        gmail.sync_mailbox(self.user)
+        self.assertNotIn('Report 0', self.subjects())
+        self.assertIn(('GET', '/gmail/v1/users/me/profile'), self.google.requests[-3:])
+
+    def test_local_reads(self):
+        gmail.sync_mailbox(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual([m['subject'] for m in gmail.thread_messages(self.user, 't1')], ['Report 1', 'Report 0'])
+        self.assertEqual(len(gmail.search_messages(self.user, 'john@')), 5)
+        self.assertEqual(gmail.search_messages(self.user, 'nothing'), [])
+
+    def test_gated_on_gmail_permission(self):
+        gmail.sync_mailbox(self.user)
+        self.user.gmail_permission = False
+        self.assertEqual(self.subjects(), [])
+        self.assertIsNone(gmail.sync_mailbox(self.user))
+        self.assertFalse(MailMessage.objects.filter(user=self.user).exists())
+
+    def test_email_action_reads_from_synced_mailbox(self):
+        gmail.sync_mailbox(self.user)
+        self.google.add_message('Lunch?', sender='amy@example.com')
+        self.google.requests.clear()
+
+        results = run_actions(self.user, {'email': True})
+        self.assertEqual(results['email']['data']['messages'][0]['subject'], 'Lunch?')
+        self.assertNotIn(('GET', '/gmail/v1/users/me/messages'), self.google.requests)
+
+
+class CalendarSyncTests(GoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.day = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.user = self.make_user(calendar_permission=True)
+
+    def at(self, hour, minute=0):
+        return self.day + timedelta(hours=hour, minutes=minute)
+
+    def summaries(self):
+        return list(CalendarEvent.objects.filter(user=self.user).order_by('start').values_list('summary', flat=True))
+
+    @override_settings(CALENDAR_SYNC_PAGE_SIZE=2)
+    def test_full_sync_runs_in_bounded_batches(self):
+        for hour in range(9, 14):
+            self.google.add_event(f'Meeting {hour}', self.at(hour), self.at(hour, 30))
+
+        state = gcalendar.sync_calendar(self.user, max_pages=2)
+        self.assertEqual(state.sync_token, '')
+        self.assertEqual(len(self.summaries()), 4)
+
+        state = gcalendar.sync_calendar(self.user, max_pages=2)
+        self.assertTrue(state.sync_token)
+        self.assertEqual(len(self.summaries()), 5)
+        self.assertEqual(len(self.google.requests), 3)
+
+    def test_incremental_sync(self):
+        standup = self.google.add_event('Standup', self.at(9), self.at(9, 15))
+        review = self.google.add_event('Review', self.at(14), self.at(15))
+        gcalendar.sync_calendar(self.user)
+        self.google.requests.clear()
+
+        self.google.add_event('Lunch', self.at(12), self.at(13))
+        self.google.update_event(standup, summary='Daily standup')
+        self.google.cancel_event(review)
+        gcalendar.sync_calendar(self.user)
+
+        self.assertEqual(self.summaries(), ['Daily standup', 'Lunch'])
+        self.assertEqual(self.google.requests, [('GET', '/calendar/v3/calendars/primary/events')])
+
+    def test_expired_sync_token_resyncs(self):
+        gone = self.google.add_event('Gone', self.at(9), self.at(10))
+        self.google.add_event('Kept', self.at(11), self.at(12))
+        gcalendar.sync_calendar(self.user)
+        del self.google.events['primary'][gone]
+        self.google.expire_sync_tokens()
+
+        state = gcalendar.sync_calendar(self.user)
+        self.assertEqual(self.summaries(), ['Kept'])
+        self.assertEqual(state.generation, 2)
+        self.assertTrue(state.sync_token)
+
+    def test_free_busy_and_conflicts(self):
+        self.google.add_event('A', self.at(9), self.at(10))
+        self.google.add_event('B', self.at(9, 30), self.at(11))
+        self.google.add_event('C', self.at(13), self.at(14))
+        free = self.google.add_event('Focus', self.at(15), self.at(16))
+        self.google.update_event(free, transparency='transparent')
+        self.google.add_event('Offsite', self.day - timedelta(days=2), self.at(8))
+        gcalendar.sync_calendar(self.user)
+
+        self.assertEqual(gcalendar.busy_intervals(self.user, self.at(8), self.at(17)),
+                         [(self.at(9), self.at(11)), (self.at(13), self.at(14))])
+        self.assertEqual(gcalendar.free_slots(self.user, self.at(8), self.at(17), timedelta(hours=1)),
+                         [(self.at(8), self.at(9)), (self.at(11), self.at(13)), (self.at(14), self.at(17))])
+        self.assertEqual([e['summary'] for e in gcalendar.conflicts(self.user, self.at(10, 30), self.at(13, 30))],
+                         ['B', 'C'])
+        # The multi-day event is found even though it started long before the window.
+        self.assertEqual([e['summary'] for e in gcalendar.conflicts(self.user, self.at(7), self.at(7, 30))],
+                         ['Offsite'])
+        with self.assertNumQueries(2):
+            list(gcalendar.events_between(self.user, self.at(8), self.at(17)))
+
+    def test_gated_on_calendar_permission(self):
+        self.google.add_event('Standup', self.at(9), self.at(10))
+        gcalendar.sync_calendar(self.user)
+        self.user.calendar_permission = False
+        self.assertEqual(list(gcalendar.events_between(self.user, self.at(0), self.at(23))), [])
+        self.assertIsNone(gcalendar.sync_calendar(self.user))
+        self.assertFalse(CalendarState.objects.filter(user=self.user).exists())
+
+    def test_calendar_action_reads_from_synced_store(self):
+        gcalendar.sync_calendar(self.user)
+        self.google.add_event('Dentist', self.at(10), self.at(11))
+        self.google.requests.clear()
+
+        results = run_actions(self.user, {'calendar': True})
+        self.assertEqual(results['calendar']['data']['events'][0]['summary'], 'Dentist')
+        self.assertEqual(len(self.google.requests), 1)
+
+
+class ContactIndexTests(LumeTestCase):
+    def setUp(self):
+        self.index = contacts.ContactIndex([
+            ('Alice Smith', ['alice@example.com']),
+            ('Alicia Keys', ['akeys@music.test']),
+            ('Bob Jones', ['bob.jones@example.com', 'bob@home.test']),
+            ('José Martínez', ['jose@example.com']),
+            ('John Appleseed', []),
+        ])
+
+    def names(self, query, limit=8):
+        return [name for name, _ in self.index.search(query, limit)]
+
+    def test_prefix_lookup(self):
+        self.assertEqual(self.names('al'), ['Alice Smith', 'Alicia Keys'])
+        self.assertEqual(self.names('alice sm'), ['Alice Smith'])
+        self.assertEqual(self.names('Smi'), ['Alice Smith'])
+        self.assertEqual(self.names('al', limit=1), ['Alice Smith'])
+
+    def test_email_lookup(self):
+        self.assertEqual(self.names('bob@home'), ['Bob Jones'])
+        self.assertEqual(self.names('bob.jones@ex'), ['Bob Jones'])
+        self.assertEqual(self.names('music'), ['Alicia Keys'])
+
+    def test_accents_are_folded(self):
+        self.assertEqual(self.names('jose mart'), ['José Martínez'])
+
+    def test_fuzzy_fallback(self):
+        self.assertEqual(self.names('smyth'), ['Alice Smith'])
+        self.assertEqual(self.names('martinex'), ['José Martínez'])
+        self.assertEqual(self.names('xyz'), [])
+
+
+class ContactsSyncTests(GoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.google.add_contact('Alice Smith', 'alice@example.com')
+        self.bob = self.google.add_contact('Bob Jones', 'bob@example.com')
+        self.user = self.make_user()
+
+    def autocomplete(self, query):
+        return [contact['name'] for contact in contacts.autocomplete(self.user, query)]
+
+    def test_bulk_then_incremental_sync(self):
+        contacts.sync_contacts(self.user)
+        self.assertEqual(self.autocomplete('a'), ['Alice Smith'])
+
+        self.google.add_contact('Anna Lee', 'anna@example.com')
+        self.google.update_contact(self.bob, name='Bobby Jones')
+        self.google.delete_contact(self.alice)
+        self.google.requests.clear()
+        state = contacts.sync_contacts(self.user)
+
+        self.assertEqual(self.google.requests, [('GET', '/v1/people/me/connections')])
+        self.assertEqual(state.version, 2)
+        self.assertEqual(self.autocomplete('a'), ['Anna Lee'])
+        self.assertEqual(self.autocomplete('bobby'), ['Bobby Jones'])
+
+    def test_expired_sync_token_resyncs(self):
+        contacts.sync_contacts(self.user)
+        del self.google.people[self.alice]
+        self.google.expire_people_sync_tokens()
+        contacts.sync_contacts(self.user)
+        self.assertEqual(list(Contact.objects.filter(user=self.user).values_list('name', flat=True)), ['Bob Jones'])
+
+    def test_index_reused_until_contacts_change(self):
+        contacts.sync_contacts(self.user)
+        index = contacts.get_index(self.user)
+        with self.assertNumQueries(1):
+            self.assertIs(contacts.get_index(self.user), index)
+        contacts.sync_contacts(self.user)  # nothing changed
+        self.assertIs(contacts.get_index(self.user), index)
+        self.google.add_contact('Carol King', 'carol@example.com')
+        contacts.sync_contacts(self.user)
+        self.assertIsNot(contacts.get_index(self.user), index)
+
+    def test_requires_contacts_scope(self):
+        self.user.granted_scopes = '[]'
+        self.assertIsNone(contacts.sync_contacts(self.user))
+        self.assertEqual(contacts.autocomplete(self.user, 'alice'), [])
+
+    @override_settings(CONTACTS_SYNC_ON_LOGIN=True)
+    def test_synced_after_login(self):
+        from oauth.views import complete_google_login
+        from oauth.models import OAuthState
+        from django.test import RequestFactory
+        from django.contrib.sessions.middleware import SessionMiddleware
+
+        request = RequestFactory().get('/oauth/callback/')
+        SessionMiddleware(lambda request: None).process_request(request)
+        credentials = mock.Mock(
+            token='token', refresh_token='refresh', expiry=timezone.now() + timedelta(hours=1),
+            scopes=[contacts.CONTACTS_SCOPE],
+        )
+        oauth_state = OAuthState.objects.create(state='s1')
+        oauth_state.set_requested_services({})
+        complete_google_login(request, oauth_state, {'id': 'g1', 'email': 'ivy@example.com', 'name': 'Ivy'}, credentials)
+
+        user = User.objects.get(email='ivy@example.com')
+        self.assertEqual(contacts.autocomplete(user, 'bob'), [
+            {'name': 'Bob Jones', 'email': 'bob@example.com', 'emails': ['bob@example.com']},
+        ])
+
+    def test_autocomplete_endpoint(self):
+        contacts.sync_contacts(self.user)
+        self.client.force_login(self.user)
+        response = self.client.get('/api/contacts/autocomplete/', {'q': 'ali'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['contacts'][0]['email'], 'alice@example.com')
+        self.assertEqual(self.client.get('/api/contacts/autocomplete/', {'q': ''}).json()['contacts'], [])
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/contacts/autocomplete/', {'q': 'ali'}).status_code, 401)
+
+
+class ReadThroughCacheTests(GoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.docs = self.google.add_task('Write docs', tasklist='Work')
+        self.milk = self.google.add_task('Buy milk', tasklist='Home')
+        self.work = self.google.tasklist_id('Work')
+        self.google.add_note('Ideas')
+        self.user = self.make_user(tasks_permission=True, keep_permission=True)
+
+    def titles(self):
+        return sorted(task['title'] for task in gtasks.get_open_tasks(self.user))
+
+    def test_fresh_cache_makes_no_calls(self):
+        self.assertEqual(self.titles(), ['Buy milk', 'Write docs'])
+        self.assertEqual(self.google.requests, [('GET', '/tasks/v1/users/@me/lists'), ('POST', '/batch/tasks/v1')])
+        self.google.requests.clear()
+        self.assertEqual(self.titles(), ['Buy milk', 'Write docs'])
+        self.assertEqual(self.google.requests, [])
+
+    @override_settings(READTHROUGH_FRESH_SECONDS=0)
+    def test_revalidates_with_etag_and_updated_min(self):
+        self.titles()
+        self.google.statuses.clear()
+        self.assertEqual(self.titles(), ['Buy milk', 'Write docs'])
+        # Lists unchanged: 304. Each list answers with an empty delta.
+        self.assertEqual(self.google.statuses, [304, 200, 200])
+
+        self.google.update_task(self.work, self.docs, status='completed')
+        self.google.add_task('Ship release', tasklist='Work')
+        self.google.delete_task(self.google.tasklist_id('Home'), self.milk)
+        self.assertEqual(self.titles(), ['Ship release'])
+
+    def test_write_through(self):
+        self.titles()
+        self.google.requests.clear()
+        task = gtasks.create_task(self.user, self.work, 'Review PR')
+        self.assertEqual(self.titles(), ['Buy milk', 'Review PR', 'Write docs'])
+        gtasks.complete_task(self.user, self.work, task['id'])
+        self.assertEqual(self.titles(), ['Buy milk', 'Write docs'])
+        # Only the two writes went out; reads came from the cache.
+        self.assertEqual([method for method, _ in self.google.requests], ['POST', 'PATCH'])
+
+    @override_settings(READTHROUGH_FRESH_SECONDS=0)
+    def test_keep_notes(self):
+        self.assertEqual([note['title'] for note in keep.get_notes(self.user)], ['Ideas'])
+        self.google.statuses.clear()
+        keep.get_notes(self.user)
+        self.assertEqual(self.google.statuses, [304])
+        self.google.add_note('Groceries')
+        self.assertEqual(sorted(note['title'] for note in keep.get_notes(self.user)), ['Groceries', 'Ideas'])
+        self.assertEqual(self.google.statuses, [304, 200])
+
+    @override_settings(READTHROUGH_MAX_ENTRIES=10, READTHROUGH_MAX_BYTES=100)
+    def test_lru_eviction_within_budget(self):
+        now = timezone.now()
+        for i in range(4):
+            CachedResource.objects.create(
+                user=self.user, key=f'tasks:list:{i}', payload={}, size=40,
+                synced_at=now, last_used_at=now - timedelta(minutes=10 - i),
+            )
+        self.assertEqual(readthrough.evict(self.user), 2)
+        self.assertEqual(sorted(CachedResource.objects.values_list('key', flat=True)), ['tasks:list:2', 'tasks:list:3'])
+
+        with override_settings(READTHROUGH_MAX_ENTRIES=1, READTHROUGH_MAX_BYTES=10 ** 6):
+            self.assertEqual(readthrough.evict(self.user), 1)
+            self.assertEqual(list(CachedResource.objects.values_list('key', flat=True)), ['tasks:list:3'])
+
+    @override_settings(READTHROUGH_MAX_ENTRIES=10, READTHROUGH_MAX_BYTES=10)
+    def test_rows_just_written_are_not_evicted(self):
+        with self.assertLogs('integrations.readthrough', 'WARNING'):
+            self.titles()
+        self.google.requests.clear()
+        self.assertEqual(self.titles(), ['Buy milk', 'Write docs'])
+        self.assertEqual(self.google.requests, [])
+
+    @override_settings(READTHROUGH_FRESH_SECONDS=0)
+    def test_keep_notes_are_paged(self):
+        for i in range(4):
+            self.google.add_note(f'Note {i}')
+        with mock.patch.object(keep, 'PAGE_SIZE', 2):
+            self.assertEqual(len(keep.get_notes(self.user)), 5)
+            self.assertEqual(self.google.requests, [('GET', '/v1/notes')] * 3)
+            # A multi-page list can't be confirmed by the first page's ETag
+            self.google.statuses.clear()
+            self.assertEqual(len(keep.get_notes(self.user)), 5)
+            self.assertEqual(self.google.statuses, [200, 200, 200])
+
+    def test_gated_on_permissions(self):
+        self.titles()
+        self.user.tasks_permission = False
+        self.assertEqual(self.titles(), [])
+        self.assertFalse(CachedResource.objects.filter(key__startswith='tasks:').exists())
+        with self.assertRaises(google_api.NotConnected):
+            gtasks.create_task(self.user, self.work, 'Nope')
+
+    def test_actions_write_tasks_through_the_cache(self):
+        run_actions(self.user, {'tasks': True})
+        self.google.requests.clear()
+        results = run_actions(self.user, {'tasks': True}, 'Add a task to review the PR, then email Bob')
+        self.assertEqual(results['tasks']['data']['created'], 'review the PR')
+        self.assertTrue(describe('tasks', results['tasks']).startswith('I added "review the PR"'))
+        self.assertIn('review the PR', [task['title'] for task in results['tasks']['data']['tasks']])
+        results = run_actions(self.user, {'tasks': True}, 'Mark write docs as done')
+        self.assertEqual(results['tasks']['data']['completed'], 'Write docs')
+        self.assertEqual(self.titles(), ['Buy milk', 'review the PR'])
+        # Only the two writes went out; reads came from the cache.
+        self.assertEqual([method for method, _ in self.google.requests], ['POST', 'PATCH'])
+
+    def test_parse_task_writes(self):
+        self.assertEqual(gtasks.parse_write('remind me to call mom.'), ('create', 'call mom'))
+        self.assertEqual(gtasks.parse_write('Please tick off "Buy milk"'), ('complete', 'Buy milk'))
+        self.assertIsNone(gtasks.parse_write('I need to finish the slides'))
+        self.assertIsNone(gtasks.parse_write('What tasks do I have?'))
+
+    def test_actions_read_through_cache(self):
+        run_actions(self.user, {'tasks': True, 'keep': True})
+        self.google.requests.clear()
+        results = run_actions(self.user, {'tasks': True, 'keep': True})
+        self.assertEqual(sorted(t['title'] for t in results['tasks']['data']['tasks']), ['Buy milk', 'Write docs'])
+        self.assertEqual(results['keep']['data']['notes'][0]['title'], 'Ideas')
+        self.assertEqual(self.google.requests, [])
+
+
+class WarmupTests(GoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.google.add_message('Hello')
+        now = datetime.now(dt_timezone.utc)
+        self.google.add_event('Standup', now + timedelta(days=1), now + timedelta(days=1, hours=1))
+        self.google.add_task('Write docs')
+        self.user = self.make_user(gmail_permission=True, calendar_permission=True, tasks_permission=True)
+
+    def test_warms_each_granted_service(self):
+        results = warmup.warm_up(self.user, ['email', 'calendar', 'tasks', 'keep'])
+        self.assertEqual(results, {'email': 'warm', 'calendar': 'warm', 'tasks': 'warm'})
+        self.assertEqual(gmail.recent_messages(self.user)[0]['subject'], 'Hello')
+        self.assertEqual(gcalendar.upcoming_events(self.user)[0]['summary'], 'Standup')
+        self.assertIsNotNone(gcalendar.synced_sync_token(self.user))
+
+        # The next turn is served from the warm stores
+        self.google.requests.clear()
+        gtasks.get_open_tasks(self.user)
+        self.assertEqual(self.google.requests, [])
+
+    def test_fresh_stores_are_skipped(self):
+        warmup.warm_up(self.user, ['email', 'calendar'])
+        self.google.requests.clear()
+        self.assertEqual(warmup.warm_up(self.user, ['email', 'calendar']), {'email': 'skipped', 'calendar': 'skipped'})
+        self.assertEqual(self.google.requests, [])
+
+    def test_unexpected_error_fails_only_that_service(self):
+        with mock.patch('integrations.gmail.apply_changes', side_effect=DatabaseError('locked')), \
+                self.assertLogs('integrations.warmup', 'ERROR'):
+            results = warmup.warm_up(self.user, ['email', 'calendar', 'tasks'])
+        self.assertEqual(results, {'email': 'error', 'calendar': 'warm', 'tasks': 'warm'})
+        self.assertEqual(gcalendar.upcoming_events(self.user)[0]['summary'], 'Standup')
+
+    def test_stale_stores_are_synced_incrementally(self):
+        warmup.warm_up(self.user, ['email'])
+        MailboxState.objects.update(synced_at=timezone.now() - timedelta(hours=1))
+        self.google.add_message('Later')
+        self.assertEqual(warmup.warm_up(self.user, ['email']), {'email': 'warm'})
+        self.assertEqual(gmail.recent_messages(self.user)[0]['subject'], 'Later')
+
+    def test_budget_bounds_the_warmup(self):
+        self.google.latency = {'calendar': 2}
+        started = time.monotonic()
+        results = warmup.warm_up(self.user, ['email', 'calendar'], budget=0.5)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(results, {'email': 'warm', 'calendar': 'timeout'})
+        self.assertFalse(CalendarEvent.objects.exists())
+
+    @override_settings(WARMUP_ENABLED=True, JOBS_EAGER=False)
+    def test_grant_queues_warmup_ahead(self):
+        warm_up_later(self.user, ['email', 'keep'], granted=True)
+        warm_up_later(self.user, ['email'], granted=True)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args), ('integrations.warm_up', [self.user.pk, ['email']]))
+        self.assertGreater(job.priority, 0)
+
+
+@override_settings(GOOGLE_API_BACKOFF=0.01)
+class GoogleQuotaTests(GoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        quota.reset_metrics()
+        get_store().clear()
+        self.google.add_task('Write docs')
+
+    def lists(self, **kwargs):
+        return google_api.get_json('token', 'tasks', '/tasks/v1/users/@me/lists', **kwargs)
+
+    def test_throttled_call_is_retried(self):
+        self.google.throttle('tasks', times=2)
+        self.assertEqual(len(self.lists()['items']), 1)
+        self.assertEqual(self.google.statuses, [429, 429, 200])
+        counts = quota.metrics()['tasks']
+        self.assertEqual((counts['calls'], counts['throttled'], counts['retries']), (3, 2, 2))
+
+    def test_retry_waits_for_retry_after(self):
+        self.google.throttle('tasks', retry_after=0.3)
+        started = time.monotonic()
+        self.lists()
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_rate_limit_403_is_retried_but_other_403s_are_not(self):
+        self.google.throttle('tasks', status=403)
+        self.lists()
+        self.assertEqual(self.google.statuses, [403, 200])
+
+        with self.assertRaises(google_api.GoogleAPIError) as raised:
+            google_api.get_json('token', 'tasks', '/tasks/v1/lists/missing/tasks/x')
+        self.assertEqual(raised.exception.status, 404)
+        self.assertEqual(quota.metrics()['tasks']['retries'], 1)
+
+    @override_settings(GOOGLE_API_MAX_RETRIES=2)
+    def test_gives_up_after_max_retries(self):
+        self.google.throttle('tasks', times=5)
+        with self.assertRaises(google_api.GoogleAPIError) as raised:
+            self.lists()
+        self.assertEqual(raised.exception.status, 429)
+        self.assertEqual(len(self.google.statuses), 3)
+
+    def test_no_retry_past_the_deadline(self):
+        self.google.throttle('tasks', retry_after=5)
+        started = time.monotonic()
+        with self.assertRaises(google_api.GoogleAPIError):
+            self.lists(timeout=0.5)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    @override_settings(GOOGLE_API_BACKOFF_MAX=1)
+    def test_long_retry_after_without_deadline_is_not_waited_for(self):
+        self.google.throttle('tasks', retry_after=120)
+        started = time.monotonic()
+        with self.assertRaises(google_api.GoogleAPIError) as raised:
+            self.lists()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((raised.exception.status, raised.exception.retry_after), (429, 120))
+        self.assertEqual(self.google.statuses, [429])
+
+    def test_throttled_batch_parts_are_resent(self):
+        first, second = self.google.add_message('One'), self.google.add_message('Two')
+        self.google.throttle('gmail')
+        parts = google_api.batch('token', 'gmail', [
+            ('GET', f'/gmail/v1/users/me/messages/{first}'),
+            ('GET', f'/gmail/v1/users/me/messages/{second}'),
+        ])
+        self.assertEqual([status for status, _ in parts], [200, 200])
+        self.assertEqual([path for _, _, path in self.google.calls].count('/batch/gmail/v1'), 2)
+
+    def test_batch_response_missing_parts_is_an_error(self):
+        first, second = self.google.add_message('One'), self.google.add_message('Two')
+        decode = batch.decode_response
+        with mock.patch.object(batch, 'decode_response', lambda *args: {0: decode(*args)[0]}), \
+                self.assertRaises(google_api.GoogleAPIError) as raised:
+            google_api.batch('token', 'gmail', [
+                ('GET', f'/gmail/v1/users/me/messages/{first}'),
+                ('GET', f'/gmail/v1/users/me/messages/{second}'),
+            ])
+        self.assertEqual(raised.exception.status, 502)
+
+    @override_settings(GOOGLE_API_QUOTA_ENABLED=True, GOOGLE_API_QUOTAS={'tasks': {'user': '20/s', 'project': '100/s'}})
+    def test_pacing_keeps_throughput_under_quota_without_429s(self):
+        self.google.set_quota('tasks', 20)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: self.lists(), range(40)))
+        elapsed = time.monotonic() - started
+        self.assertEqual(len(results), 40)
+        self.assertNotIn(429, self.google.statuses)
+        # 20 calls of burst, then 20 more at 20/s
+        self.assertGreater(elapsed, 0.8)
+        self.assertLess(elapsed, 3)
+        self.assertGreater(quota.metrics()['tasks']['paced'], 0)
+
+    @override_settings(GOOGLE_API_QUOTA_ENABLED=True, GOOGLE_API_QUOTAS={'tasks': {'user': '1/min'}})
+    def test_exhausted_quota_fails_fast(self):
+        self.lists()
+        with self.assertRaises(google_api.QuotaExhausted):
+            self.lists(timeout=0.2)
+        self.assertEqual(len(self.google.statuses), 1)
+        self.assertEqual(quota.metrics()['tasks']['rejected'], 1)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.lists()
+        user = self.make_user()
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/google/metrics/').status_code, 403)
+        User.objects.filter(pk=user.pk).update(is_staff=True)
+        response = self.client.get('/api/google/metrics/')
+        self.assertEqual(response.json()['apis']['tasks']['calls'], 1)
+
+
+class FakeGoogleOAuthTests(LumeTestCase):
+    def setUp(self):
+        self.google = FakeGoogle()
+        self.client_ = httpx.Client(transport=self.google.transport(), base_url=fake_google.BASE_URL)
+
+    def test_login(self):
+        response = self.client_.get(fake_google.AUTH_PATH, params={
+            'redirect_uri': 'https://lume.test/oauth/callback/', 'state': 's1', 'scope': 'openid email',
+            'login_hint': 'gina@example.com',
+        })
+        self.assertEqual(response.status_code, 302)
+        location = httpx.URL(response.headers['Location'])
+        self.assertEqual(location.path, '/oauth/callback/')
+        self.assertEqual(location.params['state'], 's1')
+
+        response = self.client_.post(fake_google.TOKEN_PATH, data={
+            'grant_type': 'authorization_code', 'code': location.params['code'],
+        })
+        tokens = response.json()
+        self.assertEqual(tokens['scope'], 'openid email')
+
+        response = self.client_.get(
+            fake_google.USERINFO_PATH, headers={'Authorization': f"Bearer {tokens['access_token']}"},
+        )
+        self.assertEqual(response.json()['id'], 'gina')
+        self.assertEqual(response.json()['email'], 'gina@example.com')
+
+        response = self.client_.post(fake_google.TOKEN_PATH, data={
+            'grant_type': 'refresh_token', 'refresh_token': tokens['refresh_token'],
+        })
+        self.assertEqual(response.json()['access_token'], tokens['access_token'])
+
+    def test_userinfo_needs_a_token(self):
+        self.assertEqual(self.client_.get(fake_google.USERINFO_PATH).status_code, 401)
+        self.assertEqual(self.client_.post(fake_google.TOKEN_PATH, data={}).status_code, 400)
+
+    def test_serve_over_http(self):
+        self.google.seed(messages=3, events=0)
+        server = fake_google.serve(self.google)
+        self.addCleanup(server.shutdown)
+        with override_settings(**server.settings()):
+            token = 'access-gina'
+            listed = google_api.get_json(token, 'gmail', '/gmail/v1/users/me/messages')
+            self.assertEqual(len(listed['messages']), 3)
+            self.assertEqual(google_api.get_json(token, 'oauth2', '/oauth2/v2/userinfo')['id'], 'gina')
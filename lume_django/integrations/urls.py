@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'integrations'
+
+urlpatterns = [
+    path('api/contacts/autocomplete/', views.contacts_autocomplete, name='contacts_autocomplete'),
+    path('api/google/metrics/', views.google_api_metrics, name='google_api_metrics'),
+]
@@ -0,0 +1,48 @@
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+import logging
+
+from lume_django.responses import json_response
+from . import quota
+from .contacts import autocomplete
+
+logger = logging.getLogger(__name__)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@cache_control(private=True, max_age=30)
+def contacts_autocomplete(request):
+    """
+    Suggest contacts for a partial name or email, for recipient fields in the chat UI
+    """
+    try:
+        if not request.user.is_authenticated:
+            return json_response(request, {'error': 'Not authenticated'}, status=401)
+
+        query = request.GET.get('q', '').strip()
+        try:
+            limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+        except ValueError:
+            return json_response(request, {'error': 'Invalid limit'}, status=400)
+
+        return json_response(request, {
+            'success': True,
+            'query': query,
+            'contacts': autocomplete(request.user, query, limit) if query else [],
+        })
+    except Exception as e:
+        logger.error("Contacts autocomplete error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+def google_api_metrics(request):
+    """
+    Per-API counters of Google calls, throttling, retries and quota pacing in this process (staff only)
+    """
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return json_response(request, {'error': 'Not authorized'}, status=403)
+    return json_response(request, {'success': True, 'apis': quota.metrics()})
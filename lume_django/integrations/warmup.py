@@ -0,0 +1,209 @@
+"""
+Warm a user's local stores before their next chat turn needs them.
+
+Run as a job (``integrations.warm_up``) after a login, for every granted
+service, and after a permission grant, for the newly granted ones, so the
+first message after the redirect is answered from warm stores instead of
+paying full Google latency. Per service:
+
+- email: the mailbox store (backfill of recent messages, or the history delta);
+- calendar: the event store (sync-token delta, or the first
+  ``WARMUP_CALENDAR_PAGES`` pages of a resync, which covers the coming week);
+- tasks, keep: the read-through cache (open tasks, notes).
+
+Each warmup has a budget: services synced within ``WARMUP_FRESH_SECONDS`` are
+skipped, and everything has to finish within ``WARMUP_BUDGET_SECONDS``; what
+does not is left to the next sync. Like chat actions, only the Google calls run
+in the pool (at most ``WARMUP_MAX_WORKERS`` at once per process), and the stores
+are read and written by the calling thread.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+from . import gcalendar, gmail, google_api, gtasks, keep, readthrough
+from .google_api import DeadlineExceeded, GoogleAPIError, NotConnected
+from .models import CalendarState, MailboxState
+
+logger = logging.getLogger(__name__)
+
+SKIP = object()  # prepare() result for a service that is warm already
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'WARMUP_MAX_WORKERS', 4),
+                    thread_name_prefix='warmup',
+                )
+    return _executor
+
+
+def _recent(synced_at):
+    fresh_for = timedelta(seconds=getattr(settings, 'WARMUP_FRESH_SECONDS', 300))
+    return synced_at is not None and timezone.now() - synced_at < fresh_for
+
+
+class Warmer:
+    """
+    One service's warmup; same split as integrations.actions.Action.
+
+    ``prepare`` and ``finish`` run in the calling thread and may use the DB;
+    ``fetch`` runs in the pool and must only talk to Google.
+    """
+
+    def prepare(self, user):
+        return None
+
+    def fetch(self, token, context, deadline):
+        raise NotImplementedError
+
+    def finish(self, user, context, fetched):
+        pass
+
+
+class MailboxWarmer(Warmer):
+    def prepare(self, user):
+        state = MailboxState.objects.filter(user=user).first()
+        if state is None or state.history_id is None:
+            return None
+        return SKIP if _recent(state.synced_at) else state.history_id
+
+    def fetch(self, token, history_id, deadline):
+        if history_id is None:
+            return gmail.fetch_backfill(token, deadline=deadline)
+        return gmail.fetch_history(token, history_id, deadline=deadline)
+
+    def finish(self, user, history_id, changes):
+        gmail.apply_changes(user, changes)
+
+
+class CalendarWarmer(Warmer):
+    def prepare(self, user):
+        state = CalendarState.objects.filter(user=user).first()
+        if state is None:
+            return '', ''
+        if state.sync_token and _recent(state.synced_at):
+            return SKIP
+        return state.sync_token, state.page_token
+
+    def fetch(self, token, context, deadline):
+        # Returns (incremental changes, None) or (None, resync pages)
+        sync_token, page_token = context
+        if sync_token:
+            try:
+                return gcalendar.fetch_changes(token, sync_token, deadline=deadline), None
+            except gcalendar.SyncTokenExpired:
+                page_token = ''
+        pages = []
+        while len(pages) < getattr(settings, 'WARMUP_CALENDAR_PAGES', 2):
+            try:
+                page = gcalendar.fetch_resync_page(token, page_token, deadline=deadline)
+            except gcalendar.SyncTokenExpired:
+                if pages or not page_token:
+                    raise
+                # The page token of an interrupted resync went stale; start over
+                page_token = ''
+                continue
+            pages.append((page, not page_token and not pages))
+            page_token = page.page_token
+            if not page_token:
+                break
+        return None, pages
+
+    def finish(self, user, context, fetched):
+        changes, pages = fetched
+        if changes is not None:
+            gcalendar.apply_changes(user, changes)
+            return
+        for page, start in pages:
+            gcalendar.apply_resync_page(user, page, start=start)
+
+
+class ReadThroughWarmer(Warmer):
+    """Tasks and Keep; ``module`` is gtasks or keep"""
+
+    def __init__(self, module):
+        self.module = module
+
+    def prepare(self, user):
+        return readthrough.load(user, self.module.PREFIX)
+
+    def fetch(self, token, cached, deadline):
+        return self.module.revalidate(token, cached, deadline=deadline)
+
+    def finish(self, user, cached, result):
+        readthrough.save(user, result)
+
+
+WARMERS = {
+    'email': MailboxWarmer(),
+    'calendar': CalendarWarmer(),
+    'tasks': ReadThroughWarmer(gtasks),
+    'keep': ReadThroughWarmer(keep),
+}
+
+
+def warm_up(user, services, budget=None):
+    """
+    Warm the stores of ``services`` the user has granted, within ``budget`` seconds.
+
+    Returns ``{service: status}`` with ``warm``, ``skipped`` (fresh already),
+    ``timeout`` or ``error``.
+    """
+    services = [service for service in services if service in WARMERS and user.has_service_permission(service)]
+    if not services or not user.access_token:
+        return {}
+    try:
+        token = google_api.access_token(user)
+    except NotConnected as e:
+        logger.warning("Warmup for user %s skipped: %s", user.pk, e)
+        return {service: 'error' for service in services}
+
+    if budget is None:
+        budget = getattr(settings, 'WARMUP_BUDGET_SECONDS', 20)
+    deadline = time.monotonic() + budget
+    contexts = {service: WARMERS[service].prepare(user) for service in services}
+    results = {service: 'skipped' for service in services if contexts[service] is SKIP}
+    futures = {
+        _pool().submit(WARMERS[service].fetch, token, contexts[service], deadline): service
+        for service in services if service not in results
+    }
+    done, _ = wait(futures, timeout=budget)
+
+    for future, service in futures.items():
+        if future not in done:
+            future.cancel()
+            results[service] = 'timeout'
+            continue
+        try:
+            WARMERS[service].finish(user, contexts[service], future.result())
+        except (DeadlineExceeded, httpx.TimeoutException):
+            results[service] = 'timeout'
+        except (GoogleAPIError, httpx.HTTPError) as e:
+            logger.warning("%s warmup for user %s failed: %s", service, user.pk, e)
+            results[service] = 'error'
+        except Exception:
+            # A malformed payload or a failed store write: the other services still warm.
+            logger.exception("%s warmup for user %s failed", service, user.pk)
+            results[service] = 'error'
+        else:
+            results[service] = 'warm'
+    logger.info(
+        "Warmup for user %s: %s", user.pk,
+        ', '.join(f"{service}={status}" for service, status in results.items()),
+    )
+    return results
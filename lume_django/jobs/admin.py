@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'queue', 'priority', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('name', 'dedup_key', 'last_error')
+    readonly_fields = ('attempts', 'locked_by', 'locked_until', 'last_error', 'created_at', 'finished_at')
+    ordering = ('-created_at',)
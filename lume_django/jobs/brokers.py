@@ -0,0 +1,175 @@
+"""
+Where queued jobs wait for a worker.
+
+A broker stores jobs and hands them out: ``enqueue``, ``reserve`` (claim the
+next due job for a worker), ``complete`` and ``fail`` (finish or reschedule an
+attempt). Reserved jobs are objects with ``name``, ``args``, ``kwargs``,
+``attempts``, ``max_attempts`` and ``timeout``. ``JOBS_BROKER`` selects one by
+name or dotted path to a Broker subclass.
+
+- ``DatabaseBroker`` (default): the ``Job`` table. Jobs enqueued inside a
+  transaction only become visible when it commits. Workers claim jobs with
+  ``SELECT ... FOR UPDATE SKIP LOCKED`` where supported plus a conditional
+  UPDATE, so two workers never run the same attempt. A job whose worker died
+  is reclaimed once its lock (timeout plus ``JOBS_LOCK_GRACE``) runs out.
+- ``EagerBroker``: runs each job inline at enqueue time; used under
+  ``JOBS_EAGER``.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    def enqueue(self, spec, args, kwargs, dedup_key=None, priority=0, delay=timedelta(0)):
+        raise NotImplementedError
+
+    def reserve(self, queues, worker_id):
+        raise NotImplementedError
+
+    def complete(self, job):
+        raise NotImplementedError
+
+    def fail(self, job, error, retry_at=None):
+        raise NotImplementedError
+
+    def purge(self, before):
+        """Drop finished jobs older than ``before``; returns how many"""
+        return 0
+
+
+class EagerBroker(Broker):
+    """Runs jobs inline when they are enqueued, once, logging failures"""
+
+    def enqueue(self, spec, args, kwargs, dedup_key=None, priority=0, delay=timedelta(0)):
+        try:
+            spec.func(*args, **kwargs)
+        except Exception:
+            logger.exception("Job %s failed", spec.name)
+        return None
+
+
+class DatabaseBroker(Broker):
+    # How often reserve() looks for jobs abandoned by dead workers
+    RECOVERY_INTERVAL = 30
+
+    def __init__(self):
+        self._recovered_at = 0
+
+    def enqueue(self, spec, args, kwargs, dedup_key=None, priority=0, delay=timedelta(0)):
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    name=spec.name,
+                    args=args,
+                    kwargs=kwargs,
+                    queue=spec.queue,
+                    priority=priority,
+                    dedup_key=dedup_key,
+                    max_attempts=spec.max_attempts,
+                    timeout=spec.timeout,
+                    run_at=timezone.now() + delay,
+                )
+        except IntegrityError:
+            if dedup_key is None:
+                raise
+            logger.debug("Job %s with key %s already pending", spec.name, dedup_key)
+            return None
+
+    def _recover(self, now):
+        # Running jobs whose lock ran out lost their worker: retry or fail them.
+        expired = Job.objects.filter(status=Job.RUNNING, locked_until__lt=now)
+        expired.filter(attempts__lt=F('max_attempts')).update(
+            status=Job.QUEUED, run_at=now, locked_by='', locked_until=None, last_error='Worker lost or timed out',
+        )
+        expired.update(
+            status=Job.FAILED, finished_at=now, dedup_key=None, locked_until=None,
+            last_error='Worker lost or timed out',
+        )
+
+    def reserve(self, queues, worker_id):
+        now = timezone.now()
+        if time.monotonic() - self._recovered_at > self.RECOVERY_INTERVAL:
+            self._recover(now)
+            self._recovered_at = time.monotonic()
+
+        with transaction.atomic():
+            job = Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.QUEUED, queue__in=queues, run_at__lte=now,
+            ).order_by('-priority', 'run_at', 'pk').first()
+            if job is None:
+                return None
+            locked_until = now + timedelta(seconds=job.timeout + getattr(settings, 'JOBS_LOCK_GRACE', 30))
+            claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, attempts=F('attempts') + 1, locked_by=worker_id, locked_until=locked_until,
+            )
+        if not claimed:
+            # Another worker got it first (backends without SKIP LOCKED)
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_until = locked_until
+        return job
+
+    def complete(self, job):
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.SUCCEEDED, finished_at=timezone.now(), dedup_key=None, locked_until=None,
+        )
+
+    def fail(self, job, error, retry_at=None):
+        if retry_at is not None:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, run_at=retry_at, locked_by='', locked_until=None, last_error=error,
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, finished_at=timezone.now(), dedup_key=None, locked_until=None, last_error=error,
+            )
+
+    def purge(self, before):
+        deleted, _ = Job.objects.filter(
+            status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=before,
+        ).delete()
+        return deleted
+
+
+BROKERS = {
+    'db': DatabaseBroker,
+    'eager': EagerBroker,
+}
+
+_broker = None
+
+
+def get_broker():
+    """The configured broker, created on first use"""
+    global _broker
+    if _broker is None:
+        if getattr(settings, 'JOBS_EAGER', False):
+            _broker = EagerBroker()
+        else:
+            backend = getattr(settings, 'JOBS_BROKER', 'db')
+            _broker = (BROKERS.get(backend) or import_string(backend))()
+    return _broker
+
+
+def _reset_broker(setting, **kwargs):
+    global _broker
+    if setting in ('JOBS_BROKER', 'JOBS_EAGER'):
+        _broker = None
+
+
+setting_changed.connect(_reset_broker)
@@ -0,0 +1,74 @@
+import os
+import signal
+import sys
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from jobs.brokers import get_broker
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = "Run background job workers until stopped (SIGTERM lets the current job finish)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help="Queue to work on; repeat for several (default: default)")
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to fork (POSIX only)")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queues are empty")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queues are empty")
+        parser.add_argument('--max-jobs', type=int, help="Exit after this many jobs (per process)")
+        parser.add_argument('--purge-days', type=int,
+                            help="First delete finished jobs older than this many days")
+
+    def handle(self, *args, **options):
+        if options['processes'] > 1 and not hasattr(os, 'fork'):
+            raise CommandError(
+                "--processes needs os.fork, which this platform (e.g. Windows) lacks; "
+                "start one run_jobs command per worker instead"
+            )
+        if options['purge_days'] is not None:
+            purged = get_broker().purge(timezone.now() - timedelta(days=options['purge_days']))
+            self.stdout.write(f"Purged {purged} finished jobs")
+
+        def work():
+            Worker(
+                queues=options['queues'] or ['default'],
+                sleep=options['sleep'],
+                burst=options['burst'],
+                max_jobs=options['max_jobs'],
+            ).run()
+
+        if options['processes'] <= 1:
+            work()
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        children = []
+        for _ in range(options['processes']):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    work()
+                finally:
+                    os._exit(0)
+            children.append(pid)
+
+        def forward(signum, frame):
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+        for pid in children:
+            while True:
+                try:
+                    os.waitpid(pid, 0)
+                    break
+                except InterruptedError:
+                    continue
+        self.stdout.write(self.style.SUCCESS(f"{len(children)} workers stopped"))
+        sys.stdout.flush()
@@ -0,0 +1,44 @@
+from django.db import models
+
+
+class Job(models.Model):
+    """
+    A unit of background work in the database broker (see jobs/brokers.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)  # registered job name
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    queue = models.CharField(max_length=50, default='default')
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Unique while the job is pending; cleared once it has finished
+    dedup_key = models.CharField(max_length=191, null=True, blank=True, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    timeout = models.PositiveIntegerField(default=60)  # seconds per attempt
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'queue', 'priority', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,92 @@
+"""
+Background jobs: registration and enqueueing.
+
+A job is a module-level function decorated with ``@job``, in an app's
+``jobs.py`` (collected when the app registry is ready). Arguments must be
+JSON-serializable, so pass ids rather than model instances::
+
+    @job('integrations.sync_contacts', priority=PRIORITY_LOW, timeout=120)
+    def sync_contacts(user_id):
+        ...
+
+    sync_contacts.enqueue(user.pk, dedup_key=f'contacts:{user.pk}')
+
+Enqueued jobs go to the configured broker (``JOBS_BROKER``, the database by
+default) and are run by ``manage.py run_jobs`` workers. With ``JOBS_EAGER``
+(set by the project's test cases) they run inline instead.
+
+- ``priority``: higher runs first; ties run in ``run_at`` order.
+- ``dedup_key``: while a job with the same key is queued or running, further
+  enqueues are dropped.
+- ``max_attempts`` / backoff: a failed attempt is retried after
+  ``JOBS_RETRY_BACKOFF * 2 ** (attempt - 1)`` seconds (jittered, capped at
+  ``JOBS_RETRY_BACKOFF_MAX``) until the attempts run out.
+- ``timeout``: seconds per attempt; an attempt that runs over is failed.
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+registry = {}  # job name -> JobSpec
+
+
+class JobTimeout(Exception):
+    """Raised inside a job attempt that ran over its timeout."""
+
+
+class JobSpec:
+    def __init__(self, name, func, queue, priority, max_attempts, timeout):
+        self.name = name
+        self.func = func
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+    def enqueue(self, *args, dedup_key=None, priority=None, delay=None, **kwargs):
+        """Queue a run; returns the broker's job handle, or None when deduplicated or run eagerly"""
+        return enqueue(self.name, *args, dedup_key=dedup_key, priority=priority, delay=delay, **kwargs)
+
+
+def job(name, queue='default', priority=PRIORITY_NORMAL, max_attempts=None, timeout=None):
+    """Register a function as a job; adds ``func.enqueue(*args, dedup_key=..., **kwargs)``"""
+    def decorator(func):
+        spec = JobSpec(
+            name, func, queue, priority,
+            max_attempts or getattr(settings, 'JOBS_MAX_ATTEMPTS', 3),
+            timeout or getattr(settings, 'JOBS_DEFAULT_TIMEOUT', 60),
+        )
+        registry[name] = spec
+        func.enqueue = spec.enqueue
+        return func
+    return decorator
+
+
+def enqueue(name, *args, dedup_key=None, priority=None, delay=None, **kwargs):
+    from .brokers import get_broker
+
+    spec = registry[name]
+    return get_broker().enqueue(
+        spec, list(args), kwargs,
+        dedup_key=dedup_key,
+        priority=spec.priority if priority is None else priority,
+        delay=delay or timedelta(0),
+    )
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt, after ``attempts`` failed ones"""
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF', 10)
+    cap = getattr(settings, 'JOBS_RETRY_BACKOFF_MAX', 3600)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    # Jitter, so jobs that failed together don't retry together
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
@@ -0,0 +1,165 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from lume_django.testing import LumeTestCase
+from .brokers import DatabaseBroker, EagerBroker, get_broker
+from .models import Job
+from .queue import JobTimeout, job, registry
+from .worker import Worker, time_limit
+
+calls = []
+
+
+@job('tests.record', max_attempts=3)
+def record(value):
+    calls.append(value)
+
+
+@job('tests.flaky', max_attempts=2)
+def flaky():
+    calls.append('flaky')
+    raise ValueError('boom')
+
+
+@job('tests.slow', timeout=1)
+def slow():
+    time.sleep(5)
+
+
+@override_settings(JOBS_EAGER=False, JOBS_BROKER='db')
+class DatabaseQueueTests(LumeTestCase):
+    def setUp(self):
+        calls.clear()
+        self.worker = Worker(queues=['default'], worker_id='test')
+
+    def drain(self):
+        while self.worker.work_once():
+            pass
+
+    def test_enqueued_job_runs_on_worker(self):
+        record.enqueue('a')
+        self.assertEqual(calls, [])
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+        self.drain()
+        self.assertEqual(calls, ['a'])
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_duplicate_is_dropped_while_pending(self):
+        self.assertIsNotNone(record.enqueue('a', dedup_key='k'))
+        self.assertIsNone(record.enqueue('b', dedup_key='k'))
+        self.drain()
+        self.assertEqual(calls, ['a'])
+        # Once finished the key is free again
+        self.assertIsNotNone(record.enqueue('c', dedup_key='k'))
+
+    def test_higher_priority_runs_first(self):
+        record.enqueue('low', priority=-5)
+        record.enqueue('normal')
+        record.enqueue('high', priority=5)
+        self.drain()
+        self.assertEqual(calls, ['high', 'normal', 'low'])
+
+    def test_delayed_job_waits(self):
+        record.enqueue('later', delay=timedelta(minutes=5))
+        self.assertFalse(self.worker.work_once())
+
+    def test_failed_attempt_is_retried_with_backoff(self):
+        flaky.enqueue()
+        self.assertTrue(self.worker.work_once())
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        # Not due yet
+        self.assertFalse(self.worker.work_once())
+
+        Job.objects.update(run_at=timezone.now())
+        self.worker.work_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNone(job.dedup_key)
+        self.assertEqual(calls, ['flaky', 'flaky'])
+
+    def test_timeout_fails_attempt(self):
+        slow.enqueue()
+        started = time.monotonic()
+        self.worker.work_once()
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertIn('JobTimeout', Job.objects.get().last_error)
+
+    def test_abandoned_job_is_reclaimed(self):
+        record.enqueue('a')
+        Job.objects.update(
+            status=Job.RUNNING, attempts=1, locked_by='dead', locked_until=timezone.now() - timedelta(seconds=1),
+        )
+        self.drain()
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(Job.objects.get().attempts, 2)
+
+    def test_unknown_job_fails_without_retry(self):
+        Job.objects.create(name='tests.missing', run_at=timezone.now())
+        self.worker.work_once()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_purge_drops_old_finished_jobs(self):
+        record.enqueue('a')
+        self.drain()
+        Job.objects.update(finished_at=timezone.now() - timedelta(days=10))
+        record.enqueue('b')
+        self.assertEqual(get_broker().purge(timezone.now() - timedelta(days=7)), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class EagerQueueTests(LumeTestCase):
+    def setUp(self):
+        calls.clear()
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_inline(self):
+        self.assertIsInstance(get_broker(), EagerBroker)
+        record.enqueue('now')
+        self.assertEqual(calls, ['now'])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_failure_is_logged_not_raised(self):
+        with self.assertLogs('jobs.brokers', 'ERROR'):
+            flaky.enqueue()
+
+    @override_settings(JOBS_EAGER=False, JOBS_BROKER='jobs.brokers.DatabaseBroker')
+    def test_broker_by_dotted_path(self):
+        self.assertIsInstance(get_broker(), DatabaseBroker)
+
+
+class TimeLimitTests(LumeTestCase):
+    def test_raises_after_limit(self):
+        with self.assertRaises(JobTimeout):
+            with time_limit(0.1):
+                time.sleep(1)
+
+    def test_no_limit_off_main_thread(self):
+        with mock.patch('jobs.worker.threading.current_thread', return_value=object()):
+            with time_limit(0.01):
+                time.sleep(0.05)
+
+
+class RegistryTests(LumeTestCase):
+    def test_app_jobs_are_discovered(self):
+        self.assertIn('integrations.sync_contacts', registry)
+        self.assertIn('integrations.refresh_service', registry)
+
+
+class RunJobsCommandTests(LumeTestCase):
+    def test_processes_need_fork(self):
+        with mock.patch('jobs.management.commands.run_jobs.os', spec=[]), \
+                self.assertRaisesMessage(CommandError, 'os.fork'):
+            call_command('run_jobs', '--processes', '2', '--burst')
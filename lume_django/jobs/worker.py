@@ -0,0 +1,112 @@
+"""
+Runs queued jobs: ``manage.py run_jobs`` starts one Worker per process.
+
+A worker reserves the next due job from the broker, runs one attempt under the
+job's timeout and reports the outcome. A failed attempt is rescheduled with
+backoff (``queue.retry_delay``) until ``max_attempts`` is reached. SIGTERM and
+SIGINT let the current job finish before the worker exits.
+"""
+
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .brokers import get_broker
+from .queue import JobTimeout, registry, retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise JobTimeout in the block after ``seconds``; only enforced in the main thread on POSIX"""
+    if not seconds or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise JobTimeout(f'Ran over {seconds}s')
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class Worker:
+    def __init__(self, queues=('default',), broker=None, sleep=1.0, burst=False, max_jobs=None, worker_id=None):
+        self.queues = list(queues)
+        self.broker = broker or get_broker()
+        self.sleep = sleep
+        self.burst = burst  # exit once the queues are empty
+        self.max_jobs = max_jobs
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.processed = 0
+        self._stopping = False
+
+    def stop(self, *args):
+        self._stopping = True
+
+    def process(self, job):
+        """Run one reserved attempt and report it; returns whether it succeeded"""
+        spec = registry.get(job.name)
+        started = time.monotonic()
+        try:
+            if spec is None:
+                raise LookupError(f'Unknown job {job.name!r}')
+            with time_limit(job.timeout):
+                spec.func(*job.args, **job.kwargs)
+        except Exception as exc:
+            error = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+            retry_at = None
+            if spec is not None and job.attempts < job.max_attempts:
+                retry_at = timezone.now() + retry_delay(job.attempts)
+            self.broker.fail(job, error, retry_at=retry_at)
+            logger.warning(
+                "Job %s #%s attempt %s/%s failed: %s%s", job.name, job.pk, job.attempts, job.max_attempts,
+                error, ' (will retry)' if retry_at else '', exc_info=retry_at is None,
+            )
+            return False
+        self.broker.complete(job)
+        logger.info("Job %s #%s done in %.0f ms", job.name, job.pk, (time.monotonic() - started) * 1000)
+        return True
+
+    def work_once(self):
+        """Reserve and run one job; returns False when none was due"""
+        job = self.broker.reserve(self.queues, self.worker_id)
+        if job is None:
+            return False
+        self.process(job)
+        self.processed += 1
+        return True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info("Worker %s started on %s", self.worker_id, ', '.join(self.queues))
+        while not self._stopping:
+            if self.max_jobs is not None and self.processed >= self.max_jobs:
+                break
+            close_old_connections()
+            try:
+                worked = self.work_once()
+            except Exception:
+                # Broker trouble (e.g. the database went away): back off and retry
+                logger.exception("Worker %s could not reserve a job", self.worker_id)
+                worked = False
+            if not worked:
+                if self.burst:
+                    break
+                time.sleep(self.sleep)
+        logger.info("Worker %s stopped after %s jobs", self.worker_id, self.processed)
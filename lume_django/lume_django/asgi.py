@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lume_django.settings")
+# Use the async OAuth callbacks, which don't block a thread on Google round trips
+os.environ.setdefault("OAUTH_ASYNC_CALLBACKS", "True")
 
 application = get_asgi_application()
@@ -0,0 +1,16 @@
+"""
+Database helpers shared by the apps.
+"""
+
+from django.db import connections, router
+
+
+def upsert_unique_fields(model, fields):
+    """
+    ``unique_fields`` for a ``bulk_create(update_conflicts=True)`` of ``model``.
+
+    MySQL's ON DUPLICATE KEY UPDATE takes no conflict target, so on backends
+    that can't name one this is None and any unique key decides the conflict.
+    """
+    connection = connections[router.db_for_write(model)]
+    return list(fields) if connection.features.supports_update_conflicts_with_target else None
@@ -0,0 +1,97 @@
+"""
+Primary/replica database routing.
+
+Everything goes to ``default`` (the primary) except reads of the chat history
+models made inside a view decorated with ``replica_reads``; those go to one of
+``DATABASE_REPLICAS``. Users, sessions and OAuth state are always read from
+the primary.
+
+After a user writes (``pin_to_primary``), a session flag keeps their history
+reads on the primary for ``REPLICA_STICKY_SECONDS`` so they see their own
+writes despite replication lag.
+"""
+
+import contextvars
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY = DEFAULT_DB_ALIAS
+STICKY_SESSION_KEY = '_db_primary_until'
+
+# Models whose reads may be served by a replica.
+REPLICA_MODELS = frozenset({
+    'oauth.chatconversation',
+    'oauth.chatmessage',
+    'oauth.messagesearchterm',
+    'oauth.archivedconversation',
+})
+
+_read_alias = contextvars.ContextVar('db_read_alias', default=None)
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias and model._meta.label_lower in REPLICA_MODELS:
+            return alias
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+def pin_to_primary(request):
+    """
+    Keep this user's history reads on the primary for a few seconds after
+    a write. Only touches the session when replicas are configured.
+    """
+    if not _replicas() or not hasattr(request, 'session'):
+        return
+    now = time.time()
+    # Skip the session write while the current pin still has most of its window left.
+    if request.session.get(STICKY_SESSION_KEY, 0) - now > _sticky_seconds() / 2:
+        return
+    request.session[STICKY_SESSION_KEY] = now + _sticky_seconds()
+
+
+def _replica_for(request):
+    replicas = _replicas()
+    if not replicas:
+        return None
+    session = getattr(request, 'session', None)
+    if session is not None and session.get(STICKY_SESSION_KEY, 0) > time.time():
+        return None
+    return random.choice(replicas)
+
+
+def replica_reads(view):
+    """
+    Serve the chat history reads made by ``view`` from a replica.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        alias = _replica_for(request)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapped
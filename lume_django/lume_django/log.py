@@ -0,0 +1,155 @@
+"""
+Logging helpers for the Lume backend.
+
+Provides a JSON formatter, a per-logger sampling filter and a queue handler
+that hands records to a background ``QueueListener`` so that formatting,
+file writes and network I/O never happen on the request thread.
+
+Wired up through ``LOGGING`` in settings.py.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from logging.config import ConvertingList
+
+# Attributes present on every LogRecord; anything else came in via ``extra``.
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Render each record as a single-line JSON object.
+
+    Fields passed through ``extra={...}`` are emitted as top-level keys.
+    """
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of low-severity records per logger.
+
+    ``rates`` maps a logger name prefix to the fraction of records to keep
+    (``1.0`` keeps everything, ``0.0`` drops everything), either as a dict or
+    as a ``"name=rate,..."`` string. The longest matching prefix wins.
+    Records at ``min_level`` or above are never dropped.
+    """
+
+    def __init__(self, rates=None, default_rate=1.0, min_level=logging.WARNING):
+        super().__init__()
+        if isinstance(rates, str):
+            rates = parse_sample_rates(rates)
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.min_level = min_level
+        self._cache = {}
+
+    def _rate_for(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = self.default_rate
+            best = -1
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > best:
+                    rate, best = prefix_rate, len(prefix)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= self.min_level:
+            return True
+        rate = self._rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        return rate > 0.0 and random.random() < rate
+
+
+def _resolve_handlers(handlers):
+    # dictConfig hands us a ConvertingList of 'cfg://handlers.x' strings;
+    # indexing it resolves each entry to the already-configured handler.
+    if not isinstance(handlers, ConvertingList):
+        return list(handlers)
+    return [handlers[i] for i in range(len(handlers))]
+
+
+class QueueListenerHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking handler: enqueue on the caller's thread, emit on a listener thread.
+
+    The wrapped handlers (file, socket, console, ...) are driven by a
+    ``QueueListener`` that is started on construction and stopped at exit.
+    """
+
+    def __init__(self, handlers, respect_handler_level=True, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.listener = logging.handlers.QueueListener(
+            self.queue,
+            *_resolve_handlers(handlers),
+            respect_handler_level=respect_handler_level,
+        )
+        self.listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        # Merge args into the message and render tracebacks once, here, so the
+        # record is safe to hand to another thread. Unlike the stdlib version
+        # this does not run the formatter, which is left to the listener.
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging; drop the record instead.
+            pass
+
+    def close(self):
+        listener = getattr(self, 'listener', None)
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+        super().close()
+
+
+def parse_sample_rates(value):
+    """
+    Parse ``"oauth.views=0.1,service_detector=0.5"`` into a rates dict.
+    """
+    rates = {}
+    for item in (value or '').split(','):
+        name, sep, rate = item.partition('=')
+        if sep and name.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def mapping_keys(mapping):
+    """
+    Return the sorted keys of a mapping, for debug output that must not leak values.
+    """
+    return sorted(mapping.keys())
@@ -0,0 +1,396 @@
+"""
+Request and Google API metrics in the Prometheus text format.
+
+``MetricsMiddleware`` records, per URL name (``oauth:send_message``,
+``detect_services``, ...):
+
+- ``lume_http_requests_total`` by method and status;
+- ``lume_http_request_duration_seconds``: time until the view returned (for
+  streaming responses, until the stream started);
+- ``lume_http_response_size_bytes`` (not for streaming responses);
+- ``lume_http_db_queries`` and ``lume_http_db_seconds``: queries per request
+  and their total time, over every database alias.
+
+Outbound Google calls are recorded by integrations.google_api and
+integrations.quota (``lume_google_api_*``).
+
+Samples are aggregated in process and shared between worker processes
+through the store selected by ``METRICS_STORE``:
+
+- ``local``: this process only.
+- ``files``: each process writes its totals to ``METRICS_DIR`` at most every
+  ``METRICS_FLUSH_SECONDS``; a scrape adds up every process's file.
+- ``redis``: each process adds what it recorded since the last flush to one
+  Redis hash (``REDIS_URL``).
+
+``/metrics`` serves the totals to staff users, or to scrapers presenting
+``Authorization: Bearer <METRICS_TOKEN>``.
+"""
+
+import hmac
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (128, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'lume_http_requests_total': ('counter', 'Requests by URL name, method and status', None),
+    'lume_http_request_duration_seconds': ('histogram', 'Time until the view returned', DURATION_BUCKETS),
+    'lume_http_response_size_bytes': ('histogram', 'Response body size', SIZE_BUCKETS),
+    'lume_http_db_queries': ('histogram', 'Database queries per request', QUERY_BUCKETS),
+    'lume_http_db_seconds': ('histogram', 'Database time per request', DURATION_BUCKETS),
+    'lume_google_api_request_duration_seconds': ('histogram', 'Google API calls by API and status', DURATION_BUCKETS),
+    'lume_google_api_calls_total': ('counter', 'Google API HTTP requests', None),
+    'lume_google_api_errors_total': ('counter', 'Google API error responses', None),
+    'lume_google_api_throttled_total': ('counter', 'Google API calls answered as rate limited', None),
+    'lume_google_api_retries_total': ('counter', 'Google API calls retried after backoff', None),
+    'lume_google_api_paced_total': ('counter', 'Google API calls that waited for client-side quota', None),
+    'lume_google_api_paced_seconds_total': ('counter', 'Time spent waiting for client-side quota', None),
+    'lume_google_api_rejected_total': ('counter', 'Google API calls refused by client-side quota', None),
+    'lume_google_api_seconds_total': ('counter', 'Time spent in Google API HTTP requests', None),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _le(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+class Registry:
+    """This process's samples: one float per exposition line, keyed by the line's name and labels"""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = name + _labels(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        suffix = _labels(labels)[1:-1]
+        prefix = '{' + suffix + ',' if suffix else '{'
+        with self._lock:
+            samples = self._samples
+            # Every bucket is written, so a series always has all of its buckets
+            for bound in (*buckets, math.inf):
+                key = f'{name}_bucket{prefix}le="{_le(bound)}"}}'
+                samples[key] = samples.get(key, 0) + (value <= bound)
+            key = f'{name}_sum{_labels(labels)}'
+            samples[key] = samples.get(key, 0) + value
+            key = f'{name}_count{_labels(labels)}'
+            samples[key] = samples.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+class LocalStore:
+    def flush(self, force=False):
+        pass
+
+    def collect(self):
+        return registry.snapshot()
+
+    def clear(self):
+        registry.clear()
+
+
+class FileStore:
+    """One JSON file of totals per process in ``directory``"""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._flushed_at = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.interval:
+            return
+        self._flushed_at = now
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(path, os.path.join(self.directory, f'metrics-{os.getpid()}.json'))
+
+    def collect(self):
+        self.flush(force=True)
+        totals = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    samples = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for key, value in samples.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def clear(self):
+        registry.clear()
+        for filename in os.listdir(self.directory):
+            if filename.startswith('metrics-'):
+                os.remove(os.path.join(self.directory, filename))
+
+
+class RedisStore:
+    """Totals of all processes in one Redis hash, flushed as increments"""
+
+    key = 'lume:metrics'
+
+    def __init__(self, url, interval):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.interval = interval
+        self._flushed = {}
+        self._flushed_at = 0
+        self._lock = threading.Lock()
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.interval:
+            return
+        with self._lock:
+            self._flushed_at = now
+            samples = registry.snapshot()
+            pipe = self._redis.pipeline(transaction=False)
+            for key, value in samples.items():
+                delta = value - self._flushed.get(key, 0)
+                if delta:
+                    pipe.hincrbyfloat(self.key, key, delta)
+            pipe.execute()
+            self._flushed = samples
+
+    def collect(self):
+        self.flush(force=True)
+        return {key.decode(): float(value) for key, value in self._redis.hgetall(self.key).items()}
+
+    def clear(self):
+        registry.clear()
+        self._flushed = {}
+        self._redis.delete(self.key)
+
+
+_store = None
+
+
+def get_store():
+    """The configured metrics store, created on first use"""
+    global _store
+    if _store is None:
+        backend = getattr(settings, 'METRICS_STORE', 'local')
+        interval = getattr(settings, 'METRICS_FLUSH_SECONDS', 5)
+        if backend == 'redis':
+            _store = RedisStore(settings.REDIS_URL, interval)
+        elif backend == 'files':
+            _store = FileStore(settings.METRICS_DIR, interval)
+        else:
+            _store = LocalStore()
+    return _store
+
+
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting in ('METRICS_STORE', 'METRICS_DIR'):
+        _store = None
+
+
+setting_changed.connect(_reset_store)
+
+
+def render(samples):
+    """Samples as Prometheus text, grouped by metric with HELP and TYPE lines"""
+    families = {}
+    for key, value in samples.items():
+        name = key.split('{', 1)[0]
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                family = name[:-len(suffix)]
+        families.setdefault(family, []).append((key, value))
+
+    def order(sample):
+        # Buckets of one series together, in ascending order
+        key = sample[0]
+        if '_bucket{' not in key:
+            return key, 0
+        series, _, bound = key.rpartition('le="')
+        return series, float(bound[:-2])
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text, _ = METRICS.get(family, ('untyped', '', None))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for key, value in sorted(families[family], key=order):
+            lines.append(f'{key} {value:.17g}')
+    return '\n'.join(lines) + '\n'
+
+
+# Per-request database accounting
+
+class _RequestStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Context-local, so it follows the request into sync_to_async threads
+_request_stats = ContextVar('lume_request_stats', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def _install(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unmatched>'
+
+
+def _record(request, response, started, stats):
+    view = _view_name(request)
+    observe('lume_http_request_duration_seconds', time.perf_counter() - started, view=view)
+    inc('lume_http_requests_total', view=view, method=request.method, status=response.status_code)
+    if not response.streaming:
+        observe('lume_http_response_size_bytes', len(response.content), view=view)
+    observe('lume_http_db_queries', stats.queries, view=view)
+    observe('lume_http_db_seconds', stats.db_seconds, view=view)
+
+
+def _flush():
+    # File or Redis I/O once per METRICS_FLUSH_SECONDS
+    try:
+        get_store().flush()
+    except Exception:
+        logger.exception("Could not flush metrics")
+
+
+class MetricsMiddleware:
+    """Records latency, size and DB use of every request; place it first in MIDDLEWARE"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        _record(request, response, started, stats)
+        _flush()
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        _record(request, response, started, stats)
+        # Off the event loop; the store's own lock makes flushing thread-safe
+        await sync_to_async(_flush, thread_sensitive=False)()
+        return response
+
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    # Bytes: compare_digest rejects non-ASCII str, and the header is client-supplied
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    if request.method != 'GET':
+        return HttpResponse(status=405)
+    if not _authorized(request):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    response = HttpResponse(render(get_store().collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+    response['Cache-Control'] = 'no-store'
+    return response
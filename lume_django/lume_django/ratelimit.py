@@ -0,0 +1,236 @@
+"""
+Token-bucket rate limiting for the API views.
+
+Limits are configured per endpoint in ``RATE_LIMITS``::
+
+    RATE_LIMITS = {
+        'send_message': {'user': '30/min', 'ip': '60/min'},
+    }
+
+Each rate is ``"<requests>/<period>"`` (``s``, ``min``, ``hour``, ``day``): the
+bucket holds up to ``<requests>`` tokens and refills continuously. Views are
+wrapped with ``@rate_limit('<endpoint>')``; a request that finds an empty
+bucket gets a 429 with ``Retry-After``.
+
+Bucket state lives in the store selected by ``RATE_LIMIT_STORE``:
+
+- ``local`` (default): in-process memory. Limits apply per worker process,
+  and it costs a few microseconds.
+- ``redis``: shared across workers, one round trip per bucket. Needs
+  ``REDIS_URL`` and the redis package; settings refuse to load without them.
+- ``db``: shared across workers through the RateLimitBucket table, for
+  deployments without Redis. Costs a transaction per bucket.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+
+from .responses import json_response
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+_RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*$')
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """Parse ``"30/min"`` into ``(capacity, tokens_per_second)``"""
+    match = _RATE_RE.match(rate.lower())
+    if not match or match.group(3) not in PERIODS:
+        raise ValueError(f"Invalid rate: {rate!r}")
+    count, multiplier, unit = int(match.group(1)), int(match.group(2) or 1), match.group(3)
+    return count, count / (multiplier * PERIODS[unit])
+
+
+def _take(tokens, stamp, now, capacity, refill, cost=1):
+    # Returns (tokens, allowed, retry_after) after trying to take ``cost`` tokens.
+    cost = min(cost, capacity)
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * refill)
+    if tokens >= cost:
+        return tokens - cost, True, 0.0
+    return tokens, False, (cost - tokens) / refill
+
+
+class LocalMemoryStore:
+    """Per-process buckets guarded by a single lock, bounded by LRU eviction"""
+
+    max_keys = 100_000
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (capacity, now))
+            tokens, allowed, retry_after = _take(tokens, stamp, now, capacity, refill, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                # The least recently used bucket goes; it starts full if it comes back.
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseStore:
+    """Buckets in the RateLimitBucket table, updated under a row lock"""
+
+    def take(self, key, capacity, refill, cost=1):
+        from oauth.models import RateLimitBucket
+
+        now = time.time()
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    bucket = RateLimitBucket.objects.select_for_update().filter(key=key).first()
+                    if bucket is None:
+                        tokens, allowed, retry_after = _take(capacity, now, now, capacity, refill, cost)
+                        RateLimitBucket.objects.create(key=key, tokens=tokens, updated_at=now)
+                    else:
+                        tokens, allowed, retry_after = _take(
+                            bucket.tokens, bucket.updated_at, now, capacity, refill, cost,
+                        )
+                        RateLimitBucket.objects.filter(key=key).update(tokens=tokens, updated_at=now)
+                return allowed, retry_after
+            except IntegrityError:
+                # Another worker created the bucket first; retry against its row.
+                continue
+        return True, 0.0
+
+    def clear(self):
+        from oauth.models import RateLimitBucket
+
+        RateLimitBucket.objects.all().delete()
+
+
+_REDIS_TAKE = """
+local bucket = redis.call('HMGET', KEYS[1], 't', 'ts')
+local capacity, refill, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local cost = math.min(tonumber(ARGV[4]), capacity)
+local tokens, stamp = tonumber(bucket[1]) or capacity, tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * refill)
+local allowed, retry_after = 0, 0
+if tokens >= cost then
+    tokens, allowed = tokens - cost, 1
+else
+    retry_after = (cost - tokens) / refill
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisStore:
+    """Buckets in Redis, updated atomically by a Lua script"""
+
+    def __init__(self, url):
+        import redis
+
+        self._script = redis.Redis.from_url(url).register_script(_REDIS_TAKE)
+
+    def take(self, key, capacity, refill, cost=1):
+        allowed, retry_after = self._script(keys=[key], args=[capacity, refill, time.time(), cost])
+        return bool(allowed), float(retry_after)
+
+
+_store = None
+
+
+def get_store():
+    """The configured bucket store, created on first use"""
+    global _store
+    if _store is None:
+        backend = getattr(settings, 'RATE_LIMIT_STORE', 'local')
+        if backend == 'redis':
+            _store = RedisStore(settings.REDIS_URL)
+        elif backend == 'db':
+            _store = DatabaseStore()
+        else:
+            _store = LocalMemoryStore()
+    return _store
+
+
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting == 'RATE_LIMIT_STORE':
+        _store = None
+
+
+setting_changed.connect(_reset_store)
+
+
+def client_ip(request):
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header and header in request.META:
+        # X-Forwarded-For style: the left-most address is the client.
+        return request.META[header].split(',', 1)[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate_limit(request, name):
+    """
+    Take a token from each of the request's buckets for endpoint ``name``.
+
+    Returns the number of seconds to wait, or 0 if the request may proceed.
+    Buckets are taken from in ``RATE_LIMITS`` order and the first one that
+    rejects ends the check, so a throttled user does not also drain the
+    per-IP bucket shared with everyone behind the same NAT.
+    """
+    if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return 0
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(name)
+    if not limits:
+        return 0
+
+    store = get_store()
+    for scope, rate in limits.items():
+        if scope == 'user':
+            user = getattr(request, 'user', None)
+            if user is None or not user.is_authenticated:
+                continue
+            ident = user.pk
+        else:
+            ident = client_ip(request)
+        allowed, retry_after = store.take(f"rl:{name}:{scope}:{ident}", *parse_rate(rate))
+        if not allowed:
+            return retry_after
+    return 0
+
+
+def rate_limit(name):
+    """
+    Apply the ``RATE_LIMITS[name]`` buckets to a view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            wait = check_rate_limit(request, name)
+            if wait:
+                retry_after = max(1, math.ceil(wait))
+                logger.info("Rate limited %s for %s", name, client_ip(request))
+                response = json_response(request, {
+                    'error': 'Rate limit exceeded',
+                    'retry_after': retry_after,
+                }, status=429)
+                response['Retry-After'] = str(retry_after)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,149 @@
+"""
+Shared JSON response layer for the API views.
+
+- Encodes with orjson when it is installed (stdlib json otherwise). Datetimes
+  are passed through as-is and encoded by the serializer in ISO 8601, so views
+  do not call ``.isoformat()`` per field.
+- Compresses bodies above ``API_COMPRESSION_MIN_BYTES`` with brotli (when the
+  ``brotli`` package is installed) or gzip, according to Accept-Encoding.
+- ``stream_json_response`` encodes a list field item by item, so large message
+  histories are never materialized as one big Python structure.
+"""
+
+import datetime
+import gzip
+import json
+import re
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional speedup
+    brotli = None
+
+STREAM_CHUNK_BYTES = 16 * 1024
+
+_ACCEPT_ENCODING_RE = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?')
+
+
+class _Encoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dumps(data):
+    """Serialize ``data`` to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=_Encoder, separators=(',', ':')).encode()
+
+
+def _min_bytes():
+    return getattr(settings, 'API_COMPRESSION_MIN_BYTES', 1024)
+
+
+def negotiate_encoding(request):
+    """Pick ``br``, ``gzip`` or None from the request's Accept-Encoding"""
+    accepted = {}
+    for match in _ACCEPT_ENCODING_RE.finditer(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        coding, quality = match.group(1).lower(), match.group(2)
+        try:
+            accepted[coding] = float(quality) if quality is not None else 1.0
+        except ValueError:
+            continue
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def _set_encoding(response, encoding):
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if encoding:
+        response['Content-Encoding'] = encoding
+
+
+def json_response(request, data, status=200):
+    """
+    Drop-in replacement for ``JsonResponse(data, status=status)``.
+    """
+    content = dumps(data)
+    encoding = negotiate_encoding(request) if len(content) >= _min_bytes() else None
+    if encoding == 'br':
+        content = brotli.compress(content, quality=5)
+    elif encoding == 'gzip':
+        content = gzip.compress(content, compresslevel=6)
+
+    response = HttpResponse(content, status=status, content_type='application/json')
+    _set_encoding(response, encoding)
+    return response
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        return compressor.process, compressor.finish
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+        return compressor.compress, compressor.flush
+    return None
+
+
+def _json_chunks(head, key, items, encode_item):
+    # {"...head...", "<key>": [item, item, ...]}
+    prefix = dumps(head)[:-1]
+    yield prefix + (b',' if len(prefix) > 1 else b'') + dumps(key) + b':['
+    for index, item in enumerate(items):
+        yield (b',' if index else b'') + dumps(encode_item(item))
+    yield b']}'
+
+
+def _buffered(chunks, size):
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _compressed(chunks, encoding):
+    compress, finish = _compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def stream_json_response(request, head, key, items, encode_item, status=200):
+    """
+    Stream ``{**head, key: [encode_item(item) for item in items]}`` as JSON.
+
+    Items are encoded one at a time and written out in ~16 KB chunks,
+    compressed on the fly when the client accepts it.
+    """
+    chunks = _buffered(_json_chunks(head, key, items, encode_item), STREAM_CHUNK_BYTES)
+    # The total size is unknown up front, so compress whenever the client accepts it.
+    encoding = negotiate_encoding(request)
+    if encoding:
+        chunks = _compressed(chunks, encoding)
+
+    response = StreamingHttpResponse(chunks, status=status, content_type='application/json')
+    _set_encoding(response, encoding)
+    return response
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
+import tempfile
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,15 +51,20 @@ INSTALLED_APPS = [
     'corsheaders',
     'service_detector',
     'oauth',
+    'integrations',
+    'jobs',
+    'profiling',
 ]
 
 MIDDLEWARE = [
+    "lume_django.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "profiling.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -100,6 +108,27 @@ DATABASES = {
     }
 }
 
+# Read replicas for chat history reads: comma-separated host[:port] list,
+# sharing the primary's credentials unless DB_REPLICA_USER/PASSWORD are set.
+DATABASE_REPLICAS = []
+for _index, _address in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    _host, _, _port = _address.strip().partition(':')
+    _alias = f"replica{_index + 1}"
+    DATABASES[_alias] = {
+        **DATABASES["default"],
+        "HOST": _host,
+        "PORT": _port or DATABASES["default"]["PORT"],
+        "USER": os.getenv('DB_REPLICA_USER') or DATABASES["default"]["USER"],
+        "PASSWORD": os.getenv('DB_REPLICA_PASSWORD') or DATABASES["default"]["PASSWORD"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(_alias)
+
+# Seconds a user's history reads stay on the primary after they write
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+
+DATABASE_ROUTERS = ["lume_django.db_router.PrimaryReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -174,4 +203,194 @@ CSRF_TRUSTED_ORIGINS = [
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET', '')
 GOOGLE_REDIRECT_URI = os.getenv('GOOGLE_REDIRECT_URI', 'http://localhost:8000/oauth/callback/')
+GOOGLE_AUTH_URI = os.getenv('GOOGLE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth')
+GOOGLE_TOKEN_URI = os.getenv('GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token')
+GOOGLE_USERINFO_URI = os.getenv('GOOGLE_USERINFO_URI', 'https://www.googleapis.com/oauth2/v2/userinfo')
+
+# Serve the OAuth callbacks from oauth/async_views.py (set by asgi.py)
+OAUTH_ASYNC_CALLBACKS = os.getenv('OAUTH_ASYNC_CALLBACKS', 'False') == 'True'
+# Pooled HTTP client used by the async callbacks
+GOOGLE_HTTP_TIMEOUT = float(os.getenv('GOOGLE_HTTP_TIMEOUT', '10'))
+GOOGLE_HTTP_MAX_CONNECTIONS = int(os.getenv('GOOGLE_HTTP_MAX_CONNECTIONS', '100'))
+
+# Google API base URLs by API name (gmail, calendar, tasks, keep, people, oauth2);
+# unset APIs use Google's. See integrations/google_api.py.
+# GOOGLE_API_BASE_URL serves them all from one host, e.g. `manage.py fake_google`.
+GOOGLE_API_BASE_URL = os.getenv('GOOGLE_API_BASE_URL', '')
+GOOGLE_API_ENDPOINTS = dict.fromkeys(
+    ('gmail', 'calendar', 'tasks', 'keep', 'people', 'oauth2'), GOOGLE_API_BASE_URL,
+) if GOOGLE_API_BASE_URL else {}
+
+# Client-side quota for Google API calls (integrations/quota.py): calls are paced
+# to stay under these rates, per access token ('user') and across users ('project').
+GOOGLE_API_QUOTA_ENABLED = os.getenv('GOOGLE_API_QUOTA_ENABLED', 'True') == 'True'
+GOOGLE_API_QUOTAS = {
+    'gmail': {'user': '50/s', 'project': '2000/s'},  # 250 quota units/user/s, 5 per messages.get
+    'calendar': {'user': '10/s', 'project': '500/s'},
+    'tasks': {'user': '10/s', 'project': '100/s'},
+    'keep': {'user': '5/s', 'project': '100/s'},
+    'people': {'user': '90/min', 'project': '3000/min'},
+}
+GOOGLE_API_MAX_PACING_WAIT = 2  # seconds a call without a deadline may wait for quota
+GOOGLE_API_MAX_RETRIES = int(os.getenv('GOOGLE_API_MAX_RETRIES', '3'))
+GOOGLE_API_BACKOFF = 0.5  # seconds before the first retry, doubled after each
+GOOGLE_API_BACKOFF_MAX = 8  # longest retry wait for calls without a deadline; a longer Retry-After fails the call
+
+# Google actions run for a chat turn (integrations/actions.py)
+ACTION_DEADLINE_SECONDS = float(os.getenv('ACTION_DEADLINE_SECONDS', '3'))
+ACTION_MAX_WORKERS = int(os.getenv('ACTION_MAX_WORKERS', '16'))
+
+# Local Gmail metadata store (integrations/gmail.py)
+GMAIL_BACKFILL_MESSAGES = int(os.getenv('GMAIL_BACKFILL_MESSAGES', '200'))
+GMAIL_BATCH_SIZE = 50  # Gmail recommends at most 50 calls per batch
+
+# Local Calendar event store (integrations/gcalendar.py)
+CALENDAR_SYNC_PAST_DAYS = int(os.getenv('CALENDAR_SYNC_PAST_DAYS', '30'))
+CALENDAR_SYNC_PAGE_SIZE = int(os.getenv('CALENDAR_SYNC_PAGE_SIZE', '250'))
+
+# Contacts index (integrations/contacts.py), synced in the background after login.
+CONTACTS_SYNC_ON_LOGIN = os.getenv('CONTACTS_SYNC_ON_LOGIN', 'True') == 'True'
+CONTACTS_INDEX_CACHE_USERS = int(os.getenv('CONTACTS_INDEX_CACHE_USERS', '1000'))
+
+# Read-through cache of Tasks and Keep (integrations/readthrough.py): served without
+# revalidating for READTHROUGH_FRESH_SECONDS, within a per-user row and byte budget
+READTHROUGH_FRESH_SECONDS = int(os.getenv('READTHROUGH_FRESH_SECONDS', '60'))
+READTHROUGH_MAX_ENTRIES = int(os.getenv('READTHROUGH_MAX_ENTRIES', '50'))
+READTHROUGH_MAX_BYTES = int(os.getenv('READTHROUGH_MAX_BYTES', str(512 * 1024)))
+
+# Warmup of a user's stores after login and permission grants (integrations/warmup.py).
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'True') == 'True'
+WARMUP_BUDGET_SECONDS = float(os.getenv('WARMUP_BUDGET_SECONDS', '20'))
+WARMUP_FRESH_SECONDS = int(os.getenv('WARMUP_FRESH_SECONDS', '300'))  # skip stores synced this recently
+WARMUP_MAX_WORKERS = int(os.getenv('WARMUP_MAX_WORKERS', '4'))  # concurrent Google calls per worker process
+WARMUP_CALENDAR_PAGES = 2
+
+# Background jobs (jobs/queue.py), run by `manage.py run_jobs` workers.
+# JOBS_EAGER runs them inline at enqueue time
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False') == 'True'
+JOBS_BROKER = os.getenv('JOBS_BROKER', 'db')  # 'db', 'eager' or a dotted path to a Broker
+JOBS_DEFAULT_TIMEOUT = int(os.getenv('JOBS_DEFAULT_TIMEOUT', '60'))  # seconds per attempt
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '3'))
+JOBS_RETRY_BACKOFF = int(os.getenv('JOBS_RETRY_BACKOFF', '10'))  # seconds, doubled per failed attempt
+JOBS_RETRY_BACKOFF_MAX = int(os.getenv('JOBS_RETRY_BACKOFF_MAX', '3600'))
+JOBS_LOCK_GRACE = 30  # seconds past its timeout before a running job counts as abandoned
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
+
+# Request and Google API metrics served at /metrics (lume_django/metrics.py).
+# METRICS_STORE shares them between worker processes: 'local', 'files' (METRICS_DIR) or 'redis'
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_STORE = os.getenv('METRICS_STORE', 'local')
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'lume-metrics'))
+METRICS_FLUSH_SECONDS = 5
+# Scrapers authenticate with "Authorization: Bearer <token>"; staff sessions also work
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Opt-in request profiling (profiling/middleware.py); reports are kept in the admin.
+# Triggered by an X-Lume-Profile token (manage.py profile_token), ?_profile=1 for
+# staff, or at random for PROFILING_SAMPLE_RATE of requests.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILING_TOKEN_MAX_AGE = 3600
+PROFILING_RETENTION_DAYS = int(os.getenv('PROFILING_RETENTION_DAYS', '7'))
+
+# Logging
+# Records from the app loggers are sampled, queued on the request thread and
+# written as JSON by a background listener (see lume_django/log.py).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')  # e.g. "oauth.views=0.1,service_detector=0.5"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'lume_django.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'lume_django.log.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+        'queue': {
+            '()': 'lume_django.log.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console'],
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        'oauth': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'service_detector': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+if LOG_FILE:
+    LOGGING['handlers']['file'] = {
+        'class': 'logging.handlers.WatchedFileHandler',
+        'filename': LOG_FILE,
+        'formatter': 'json',
+    }
+    LOGGING['handlers']['queue']['handlers'].append('cfg://handlers.file')
+
+# Chat history pagination
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', '20'))
+CHAT_MAX_PAGE_SIZE = int(os.getenv('CHAT_MAX_PAGE_SIZE', '100'))
+
+# Cache
+# A shared cache (Redis) lets workers share per-user chat list versions used
+# for conditional GET; without one, versions are read from the database.
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+    CHAT_VERSION_CACHE = 'default'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+    CHAT_VERSION_CACHE = None
+
+# API responses (see lume_django/responses.py)
+API_COMPRESSION_MIN_BYTES = int(os.getenv('API_COMPRESSION_MIN_BYTES', '1024'))
+
+# Rate limiting (see lume_django/ratelimit.py). Rates are "<requests>/<period>".
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE') or 'local'
+# Set to e.g. HTTP_X_FORWARDED_FOR when running behind a trusted proxy
+RATE_LIMIT_IP_HEADER = os.getenv('RATE_LIMIT_IP_HEADER') or None
+RATE_LIMITS = {
+    'send_message': {'user': '30/min', 'ip': '60/min'},
+    'analyze_intent': {'user': '60/min', 'ip': '120/min'},
+    'initiate_oauth': {'ip': '10/min'},
+}
+
+# Redis-backed stores are only used when chosen explicitly; fail now rather
+# than on the first request that reaches them.
+_redis_stores = [name for name in ('RATE_LIMIT_STORE', 'METRICS_STORE') if globals()[name] == 'redis']
+if _redis_stores and not REDIS_URL:
+    raise ImproperlyConfigured(f"{' and '.join(_redis_stores)} = 'redis' needs REDIS_URL")
+if REDIS_URL and importlib.util.find_spec('redis') is None:
+    raise ImproperlyConfigured("REDIS_URL is set but the redis package is not installed (see requirements.txt)")
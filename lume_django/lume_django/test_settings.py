@@ -0,0 +1,20 @@
+"""
+Settings for running the test suite:
+
+    python manage.py test --settings=lume_django.test_settings
+
+Other runners pick them up through DJANGO_SETTINGS_MODULE.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# A second, never-replicated database standing in for a replica, so tests can
+# tell which database a read was served from.
+DATABASES = {
+    **DATABASES,
+    "replica": {
+        **DATABASES["default"],
+        "TEST": {"NAME": f"test_{DATABASES['default']['NAME']}_replica"},
+    },
+}
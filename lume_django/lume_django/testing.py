@@ -0,0 +1,29 @@
+"""
+Base test cases for the project's test suites.
+
+Test logins carry made-up tokens and every test request comes from the same
+client IP. So these cases switch off what would reach Google or throttle the
+suite: contacts sync and warmup after login, the client-side Google quota and
+rate limiting. Background jobs run inline. Tests covering those features turn
+them back on with override_settings.
+"""
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+suite_settings = override_settings(
+    CONTACTS_SYNC_ON_LOGIN=False,
+    WARMUP_ENABLED=False,
+    GOOGLE_API_QUOTA_ENABLED=False,
+    RATE_LIMIT_ENABLED=False,
+    JOBS_EAGER=True,
+)
+
+
+@suite_settings
+class LumeTestCase(TestCase):
+    pass
+
+
+@suite_settings
+class LumeTransactionTestCase(TransactionTestCase):
+    pass
@@ -17,8 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path('', include('oauth.urls')),
+    path('', include('integrations.urls')),
     path('api/service-detector/', include('service_detector.urls')),
 ]
@@ -0,0 +1,118 @@
+"""
+Account provisioning for the OAuth callbacks.
+
+Each callback writes everything it needs in a single transaction: the user row
+(saving only the columns that changed), the granted permission rows (one bulk
+upsert) and the consumption of the OAuth state (a conditional UPDATE, so a
+state can only ever be spent once).
+"""
+
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from lume_django.db import upsert_unique_fields
+from .models import User, OAuthState, ServicePermissionRequest
+
+
+class OAuthStateConsumed(Exception):
+    """Raised when an OAuth state was already used by a concurrent request."""
+
+
+def consume_oauth_state(oauth_state, **fields):
+    """
+    Atomically flip ``used`` from False to True for a state.
+
+    Extra ``fields`` are written in the same UPDATE. Raises OAuthStateConsumed
+    if another request got there first.
+    """
+    claimed = OAuthState.objects.filter(pk=oauth_state.pk, used=False).update(used=True, **fields)
+    if not claimed:
+        raise OAuthStateConsumed(oauth_state.state)
+    oauth_state.used = True
+    for name, value in fields.items():
+        setattr(oauth_state, name, value)
+
+
+def _token_fields(credentials):
+    fields = {
+        'access_token': credentials.token,
+        'token_expires_at': credentials.expiry,
+        'granted_scopes': json.dumps(credentials.scopes or []),
+    }
+    if credentials.refresh_token:
+        fields['refresh_token'] = credentials.refresh_token
+    return fields
+
+
+def provision_google_user(oauth_state, user_info, credentials):
+    """
+    Create or update the user for a Google login and spend the OAuth state.
+
+    Returns ``(user, created)``.
+    """
+    fields = _token_fields(credentials)
+    fields['profile_picture'] = user_info.get('picture')
+    fields['last_login_at'] = timezone.now()
+
+    with transaction.atomic():
+        user = User.objects.filter(google_id=user_info['id']).first()
+        created = user is None
+        if created:
+            user = User(
+                google_id=user_info['id'],
+                username=user_info['email'].split('@')[0],
+                email=user_info['email'],
+                **fields
+            )
+            user.save(force_insert=True)
+        else:
+            for name, value in fields.items():
+                setattr(user, name, value)
+            user.save(update_fields=[*fields, 'updated_at'])
+
+        consume_oauth_state(oauth_state, user=user)
+
+    return user, created
+
+
+def _upsert_permission_requests(user, services, granted_at):
+    rows = [
+        ServicePermissionRequest(user=user, service_name=service, is_granted=True, granted_at=granted_at)
+        for service in services
+    ]
+    if not rows:
+        return
+
+    ServicePermissionRequest.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=upsert_unique_fields(ServicePermissionRequest, ['user', 'service_name']),
+        update_fields=['is_granted', 'granted_at'],
+    )
+
+
+def grant_service_permissions(oauth_state, credentials):
+    """
+    Store refreshed tokens and the granted service permissions for a user.
+
+    Returns the list of services that were granted.
+    """
+    user = oauth_state.user
+    fields = _token_fields(credentials)
+    services = [
+        service for service, enabled in oauth_state.get_requested_services().items()
+        if enabled and service in User.SERVICE_PERMISSION_FIELDS
+    ]
+    for service in services:
+        fields[User.SERVICE_PERMISSION_FIELDS[service]] = True
+
+    with transaction.atomic():
+        consume_oauth_state(oauth_state)
+        for name, value in fields.items():
+            setattr(user, name, value)
+        user.save(update_fields=[*fields, 'updated_at'])
+        _upsert_permission_requests(user, services, timezone.now())
+
+    return services
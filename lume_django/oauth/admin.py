@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, OAuthState, ChatConversation, ChatMessage, ServicePermissionRequest
+from .models import User, OAuthState, ChatConversation, ChatMessage, ServicePermissionRequest, ArchivedConversation
+from .archive import rehydrate_conversation
+from .search import filter_messages
 
 
 @admin.register(User)
@@ -28,24 +30,56 @@ class OAuthStateAdmin(admin.ModelAdmin):
 
 @admin.register(ChatConversation)
 class ChatConversationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'get_message_count', 'created_at', 'updated_at', 'is_active')
-    list_filter = ('is_active', 'created_at')
+    list_display = ('title', 'user', 'message_count_display', 'created_at', 'updated_at', 'is_active')
+    list_filter = ('is_active', 'is_archived', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('title', 'user__email')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'message_count', 'last_message_at', 'is_archived')
+    
+    actions = ['rehydrate']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_message_counts()
+    
+    @admin.action(description='Rehydrate archived messages')
+    def rehydrate(self, request, queryset):
+        for conversation in queryset.filter(is_archived=True):
+            rehydrate_conversation(conversation)
+    
+    def message_count_display(self, obj):
+        return obj.get_message_count()
+    message_count_display.short_description = 'Messages'
+    message_count_display.admin_order_field = 'message_count'
 
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     list_display = ('conversation', 'role', 'content_preview', 'timestamp')
     list_filter = ('role', 'timestamp')
-    search_fields = ('content', 'conversation__title')
+    list_select_related = ('conversation',)
+    # Message content is matched through the search index, see get_search_results
+    search_fields = ('conversation__title',)
     readonly_fields = ('timestamp',)
     
+    def get_search_results(self, request, queryset, search_term):
+        title_matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return title_matches, may_have_duplicates
+        return filter_messages(queryset, search_term) | title_matches, may_have_duplicates
+    
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content'
 
 
+@admin.register(ArchivedConversation)
+class ArchivedConversationAdmin(admin.ModelAdmin):
+    list_display = ('conversation', 'message_count', 'raw_bytes', 'compressed_bytes', 'archived_at')
+    list_select_related = ('conversation',)
+    exclude = ('messages_blob',)
+    readonly_fields = ('conversation', 'message_count', 'raw_bytes', 'compressed_bytes', 'archived_at')
+
+
 @admin.register(ServicePermissionRequest)
 class ServicePermissionRequestAdmin(admin.ModelAdmin):
     list_display = ('user', 'service_name', 'is_granted', 'requested_at', 'granted_at')
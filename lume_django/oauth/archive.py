@@ -0,0 +1,137 @@
+"""
+Hot/cold tiering for chat history.
+
+Messages of inactive conversations are moved out of ``oauth_chatmessage`` into
+a single zlib-compressed JSON blob per conversation (ArchivedConversation).
+Opening an archived thread reads the blob directly; writing to it rehydrates
+the rows first. ``manage.py archive_conversations`` runs the migration.
+
+Archived messages are not searchable: their search index entries (or FULLTEXT
+rows on MySQL) go with the deleted rows, and come back when the conversation
+is rehydrated.
+"""
+
+import json
+import zlib
+from datetime import datetime
+
+from django.db import router, transaction
+from django.db.models import Q
+
+from .models import ArchivedConversation, ChatConversation, ChatMessage
+from .search import index_messages
+
+COMPRESSION_LEVEL = 9
+
+
+def archivable_conversations(cutoff):
+    """Conversations that are inactive or untouched since ``cutoff``"""
+    return ChatConversation.objects.filter(is_archived=False).filter(
+        Q(is_active=False) | Q(updated_at__lt=cutoff)
+    )
+
+
+def _message_to_dict(message):
+    return {
+        'id': message.id,
+        'role': message.role,
+        'content': message.content,
+        'detected_services': message.detected_services,
+        'response_metadata': message.response_metadata,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def _message_from_dict(conversation, data):
+    return ChatMessage(
+        id=data['id'],
+        conversation=conversation,
+        role=data['role'],
+        content=data['content'],
+        detected_services=data['detected_services'],
+        response_metadata=data['response_metadata'],
+        timestamp=datetime.fromisoformat(data['timestamp']),
+    )
+
+
+def archive_conversation(conversation, cutoff=None):
+    """
+    Move a conversation's messages into cold storage.
+
+    Eligibility is checked again with the conversation row locked: it is
+    skipped if a turn was recorded since it was loaded, or if it is no longer
+    archivable at ``cutoff``. Returns the ArchivedConversation, or None if
+    there was nothing to move.
+    """
+    db = router.db_for_write(ChatMessage)
+    with transaction.atomic(using=db):
+        candidates = ChatConversation.objects.using(db).filter(is_archived=False)
+        if cutoff is not None:
+            candidates = archivable_conversations(cutoff).using(db)
+        locked = candidates.select_for_update().filter(
+            pk=conversation.pk, last_message_at=conversation.last_message_at,
+        ).first()
+        if locked is None:
+            return None
+
+        messages = list(
+            ChatMessage.objects.using(db).select_for_update()
+            .filter(conversation=conversation).order_by('timestamp', 'id')
+        )
+        if not messages:
+            return None
+
+        raw = json.dumps([_message_to_dict(message) for message in messages], separators=(',', ':')).encode()
+        blob = zlib.compress(raw, COMPRESSION_LEVEL)
+        archive = ArchivedConversation.objects.using(db).create(
+            conversation=conversation,
+            messages_blob=blob,
+            message_count=len(messages),
+            raw_bytes=len(raw),
+            compressed_bytes=len(blob),
+        )
+        ChatMessage.objects.using(db).filter(conversation=conversation).delete()
+        # Not an activity bump, so updated_at is left alone.
+        ChatConversation.objects.using(db).filter(pk=conversation.pk).update(
+            is_archived=True, message_count=len(messages)
+        )
+
+    conversation.is_archived = True
+    conversation.message_count = len(messages)
+    return archive
+
+
+def load_archived_messages(conversation):
+    """
+    Read an archived conversation's messages, oldest first, without rehydrating them.
+    """
+    archive = ArchivedConversation.objects.get(conversation=conversation)
+    data = json.loads(zlib.decompress(bytes(archive.messages_blob)))
+    return [_message_from_dict(conversation, item) for item in data]
+
+
+def rehydrate_conversation(conversation):
+    """
+    Move an archived conversation's messages back into ChatMessage.
+    """
+    db = router.db_for_write(ChatMessage)
+    with transaction.atomic(using=db):
+        try:
+            archive = ArchivedConversation.objects.using(db).select_for_update().get(conversation=conversation)
+        except ArchivedConversation.DoesNotExist:
+            return
+        messages = [
+            _message_from_dict(conversation, item)
+            for item in json.loads(zlib.decompress(bytes(archive.messages_blob)))
+        ]
+        timestamps = [message.timestamp for message in messages]
+        ChatMessage.objects.using(db).bulk_create(messages)
+        # auto_now_add overwrote the original timestamps on insert
+        for message, timestamp in zip(messages, timestamps):
+            message.timestamp = timestamp
+        ChatMessage.objects.using(db).bulk_update(messages, ['timestamp'])
+        index_messages(messages, conversation.user_id, db)
+        archive.delete()
+        ChatConversation.objects.using(db).filter(pk=conversation.pk).update(is_archived=False)
+
+    conversation.is_archived = False
@@ -0,0 +1,37 @@
+"""
+Assistant reply generation.
+
+Replies are produced as a stream of tokens so that views can forward them to
+the client as they are generated. Until the AI integration lands, replies are
+composed from the results of the Google actions (integrations.actions), or a
+fixed placeholder when no action ran.
+"""
+
+import asyncio
+import re
+
+from integrations.actions import describe
+
+_TOKEN_RE = re.compile(r'\S+\s*')
+
+
+def generate_reply_tokens(detected_services, actions=None):
+    """
+    Yield the assistant reply for a message, one token at a time.
+    """
+    # TODO: Process message with AI
+    if actions:
+        reply = ' '.join(describe(service, result) for service, result in actions.items())
+    else:
+        services = ', '.join([k for k, v in detected_services.items() if v])
+        reply = f"I detected the following services: {services}. Integration with Google APIs is pending."
+    yield from _TOKEN_RE.findall(reply)
+
+
+async def agenerate_reply_tokens(detected_services, actions=None):
+    """
+    Async counterpart of generate_reply_tokens for ASGI deployments.
+    """
+    for token in generate_reply_tokens(detected_services, actions):
+        yield token
+        await asyncio.sleep(0)
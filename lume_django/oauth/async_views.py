@@ -0,0 +1,85 @@
+"""
+Async OAuth callbacks for ASGI deployments (see OAUTH_ASYNC_CALLBACKS).
+
+The Google round trips go through the pooled client in google_async, so a
+worker's event loop keeps serving other requests while a login waits on
+Google. The few DB writes run through sync_to_async in a single hop.
+
+Django 4.2's csrf_exempt and require_http_methods wrap views in sync
+functions, so the method is checked inline. These are GET-only views and CSRF
+does not apply to GET.
+"""
+
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseNotAllowed
+from django.shortcuts import redirect
+
+from integrations.jobs import warm_up_later
+
+from . import google_async
+from .accounts import grant_service_permissions
+from .models import OAuthState
+from .views import complete_google_login
+
+logger = logging.getLogger(__name__)
+
+
+async def oauth_callback(request):
+    """
+    Handle OAuth callback and create/login user (async)
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        state = request.GET.get('state')
+        code = request.GET.get('code')
+        error = request.GET.get('error')
+
+        if error:
+            return redirect(f"{settings.FRONTEND_URL}?error={error}")
+
+        if not state or not code:
+            return redirect(f"{settings.FRONTEND_URL}?error=missing_parameters")
+
+        try:
+            oauth_state = await OAuthState.objects.only('id', 'state', 'requested_services').aget(
+                state=state, used=False
+            )
+        except OAuthState.DoesNotExist:
+            return redirect(f"{settings.FRONTEND_URL}?error=invalid_state")
+
+        credentials = await google_async.exchange_code(code)
+        user_info = await google_async.fetch_userinfo(credentials)
+
+        return await sync_to_async(complete_google_login)(request, oauth_state, user_info, credentials)
+
+    except Exception as e:
+        logger.error("OAuth callback error: %s", e)
+        return redirect(f"{settings.FRONTEND_URL}?error=auth_failed")
+
+
+async def service_permission_callback(request):
+    """
+    Handle callback for service-specific permissions (async)
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        state = request.GET.get('state')
+        code = request.GET.get('code')
+
+        oauth_state = await OAuthState.objects.select_related('user').aget(state=state, used=False)
+
+        credentials = await google_async.exchange_code(code)
+
+        services = await sync_to_async(grant_service_permissions)(oauth_state, credentials)
+        await sync_to_async(warm_up_later)(oauth_state.user, services, granted=True)
+
+        return redirect(f"{settings.FRONTEND_URL}?service_perms_granted=true")
+
+    except Exception as e:
+        logger.error("Service permission callback error: %s", e)
+        return redirect(f"{settings.FRONTEND_URL}?error=service_perm_failed")
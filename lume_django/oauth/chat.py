@@ -0,0 +1,115 @@
+"""
+Chat persistence service.
+
+A chat turn is written in one transaction, after detection has run: a new
+conversation is inserted (an existing one is locked against archiving), both
+messages go in with a single bulk INSERT, and the conversation is bumped with
+a single UPDATE that also maintains its denormalized message stats. On
+databases without FULLTEXT support the messages are added to the search index
+in the same transaction.
+
+MySQL returns no ids from a bulk INSERT, so there the messages are inserted
+one by one; see ``_insert_messages``.
+"""
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .archive import rehydrate_conversation
+from .assistant import generate_reply_tokens
+from .conditional import bump_conversation_list_version
+from .models import ChatConversation, ChatMessage
+from .search import index_messages
+
+
+def get_or_start_conversation(user, conversation_id, title):
+    """
+    Return the user's conversation with ``conversation_id``, or start a new one.
+
+    Nothing is written here: a new conversation is returned unsaved and
+    inserted by ``record_turn`` along with its first messages.
+    """
+    if conversation_id:
+        try:
+            return ChatConversation.objects.get(id=conversation_id, user=user)
+        except ChatConversation.DoesNotExist:
+            pass
+    return ChatConversation(user=user, title=title[:50], message_count=0)
+
+
+def missing_permissions(user, detected_services):
+    """
+    List the detected services the user has not granted access to yet.
+    """
+    return [
+        service for service, detected in detected_services.items()
+        if detected and not user.has_service_permission(service)
+    ]
+
+
+def build_assistant_reply(detected_services, actions=None):
+    """
+    Assistant reply for a turn, from the results of its Google actions.
+    """
+    return ''.join(generate_reply_tokens(detected_services, actions))
+
+
+def _insert_messages(messages, using):
+    # Backends without RETURNING (MySQL) leave pk unset after bulk_create, and
+    # the two messages of a turn can share a timestamp on a coarse clock, so
+    # nothing identifies the rows afterwards. LAST_INSERT_ID() plus the row
+    # count is only safe with consecutive auto-increment values, which InnoDB's
+    # default interleaved lock mode (and auto_increment_increment > 1) does not
+    # promise. So MySQL costs one INSERT per message.
+    if connections[using].features.can_return_rows_from_bulk_insert:
+        ChatMessage.objects.using(using).bulk_create(messages)
+    else:
+        for message in messages:
+            message.save(using=using)
+
+
+def record_turn(conversation, content, detected_services, assistant_content=None):
+    """
+    Persist a user message (and the assistant reply, if any) for a conversation.
+
+    An unsaved conversation (from ``get_or_start_conversation``) is inserted
+    in the same transaction. Returns ``(user_message, assistant_message)``;
+    ``assistant_message`` is None when no reply was given.
+    """
+    user_message = ChatMessage(conversation=conversation, role='user', content=content)
+    user_message.set_detected_services(detected_services)
+    messages = [user_message]
+
+    assistant_message = None
+    if assistant_content is not None:
+        assistant_message = ChatMessage(conversation=conversation, role='assistant', content=assistant_content)
+        messages.append(assistant_message)
+
+    db = router.db_for_write(ChatMessage)
+    with transaction.atomic(using=db):
+        if conversation.pk is None:
+            conversation.save(using=db)
+        else:
+            # Lock the conversation so an archive run can't move it to cold
+            # storage between the caller's is_archived check and these writes.
+            archived = ChatConversation.objects.using(db).select_for_update().filter(
+                pk=conversation.pk
+            ).values_list('is_archived', flat=True).get()
+            if archived:
+                rehydrate_conversation(conversation)
+        _insert_messages(messages, db)
+        index_messages(messages, conversation.user_id, db)
+        updated_at = timezone.now()
+        ChatConversation.objects.using(db).filter(pk=conversation.pk).update(
+            updated_at=updated_at,
+            last_message_at=messages[-1].timestamp,
+            message_count=F('message_count') + len(messages),
+        )
+
+    bump_conversation_list_version(conversation.user_id)
+    conversation.updated_at = updated_at
+    conversation.last_message_at = messages[-1].timestamp
+    if conversation.message_count is not None:
+        conversation.message_count += len(messages)
+    return user_message, assistant_message
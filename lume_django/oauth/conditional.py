@@ -0,0 +1,122 @@
+"""
+Validators for conditional GET on the user and chat history endpoints.
+
+Each validator costs at most one indexed lookup (or a cache hit), so an
+unchanged resource is answered with 304 Not Modified without loading rows or
+serializing JSON. Used with ``django.views.decorators.http.condition``.
+
+ETags are weak because the same representation may be sent gzip- or
+brotli-encoded. Last-Modified only has one-second resolution; clients should
+prefer the ETag, which Django checks first when both are sent.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router
+from django.db.models import Count, Max
+
+from .models import ChatConversation
+
+VERSION_TTL = 300
+
+
+def _version_cache():
+    # Only worth using when the cache is shared between workers; a per-process
+    # cache would miss invalidations made by other workers.
+    alias = getattr(settings, 'CHAT_VERSION_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _version_key(user_id):
+    return f'chat:conversations:version:{user_id}'
+
+
+def _query_tag(request):
+    # Different pages of the same resource need different validators.
+    query = request.GET.urlencode()
+    return hashlib.md5(query.encode()).hexdigest()[:12] if query else ''
+
+
+def _memoized(request, key, compute):
+    validators = request.__dict__.setdefault('_chat_validators', {})
+    if key not in validators:
+        validators[key] = compute()
+    return validators[key]
+
+
+def user_info_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    user = request.user
+    return f'W/"u{user.pk}-{user.updated_at.timestamp()}"'
+
+
+def user_info_last_modified(request):
+    if not request.user.is_authenticated:
+        return None
+    return request.user.updated_at
+
+
+def conversation_list_version(user_id):
+    """
+    Token that changes whenever the user's conversation list changes.
+    """
+    cache = _version_cache()
+    if cache is not None:
+        version = cache.get(_version_key(user_id))
+        if version is not None:
+            return version
+
+    stats = ChatConversation.objects.filter(user_id=user_id).aggregate(
+        last=Max('updated_at'), count=Count('id')
+    )
+    last = stats['last'].timestamp() if stats['last'] else 0
+    version = f"{stats['count']}-{last}"
+
+    # A lagging replica could cache a version older than the last bump.
+    if cache is not None and router.db_for_read(ChatConversation) == DEFAULT_DB_ALIAS:
+        cache.set(_version_key(user_id), version, VERSION_TTL)
+    return version
+
+
+def bump_conversation_list_version(user_id):
+    """
+    Invalidate the cached list version after a write.
+    """
+    cache = _version_cache()
+    if cache is not None:
+        cache.delete(_version_key(user_id))
+
+
+def conversation_list_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    user_id = request.user.pk
+    return f'W/"c{user_id}-{conversation_list_version(user_id)}-{_query_tag(request)}"'
+
+
+def _conversation_state(request, conversation_id):
+    def lookup():
+        if not request.user.is_authenticated:
+            return None
+        return (
+            ChatConversation.objects.filter(pk=conversation_id, user=request.user)
+            .values_list('updated_at', 'message_count')
+            .first()
+        )
+    return _memoized(request, ('conversation', conversation_id), lookup)
+
+
+def conversation_messages_etag(request, conversation_id):
+    state = _conversation_state(request, conversation_id)
+    if state is None:
+        return None
+    updated_at, message_count = state
+    return f'W/"m{conversation_id}-{updated_at.timestamp()}-{message_count}-{_query_tag(request)}"'
+
+
+def conversation_messages_last_modified(request, conversation_id):
+    state = _conversation_state(request, conversation_id)
+    return state[0] if state else None
@@ -0,0 +1,84 @@
+"""
+Non-blocking Google OAuth calls for the async callback views.
+
+A pooled ``httpx.AsyncClient`` is kept per event loop, so under an ASGI server
+every login a worker handles reuses the same keep-alive connections to
+Google's token and userinfo endpoints instead of blocking a thread on each
+round trip.
+"""
+
+import asyncio
+import weakref
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from django.conf import settings
+from google.oauth2.credentials import Credentials
+
+DEFAULT_TOKEN_URI = 'https://oauth2.googleapis.com/token'
+DEFAULT_USERINFO_URI = 'https://www.googleapis.com/oauth2/v2/userinfo'
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class GoogleOAuthError(Exception):
+    """Raised when Google rejects a token exchange or userinfo request."""
+
+
+def token_uri():
+    return getattr(settings, 'GOOGLE_TOKEN_URI', DEFAULT_TOKEN_URI)
+
+
+def get_client():
+    """The pooled HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=getattr(settings, 'GOOGLE_HTTP_TIMEOUT', 10),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'GOOGLE_HTTP_MAX_CONNECTIONS', 100),
+                max_keepalive_connections=20,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def exchange_code(code):
+    """
+    Exchange an authorization code for credentials, like ``Flow.fetch_token``.
+    """
+    response = await get_client().post(token_uri(), data={
+        'grant_type': 'authorization_code',
+        'code': code,
+        'client_id': getattr(settings, 'GOOGLE_CLIENT_ID', ''),
+        'client_secret': getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
+        'redirect_uri': getattr(settings, 'GOOGLE_REDIRECT_URI', 'http://localhost:8000/oauth/callback/'),
+    })
+    if response.status_code != 200:
+        raise GoogleOAuthError(f"Token exchange failed ({response.status_code}): {response.text[:200]}")
+    payload = response.json()
+
+    # google-auth keeps expiry as naive UTC
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=payload.get('expires_in', 3600))
+    return Credentials(
+        token=payload['access_token'],
+        refresh_token=payload.get('refresh_token'),
+        token_uri=token_uri(),
+        client_id=getattr(settings, 'GOOGLE_CLIENT_ID', ''),
+        client_secret=getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
+        scopes=payload.get('scope', '').split() or None,
+        expiry=expiry,
+    )
+
+
+async def fetch_userinfo(credentials):
+    """Fetch the signed-in user's Google profile"""
+    response = await get_client().get(
+        getattr(settings, 'GOOGLE_USERINFO_URI', DEFAULT_USERINFO_URI),
+        headers={'Authorization': f'Bearer {credentials.token}'},
+    )
+    if response.status_code != 200:
+        raise GoogleOAuthError(f"Userinfo request failed ({response.status_code})")
+    return response.json()
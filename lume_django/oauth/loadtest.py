@@ -0,0 +1,458 @@
+"""
+End-to-end load test of the login and chat flows (``manage.py loadtest``).
+
+Each virtual user goes through what the frontend does:
+
+1. login: ``initiate_oauth``, consent at Google, ``oauth_callback``;
+2. permission upgrade: ``request_service_permissions`` for email and
+   calendar, consent, ``service_permission_callback``;
+3. a burst of ``send_message`` turns in one conversation, some of which run
+   Gmail and Calendar actions;
+4. history browsing: ``get_conversations``, the messages of each listed
+   conversation, and a search.
+
+Google is played by integrations.fake_google. A target is one of:
+
+- ``wsgi``: lume_django's WSGI handler in this process, through Django's test
+  Client and a thread per concurrent user;
+- ``asgi``: its ASGI handler in this process, through AsyncClient on one event
+  loop, with the async OAuth callbacks asgi.py turns on;
+- the URL of a running deployment (gunicorn, uvicorn, ...) started against
+  ``manage.py fake_google``. Its session cookie has to reach the harness, so
+  serve it over HTTPS or with DEBUG on.
+
+Per view it reports throughput, errors, latency percentiles and database
+queries per request. Query counts come from the ``lume_http_db_queries``
+metric (lume_django/metrics.py): read from this process for the in-process
+targets, scraped from /metrics for a URL.
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches, reverse
+
+from lume_django import metrics
+
+logger = logging.getLogger(__name__)
+
+# What the users say, in turn; the first two run Gmail and Calendar actions
+MESSAGES = [
+    'Check my email for anything about the quarterly report',
+    'What meetings are on my calendar this week?',
+    'Thanks, that is helpful',
+    'Summarise what we talked about so far',
+    'Any new email from sender3?',
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+_DB_QUERIES = re.compile(r'^lume_http_db_queries_(sum|count)\{view="([^"]*)"\}$')
+
+
+class Call:
+    """One request of a scenario, with the status it should get"""
+
+    def __init__(self, view, method, path, data=None, expect=200, redirect=None):
+        self.view = view
+        self.method = method
+        self.path = path
+        self.data = data
+        self.expect = expect
+        self.redirect = redirect  # text the Location of a redirect must contain
+
+    def error(self, reply):
+        if reply.status != self.expect:
+            return f'HTTP {reply.status}'
+        if self.redirect and self.redirect not in reply.location:
+            query = parse_qs(urlsplit(reply.location).query)
+            return f"redirect: {query.get('error', [reply.location])[0]}"
+        return None
+
+
+class Consent:
+    """The browser's visit to Google's consent page; answered with the redirect back"""
+
+    def __init__(self, auth_url, account):
+        self.auth_url = auth_url
+        self.account = account
+
+    @property
+    def url(self):
+        if 'login_hint=' in self.auth_url:
+            return self.auth_url
+        # The user picks their account on Google's page
+        return f"{self.auth_url}&{urlencode({'login_hint': self.account})}"
+
+
+class Reply:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def location(self):
+        return self.headers.get('Location', '')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def journey(account, messages=5):
+    """
+    One user's visit, as a generator of Calls and Consents.
+
+    Each is sent the reply to the previous one; a failed Call ends the journey.
+    """
+    reply = yield Call('initiate_oauth', 'POST', reverse('oauth:initiate_oauth'), {'prompt': MESSAGES[0]})
+    location = yield Consent(reply.json()['auth_url'], account)
+    reply = yield Call(
+        'oauth_callback', 'GET', f"{reverse('oauth:oauth_callback')}?{urlsplit(location).query}",
+        expect=302, redirect='auth_success=true',
+    )
+    state = parse_qs(urlsplit(reply.location).query)['state'][0]
+
+    reply = yield Call(
+        'request_service_permissions', 'POST', reverse('oauth:request_service_permissions'),
+        {'state': state, 'services': {'email': True, 'calendar': True}},
+    )
+    location = yield Consent(reply.json()['auth_url'], account)
+    # Google sends the user back to GOOGLE_REDIRECT_URI; the frontend passes
+    # the code of a permission upgrade on to the service callback.
+    yield Call(
+        'service_permission_callback', 'GET',
+        f"{reverse('oauth:service_permission_callback')}?{urlsplit(location).query}",
+        expect=302, redirect='service_perms_granted=true',
+    )
+
+    conversation_id = None
+    for i in range(messages):
+        reply = yield Call('send_message', 'POST', reverse('oauth:send_message'), {
+            'message': MESSAGES[i % len(MESSAGES)],
+            'conversation_id': conversation_id,
+        })
+        conversation_id = reply.json()['conversation_id']
+
+    reply = yield Call('get_conversations', 'GET', reverse('oauth:get_conversations'))
+    for conversation in reply.json()['conversations']:
+        yield Call(
+            'get_conversation_messages', 'GET',
+            reverse('oauth:get_conversation_messages', args=[conversation['id']]),
+        )
+    yield Call('search_chat_messages', 'GET', f"{reverse('oauth:search_chat_messages')}?q=email")
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted ``values``"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # view -> seconds
+        self.errors = defaultdict(Counter)  # view -> reason -> count
+        self.journeys = Counter()  # completed, failed
+        self.session_keys = []
+        self.elapsed = 0.0
+        self.queries = {}  # view -> DB queries per request
+        self._lock = threading.Lock()
+
+    def record(self, view, seconds, error=None):
+        with self._lock:
+            self.latencies[view].append(seconds)
+            if error:
+                self.errors[view][error] += 1
+
+    def finish(self, completed, session_key):
+        with self._lock:
+            self.journeys['completed' if completed else 'failed'] += 1
+            if session_key:
+                self.session_keys.append(session_key)
+
+    def summary(self):
+        """Totals and per-view figures"""
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        errors = sum(sum(reasons.values()) for reasons in self.errors.values())
+        views = {}
+        for view, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            views[view] = {
+                'requests': len(latencies),
+                'throughput': len(latencies) / self.elapsed if self.elapsed else 0,
+                'errors': dict(self.errors[view]),
+                'error_rate': sum(self.errors[view].values()) / len(latencies),
+                **{f'p{p}_ms': percentile(latencies, p) * 1000 for p in PERCENTILES},
+                'db_queries': self.queries.get(view),
+            }
+        return {
+            'requests': requests,
+            'elapsed': self.elapsed,
+            'throughput': requests / self.elapsed if self.elapsed else 0,
+            'errors': errors,
+            'error_rate': errors / requests if requests else 0,
+            'journeys': dict(self.journeys),
+            'views': views,
+        }
+
+
+def db_queries(samples):
+    """``{view: (queries, requests)}`` from metric samples keyed like the exposition lines"""
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for key, value in samples.items():
+        match = _DB_QUERIES.match(key)
+        if match:
+            kind, view = match.groups()
+            totals[view.rsplit(':', 1)[-1]][kind == 'count'] += value
+    return {view: tuple(total) for view, total in totals.items()}
+
+
+def queries_per_request(before, after):
+    result = {}
+    for view, (queries, requests) in after.items():
+        queries -= before.get(view, (0, 0))[0]
+        requests -= before.get(view, (0, 0))[1]
+        if requests:
+            result[view] = queries / requests
+    return result
+
+
+def scrape(url, token):
+    """Metric samples of a deployment, from its /metrics"""
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    response = httpx.get(f"{url.rstrip('/')}/metrics", headers=headers, timeout=10)
+    response.raise_for_status()
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith('#'):
+            key, _, value = line.rpartition(' ')
+            samples[key] = float(value)
+    return samples
+
+
+# Drivers: send one user's Calls to a target
+
+class ClientDriver:
+    """The WSGI handler, in process, over HTTPS as deployed"""
+
+    def __init__(self, google):
+        # Server errors are answered with a 500, as deployed, rather than raised
+        self.client = Client(raise_request_exception=False)
+        self.google = google
+
+    def call(self, call):
+        if call.method == 'GET':
+            response = self.client.get(call.path, secure=True)
+        else:
+            response = self.client.post(
+                call.path, json.dumps(call.data), content_type='application/json', secure=True,
+            )
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return Reply(response.status_code, response.headers, body)
+
+    def consent(self, consent):
+        return self.google.get(consent.url).headers['Location']
+
+    def session_key(self):
+        cookie = self.client.cookies.get(settings.SESSION_COOKIE_NAME)
+        return cookie.value if cookie else None
+
+
+class AsyncClientDriver(ClientDriver):
+    """The ASGI handler, in process"""
+
+    def __init__(self, google):
+        self.client = AsyncClient(raise_request_exception=False)
+        self.google = google
+
+    async def call(self, call):
+        if call.method == 'GET':
+            response = await self.client.get(call.path, secure=True)
+        else:
+            response = await self.client.post(
+                call.path, json.dumps(call.data), content_type='application/json', secure=True,
+            )
+        if not response.streaming:
+            body = response.content
+        elif response.is_async:
+            body = b''.join([chunk async for chunk in response.streaming_content])
+        else:
+            body = await sync_to_async(b''.join)(response.streaming_content)
+        return Reply(response.status_code, response.headers, body)
+
+    async def consent(self, consent):
+        return (await self.google.get(consent.url)).headers['Location']
+
+    async def aclose(self):
+        pass
+
+
+class HTTPDriver:
+    """A deployment, over HTTP"""
+
+    def __init__(self, url, google):
+        self.client = httpx.AsyncClient(base_url=url, timeout=30)
+        self.google = google
+
+    async def call(self, call):
+        if call.method == 'GET':
+            response = await self.client.get(call.path)
+        else:
+            response = await self.client.post(call.path, json=call.data)
+        return Reply(response.status_code, response.headers, response.content)
+
+    async def consent(self, consent):
+        return (await self.google.get(consent.url)).headers['Location']
+
+    def session_key(self):
+        return self.client.cookies.get(settings.SESSION_COOKIE_NAME)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _drive(driver, steps, stats):
+    """Run one journey against a sync driver; returns whether it completed"""
+    reply = None
+    try:
+        while True:
+            step = steps.send(reply)
+            if isinstance(step, Consent):
+                reply = driver.consent(step)
+                continue
+            started = time.perf_counter()
+            try:
+                reply = driver.call(step)
+            except Exception as e:
+                stats.record(step.view, time.perf_counter() - started, type(e).__name__)
+                return False
+            error = step.error(reply)
+            stats.record(step.view, time.perf_counter() - started, error)
+            if error:
+                return False
+    except StopIteration:
+        return True
+    except Exception:
+        # An unexpected reply body
+        logger.exception("Load test journey failed")
+        return False
+
+
+async def _adrive(driver, steps, stats):
+    """Run one journey against an async driver; returns whether it completed"""
+    reply = None
+    try:
+        while True:
+            step = steps.send(reply)
+            if isinstance(step, Consent):
+                reply = await driver.consent(step)
+                continue
+            started = time.perf_counter()
+            try:
+                reply = await driver.call(step)
+            except Exception as e:
+                stats.record(step.view, time.perf_counter() - started, type(e).__name__)
+                return False
+            error = step.error(reply)
+            stats.record(step.view, time.perf_counter() - started, error)
+            if error:
+                return False
+    except StopIteration:
+        return True
+    except Exception:
+        # An unexpected reply body
+        logger.exception("Load test journey failed")
+        return False
+
+
+def run_wsgi(accounts, concurrency, messages):
+    stats = Stats()
+    with httpx.Client(timeout=30) as google:
+        def visit(account):
+            driver = ClientDriver(google)
+            completed = _drive(driver, journey(account, messages), stats)
+            stats.finish(completed, driver.session_key())
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(visit, accounts))
+        stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+async def _run_async(make_driver, accounts, concurrency, messages):
+    stats = Stats()
+    limit = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=30) as google:
+        async def visit(account):
+            async with limit:
+                driver = make_driver(google)
+                try:
+                    completed = await _adrive(driver, journey(account, messages), stats)
+                    stats.finish(completed, driver.session_key())
+                finally:
+                    await driver.aclose()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(visit(account) for account in accounts))
+        stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def run_asgi(accounts, concurrency, messages):
+    with async_callbacks():
+        return asyncio.run(_run_async(AsyncClientDriver, accounts, concurrency, messages))
+
+
+def run_http(url, accounts, concurrency, messages):
+    return asyncio.run(_run_async(lambda google: HTTPDriver(url, google), accounts, concurrency, messages))
+
+
+def _reload_urls():
+    from oauth import urls
+
+    importlib.reload(urls)
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def async_callbacks():
+    """Route the OAuth callbacks to oauth/async_views.py, as asgi.py does"""
+    try:
+        with override_settings(OAUTH_ASYNC_CALLBACKS=True):
+            _reload_urls()
+            yield
+    finally:
+        _reload_urls()
+
+
+def run(target, accounts, concurrency=4, messages=5, metrics_token=''):
+    """Run every account's journey against ``target`` (wsgi, asgi or a URL); returns its Stats"""
+    if target in ('wsgi', 'asgi'):
+        runner = run_wsgi if target == 'wsgi' else run_asgi
+        # The test clients' host, as under the test runner
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            before = db_queries(metrics.registry.snapshot())
+            stats = runner(accounts, concurrency, messages)
+            after = db_queries(metrics.registry.snapshot())
+    else:
+        before = db_queries(scrape(target, metrics_token))
+        stats = run_http(target, accounts, concurrency, messages)
+        after = db_queries(scrape(target, metrics_token))
+    stats.queries = queries_per_request(before, after)
+    return stats
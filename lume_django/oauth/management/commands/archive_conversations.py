@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from oauth.archive import archivable_conversations, archive_conversation
+
+
+class Command(BaseCommand):
+    help = "Move messages of inactive conversations into compressed cold storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inactive-days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['inactive_days'])
+        candidates = archivable_conversations(cutoff).order_by('pk')
+
+        if options['dry_run']:
+            self.stdout.write(f"{candidates.count()} conversations would be archived")
+            return
+
+        last_pk = 0
+        batches = conversations = messages = raw_bytes = compressed_bytes = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            batch = list(candidates.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            for conversation in batch:
+                archive = archive_conversation(conversation, cutoff)
+                if archive is None:
+                    continue
+                conversations += 1
+                messages += archive.message_count
+                raw_bytes += archive.raw_bytes
+                compressed_bytes += archive.compressed_bytes
+            last_pk = batch[-1].pk
+            batches += 1
+
+        saved = raw_bytes - compressed_bytes
+        ratio = (saved / raw_bytes * 100) if raw_bytes else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {messages} messages from {conversations} conversations: "
+            f"{raw_bytes} bytes -> {compressed_bytes} bytes ({saved} bytes, {ratio:.1f}% saved)"
+        ))
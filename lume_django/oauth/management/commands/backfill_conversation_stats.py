@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from oauth.models import ChatConversation, ChatMessage
+
+
+class Command(BaseCommand):
+    help = "Fill in ChatConversation.message_count and last_message_at in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Recompute every conversation, not just the ones that were never backfilled",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Archived conversations have no message rows; their count is kept by the archiver.
+        conversations = ChatConversation.objects.filter(is_archived=False)
+        if not options['all']:
+            conversations = conversations.filter(message_count__isnull=True)
+
+        messages = ChatMessage.objects.filter(conversation=OuterRef('pk')).order_by().values('conversation')
+        count = Subquery(messages.annotate(n=Count('id')).values('n'))
+        last_message_at = Subquery(messages.annotate(last=Max('timestamp')).values('last'))
+
+        last_pk = 0
+        total = 0
+        while True:
+            pks = list(
+                conversations.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            # One UPDATE per batch; the subqueries are evaluated per row in SQL.
+            total += ChatConversation.objects.filter(pk__in=pks).update(
+                message_count=Coalesce(count, 0),
+                last_message_at=last_message_at,
+            )
+            last_pk = pks[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} conversations"))
@@ -0,0 +1,66 @@
+import gzip
+import json
+import timeit
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.test import RequestFactory
+from django.utils import timezone
+
+from lume_django.responses import json_response, stream_json_response
+
+
+class Command(BaseCommand):
+    help = "Benchmark encoding a chat history response: JsonResponse vs the orjson/gzip response layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        start = timezone.now()
+        messages = [
+            {
+                'id': i,
+                'role': 'user' if i % 2 == 0 else 'assistant',
+                'content': f"Message {i}: can you check my calendar for next week and email the team?",
+                'timestamp': start + timedelta(seconds=i),
+                'detected_services': {'email': True, 'calendar': True, 'tasks': False, 'keep': False},
+                'response_metadata': {},
+            }
+            for i in range(options['messages'])
+        ]
+        head = {'success': True, 'conversation': {'id': 1, 'title': 'Benchmark', 'created_at': start}}
+
+        factory = RequestFactory()
+        plain = factory.get('/')
+        gzipped = factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+
+        def stock():
+            # The previous views: .isoformat() per field, encoded by JsonResponse.
+            data = dict(head, conversation=dict(head['conversation'], created_at=start.isoformat()))
+            data['messages'] = [dict(message, timestamp=message['timestamp'].isoformat()) for message in messages]
+            return JsonResponse(data).content
+
+        def fast():
+            return json_response(plain, dict(head, messages=messages)).content
+
+        def fast_gzip():
+            return json_response(gzipped, dict(head, messages=messages)).content
+
+        def streamed_gzip():
+            response = stream_json_response(gzipped, head, 'messages', messages, lambda message: message)
+            return b''.join(response.streaming_content)
+
+        assert json.loads(stock()) == json.loads(fast()) == json.loads(gzip.decompress(streamed_gzip()))
+
+        repeat = options['repeat']
+        for name, func in (
+            ('JsonResponse', stock),
+            ('json_response', fast),
+            ('json_response+gzip', fast_gzip),
+            ('streamed+gzip', streamed_gzip),
+        ):
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            self.stdout.write(f"{name:>18}: {best * 1000:.3f} ms, {len(func())} bytes")
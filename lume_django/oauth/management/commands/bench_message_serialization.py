@@ -0,0 +1,46 @@
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from oauth.models import SERVICE_BITS, ChatMessage, encode_services
+
+
+class Command(BaseCommand):
+    help = "Benchmark serializing a chat thread's detected services: JSON text vs bitmask"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        detected = [
+            {service: rng.random() < 0.3 for service in SERVICE_BITS}
+            for _ in range(options['messages'])
+        ]
+
+        # The old TextField format: every message re-parsed with json.loads.
+        stored_json = [json.dumps(services) for services in detected]
+        # The current format: unsaved instances, no database needed.
+        messages = [ChatMessage(detected_services=encode_services(services)) for services in detected]
+
+        def json_text():
+            return [json.loads(value) for value in stored_json]
+
+        def bitmask():
+            return [message.get_detected_services() for message in messages]
+
+        assert json_text() == bitmask()
+
+        repeat = options['repeat']
+        for name, func in (('json text', json_text), ('bitmask', bitmask)):
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            self.stdout.write(
+                f"{name:>10}: {best * 1000:.3f} ms per {len(detected)}-message thread "
+                f"({best / len(detected) * 1e6:.2f} us/message)"
+            )
+
+        text_bytes = sum(len(value) for value in stored_json)
+        self.stdout.write(f"storage: {text_bytes} bytes as JSON text vs {2 * len(detected)} bytes as SMALLINT")
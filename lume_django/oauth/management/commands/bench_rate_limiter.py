@@ -0,0 +1,25 @@
+import timeit
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from lume_django.ratelimit import check_rate_limit
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request overhead of the send_message rate limit (user + IP buckets)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', default='local', choices=['local', 'db', 'redis'])
+        parser.add_argument('--number', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        request = RequestFactory().post('/api/chat/send/')
+        request.user = SimpleNamespace(pk=1, is_authenticated=True)
+        limits = {'send_message': {'user': '1000000/s', 'ip': '1000000/s'}}
+
+        with override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_STORE=options['store'], RATE_LIMITS=limits):
+            number = options['number']
+            best = min(timeit.repeat(lambda: check_rate_limit(request, 'send_message'), number=number, repeat=5))
+        self.stdout.write(f"{options['store']}: {best / number * 1e6:.2f} us per request")
@@ -0,0 +1,102 @@
+import json
+import os
+import uuid
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from integrations.fake_google import FakeGoogle, serve
+from jobs.models import Job
+from oauth import loadtest
+from oauth.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test login, permission upgrade, chat bursts and history browsing against "
+        "the in-process WSGI and ASGI handlers or a running deployment, with a fake Google"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', dest='targets',
+                            help="wsgi, asgi or the URL of a deployment; repeat to compare (default: wsgi and asgi)")
+        parser.add_argument('--users', type=int, default=20, help="Virtual users, one journey each")
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Users in flight at once (SQLite cannot take concurrent writers: use 1)")
+        parser.add_argument('--messages', type=int, default=5, help="send_message burst per user")
+        parser.add_argument('--latency-ms', type=int, default=50,
+                            help="Fake Google latency per call (in-process targets)")
+        parser.add_argument('--metrics-token', default=getattr(settings, 'METRICS_TOKEN', ''),
+                            help="Bearer token for a deployment's /metrics (default: METRICS_TOKEN)")
+        parser.add_argument('--json', help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or ['wsgi', 'asgi']
+        run_id = uuid.uuid4().hex[:8]
+        results = {}
+
+        fake = FakeGoogle(latency=dict.fromkeys(
+            ('oauth2', 'gmail', 'calendar', 'tasks', 'keep', 'people'), options['latency_ms'] / 1000,
+        ))
+        fake.seed()
+        server = serve(fake)
+        # oauthlib refuses plain-HTTP token endpoints and scope changes by default.
+        os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
+        os.environ.setdefault('OAUTHLIB_RELAX_TOKEN_SCOPE', '1')
+
+        session_keys = []
+        try:
+            with override_settings(**server.settings()):
+                for target in targets:
+                    label = target.replace('://', '-').replace('/', '').replace(':', '-')
+                    accounts = [
+                        f'loadtest-{run_id}-{label}-{i}@example.com' for i in range(options['users'])
+                    ]
+                    stats = loadtest.run(
+                        target, accounts, options['concurrency'], options['messages'], options['metrics_token'],
+                    )
+                    session_keys += stats.session_keys
+                    results[target] = stats.summary()
+                    self._report(target, options, results[target])
+        finally:
+            server.shutdown()
+            self._clean_up(run_id, session_keys)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def _clean_up(self, run_id, session_keys):
+        users = User.objects.filter(google_id__startswith=f'loadtest-{run_id}-')
+        user_ids = set(users.values_list('pk', flat=True))
+        # Jobs queued by the logins (contacts sync, warmup, refreshes) take the user id first
+        Job.objects.filter(pk__in=[
+            pk for pk, args in Job.objects.filter(status=Job.QUEUED, name__startswith='integrations.')
+            .values_list('pk', 'args') if args and args[0] in user_ids
+        ]).delete()
+        # OAuth states, conversations and messages go with the users
+        users.delete()
+        Session.objects.filter(session_key__in=session_keys).delete()
+
+    def _report(self, target, options, summary):
+        journeys = summary['journeys']
+        self.stdout.write(
+            f"\n{target} ({options['concurrency']} concurrent users): "
+            f"{summary['requests']} requests in {summary['elapsed']:.2f} s, "
+            f"{summary['throughput']:.1f} req/s, {summary['errors']} errors ({summary['error_rate']:.1%}), "
+            f"{journeys.get('completed', 0)}/{sum(journeys.values())} journeys completed"
+        )
+        percentiles = ''.join(f"{f'p{p} ms':>9}" for p in loadtest.PERCENTILES)
+        self.stdout.write(f"  {'view':<28}{'requests':>9}{'req/s':>8}{'errors':>8}{percentiles}{'queries':>9}")
+        for view, figures in summary['views'].items():
+            queries = figures['db_queries']
+            self.stdout.write(
+                f"  {view:<28}{figures['requests']:>9}{figures['throughput']:>8.1f}"
+                f"{figures['error_rate']:>8.1%}"
+                + ''.join(f"{figures[f'p{p}_ms']:>9.1f}" for p in loadtest.PERCENTILES)
+                + (f"{queries:>9.1f}" if queries is not None else f"{'-':>9}")
+            )
+            for reason, count in figures['errors'].items():
+                self.stdout.write(f"    {count} x {reason}")
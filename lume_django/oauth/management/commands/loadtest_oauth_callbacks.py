@@ -0,0 +1,111 @@
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+
+from integrations.fake_google import FakeGoogle, serve
+from oauth import async_views, views
+from oauth.models import OAuthState, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the sync and async OAuth callbacks against a local fake Google "
+        "token/userinfo endpoint and report logins per second for one worker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=100)
+        parser.add_argument('--latency-ms', type=int, default=50, help='Fake Google latency per call')
+        parser.add_argument('--threads', type=int, default=1, help='Threads of the sync worker')
+        parser.add_argument('--concurrency', type=int, default=50, help='In-flight logins for the async worker')
+
+    def handle(self, *args, **options):
+        server = serve(FakeGoogle(latency={'oauth2': options['latency_ms'] / 1000}))
+
+        # oauthlib refuses plain-HTTP token endpoints and scope changes by default.
+        os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
+        os.environ.setdefault('OAUTHLIB_RELAX_TOKEN_SCOPE', '1')
+
+        self.run_id = uuid.uuid4().hex[:8]
+        self.session_keys = []
+        try:
+            with override_settings(**server.settings()):
+                self._report(f"sync, {options['threads']} thread(s)", *self._run_sync(options))
+                self._report(f"async, {options['concurrency']} in flight", *self._run_async(options))
+        finally:
+            server.shutdown()
+            OAuthState.objects.filter(state__startswith=f'loadtest-{self.run_id}-').delete()
+            User.objects.filter(google_id__startswith=f'loadtest-{self.run_id}-').delete()
+            Session.objects.filter(session_key__in=[key for key in self.session_keys if key]).delete()
+
+    def _states(self, mode, count):
+        states = [f'loadtest-{self.run_id}-{mode}-{i}' for i in range(count)]
+        OAuthState.objects.bulk_create([OAuthState(state=state, requested_services='{}') for state in states])
+        return states
+
+    def _request(self, factory, state):
+        request = factory.get('/oauth/callback/', {'state': state, 'code': state})
+        SessionMiddleware(lambda request: None).process_request(request)
+        return request
+
+    def _check(self, request, response):
+        self.session_keys.append(request.session.session_key)
+        if 'auth_success=true' not in response['Location']:
+            raise RuntimeError(f"Login failed: {response['Location']}")
+
+    def _run_sync(self, options):
+        factory = RequestFactory()
+
+        def login(state):
+            started = time.perf_counter()
+            request = self._request(factory, state)
+            self._check(request, views.oauth_callback(request))
+            return time.perf_counter() - started
+
+        states = self._states('sync', options['logins'])
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            latencies = list(pool.map(login, states))
+        return time.perf_counter() - started, latencies
+
+    def _run_async(self, options):
+        factory = AsyncRequestFactory()
+        states = self._states('async', options['logins'])
+        # Like the ASGI handler, give each request its own thread for sync DB
+        # work. SQLite can't take concurrent writers, so share one thread there.
+        per_request_threads = connection.vendor != 'sqlite'
+
+        async def main():
+            limit = asyncio.Semaphore(options['concurrency'])
+
+            async def login(state):
+                async with limit, (ThreadSensitiveContext() if per_request_threads else nullcontext()):
+                    started = time.perf_counter()
+                    request = self._request(factory, state)
+                    self._check(request, await async_views.oauth_callback(request))
+                    return time.perf_counter() - started
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(login(state) for state in states))
+            return time.perf_counter() - started, latencies
+
+        return asyncio.run(main())
+
+    def _report(self, label, elapsed, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:>24}: {len(latencies) / elapsed:7.1f} logins/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"
+        )
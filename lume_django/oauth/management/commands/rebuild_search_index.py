@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from oauth.models import ChatMessage, MessageSearchTerm
+from oauth.search import index_messages, uses_fulltext
+
+
+class Command(BaseCommand):
+    help = "Rebuild the inverted chat search index (not needed on MySQL, which uses FULLTEXT)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        db = router.db_for_write(ChatMessage)
+        if uses_fulltext(db):
+            self.stdout.write("Database uses a FULLTEXT index; nothing to rebuild")
+            return
+
+        MessageSearchTerm.objects.using(db).all().delete()
+        messages = ChatMessage.objects.using(db).select_related('conversation').only(
+            'id', 'content', 'conversation__user_id'
+        )
+
+        last_pk = 0
+        total = 0
+        while True:
+            batch = list(messages.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic(using=db):
+                by_user = {}
+                for message in batch:
+                    by_user.setdefault(message.conversation.user_id, []).append(message)
+                for user_id, user_messages in by_user.items():
+                    index_messages(user_messages, user_id, db)
+            total += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages"))
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatconversation",
+            name="last_message_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="chatconversation",
+            name="message_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
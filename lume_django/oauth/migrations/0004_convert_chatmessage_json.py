@@ -0,0 +1,73 @@
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+SERVICE_BITS = {"email": 1, "calendar": 2, "tasks": 4, "keep": 8}
+
+
+def _load(value):
+    try:
+        return json.loads(value) or {}
+    except (TypeError, ValueError):
+        return {}
+
+
+def _batches(ChatMessage, db_alias, fields):
+    last_pk = 0
+    while True:
+        batch = list(
+            ChatMessage.objects.using(db_alias)
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", *fields)[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def forwards(apps, schema_editor):
+    ChatMessage = apps.get_model("oauth", "ChatMessage")
+    db_alias = schema_editor.connection.alias
+    for batch in _batches(
+        ChatMessage, db_alias, ["detected_services", "response_metadata"]
+    ):
+        for message in batch:
+            services = _load(message.detected_services)
+            message.service_mask = sum(
+                bit for service, bit in SERVICE_BITS.items() if services.get(service)
+            )
+            message.metadata = _load(message.response_metadata)
+        ChatMessage.objects.using(db_alias).bulk_update(
+            batch, ["service_mask", "metadata"]
+        )
+
+
+def backwards(apps, schema_editor):
+    ChatMessage = apps.get_model("oauth", "ChatMessage")
+    db_alias = schema_editor.connection.alias
+    for batch in _batches(ChatMessage, db_alias, ["service_mask", "metadata"]):
+        for message in batch:
+            message.detected_services = json.dumps(
+                {
+                    service: bool(message.service_mask & bit)
+                    for service, bit in SERVICE_BITS.items()
+                }
+            )
+            message.response_metadata = json.dumps(message.metadata or {})
+        ChatMessage.objects.using(db_alias).bulk_update(
+            batch, ["detected_services", "response_metadata"]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauth", "0003_chatmessage_compact_columns"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
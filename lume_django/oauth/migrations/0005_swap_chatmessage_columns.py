@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauth", "0004_convert_chatmessage_json"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="chatmessage",
+            name="detected_services",
+        ),
+        migrations.RemoveField(
+            model_name="chatmessage",
+            name="response_metadata",
+        ),
+        migrations.RenameField(
+            model_name="chatmessage",
+            old_name="service_mask",
+            new_name="detected_services",
+        ),
+        migrations.RenameField(
+            model_name="chatmessage",
+            old_name="metadata",
+            new_name="response_metadata",
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["conversation", "detected_services"],
+                name="oauth_chatm_convers_f39a4e_idx",
+            ),
+        ),
+    ]
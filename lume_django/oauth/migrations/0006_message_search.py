@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FULLTEXT_INDEX = "oauth_chatmessage_content_ft"
+
+
+def create_fulltext_index(apps, schema_editor):
+    # MySQL only; other backends search through MessageSearchTerm instead.
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(
+            f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX} ON oauth_chatmessage (content)"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(f"DROP INDEX {FULLTEXT_INDEX} ON oauth_chatmessage")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth", "0005_swap_chatmessage_columns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageSearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("weight", models.PositiveSmallIntegerField(default=1)),
+                (
+                    "message",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_terms",
+                        to="oauth.chatmessage",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "term", "message"],
+                        name="oauth_messa_user_id_4e938c_idx",
+                    ),
+                    models.Index(fields=["term"], name="oauth_messa_term_ddb6b1_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth", "0006_message_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedConversation",
+            fields=[
+                (
+                    "conversation",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="archive",
+                        serialize=False,
+                        to="oauth.chatconversation",
+                    ),
+                ),
+                ("messages_blob", models.BinaryField()),
+                ("message_count", models.PositiveIntegerField()),
+                ("raw_bytes", models.PositiveIntegerField()),
+                ("compressed_bytes", models.PositiveIntegerField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="chatconversation",
+            name="is_archived",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oauth", "0007_conversation_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimitBucket",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=191, primary_key=True, serialize=False),
+                ),
+                ("tokens", models.FloatField()),
+                ("updated_at", models.FloatField()),
+            ],
+        ),
+    ]
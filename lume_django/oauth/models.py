@@ -32,6 +32,14 @@ class User(AbstractUser):
     updated_at = models.DateTimeField(auto_now=True)
     last_login_at = models.DateTimeField(null=True, blank=True)
     
+    # Detected service name -> permission flag column
+    SERVICE_PERMISSION_FIELDS = {
+        'email': 'gmail_permission',
+        'calendar': 'calendar_permission',
+        'tasks': 'tasks_permission',
+        'keep': 'keep_permission',
+    }
+    
     def set_scopes(self, scopes):
         """Store granted scopes as JSON"""
         self.granted_scopes = json.dumps(scopes)
@@ -47,6 +55,11 @@ class User(AbstractUser):
         """Check if user has a specific scope"""
         return scope in self.get_scopes()
     
+    def has_service_permission(self, service):
+        """Check if the user has granted access for a detected service"""
+        field = self.SERVICE_PERMISSION_FIELDS.get(service)
+        return bool(field and getattr(self, field))
+    
     def is_token_expired(self):
         """Check if the access token is expired"""
         if not self.token_expires_at:
@@ -88,6 +101,14 @@ class OAuthState(models.Model):
         return f"OAuth State: {self.state[:20]}..."
 
 
+class ChatConversationQuerySet(models.QuerySet):
+    def with_message_counts(self):
+        """Annotate live message counts while some rows are not backfilled yet"""
+        if self.filter(message_count__isnull=True).exists():
+            return self.annotate(counted_messages=models.Count('messages'))
+        return self
+
+
 class ChatConversation(models.Model):
     """
     Represents a chat conversation/session.
@@ -98,6 +119,16 @@ class ChatConversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     
+    # Messages were moved to ArchivedConversation (see oauth/archive.py)
+    is_archived = models.BooleanField(default=False)
+    
+    # Denormalized stats, maintained by the chat write path.
+    # NULL until filled in by the backfill_conversation_stats command.
+    message_count = models.PositiveIntegerField(null=True, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = ChatConversationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-updated_at']
         indexes = [
@@ -108,9 +139,52 @@ class ChatConversation(models.Model):
         return f"{self.title} - {self.user.email}"
     
     def get_message_count(self):
+        counted = getattr(self, 'counted_messages', None)
+        if counted is not None:
+            return counted
+        if self.message_count is not None:
+            return self.message_count
         return self.messages.count()
 
 
+# Bit assigned to each detected service in ChatMessage.detected_services
+SERVICE_BITS = {
+    'email': 1,
+    'calendar': 2,
+    'tasks': 4,
+    'keep': 8,
+}
+
+ALL_SERVICES_MASK = sum(SERVICE_BITS.values())
+
+_DECODED_SERVICES = [
+    {service: bool(mask & bit) for service, bit in SERVICE_BITS.items()}
+    for mask in range(1 << len(SERVICE_BITS))
+]
+
+
+def encode_services(services):
+    """Pack a {service: bool} dict into a bitmask"""
+    mask = 0
+    for service, detected in services.items():
+        if detected:
+            mask |= SERVICE_BITS.get(service, 0)
+    return mask
+
+
+def decode_services(mask):
+    """Unpack a bitmask into a {service: bool} dict, ignoring unknown bits"""
+    return dict(_DECODED_SERVICES[mask & ALL_SERVICES_MASK])
+
+
+class ChatMessageQuerySet(models.QuerySet):
+    def with_service(self, service):
+        """Messages in which ``service`` was detected"""
+        return self.annotate(
+            service_bit=models.F('detected_services').bitand(SERVICE_BITS[service])
+        ).filter(service_bit__gt=0)
+
+
 class ChatMessage(models.Model):
     """
     Individual messages within a conversation.
@@ -125,46 +199,81 @@ class ChatMessage(models.Model):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     content = models.TextField()
     
-    # Detected services for this message
-    detected_services = models.TextField(default='{}')  # JSON object
+    # Detected services for this message (bitmask, see SERVICE_BITS)
+    detected_services = models.PositiveSmallIntegerField(default=0)
     
     # Response metadata
-    response_metadata = models.TextField(default='{}')  # JSON object
+    response_metadata = models.JSONField(default=dict)
     
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    objects = ChatMessageQuerySet.as_manager()
+    
     class Meta:
         ordering = ['timestamp']
         indexes = [
             models.Index(fields=['conversation', 'timestamp']),
+            models.Index(fields=['conversation', 'detected_services']),
         ]
     
     def set_detected_services(self, services):
-        """Store detected services as JSON"""
-        self.detected_services = json.dumps(services)
+        """Store detected services as a bitmask"""
+        self.detected_services = encode_services(services)
     
     def get_detected_services(self):
-        """Retrieve detected services from JSON"""
-        try:
-            return json.loads(self.detected_services)
-        except:
-            return {}
+        """Retrieve detected services as a {service: bool} dict"""
+        return decode_services(self.detected_services)
     
     def set_response_metadata(self, metadata):
-        """Store response metadata as JSON"""
-        self.response_metadata = json.dumps(metadata)
+        """Store response metadata"""
+        self.response_metadata = metadata
     
     def get_response_metadata(self):
-        """Retrieve response metadata from JSON"""
-        try:
-            return json.loads(self.response_metadata)
-        except:
-            return {}
+        """Retrieve response metadata"""
+        return self.response_metadata or {}
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
 
 
+class ArchivedConversation(models.Model):
+    """
+    Cold storage for the messages of an inactive conversation, kept as one
+    zlib-compressed JSON blob instead of rows in ChatMessage.
+    """
+    conversation = models.OneToOneField(
+        ChatConversation, on_delete=models.CASCADE, primary_key=True, related_name='archive'
+    )
+    messages_blob = models.BinaryField()
+    message_count = models.PositiveIntegerField()
+    raw_bytes = models.PositiveIntegerField()
+    compressed_bytes = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archive of conversation {self.conversation_id} ({self.message_count} messages)"
+
+
+class MessageSearchTerm(models.Model):
+    """
+    Inverted index of chat message terms, used for search on databases
+    without a FULLTEXT index (see oauth/search.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)  # occurrences in the message
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'term', 'message']),
+            models.Index(fields=['term']),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} -> {self.message_id}"
+
+
 class ServicePermissionRequest(models.Model):
     """
     Track permission requests for specific services.
@@ -184,3 +293,15 @@ class ServicePermissionRequest(models.Model):
     def __str__(self):
         status = "Granted" if self.is_granted else "Pending"
         return f"{self.user.email} - {self.service_name} ({status})"
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket state for the database rate-limit store (see lume_django/ratelimit.py).
+    """
+    key = models.CharField(max_length=191, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()  # Unix time of the last refill
+    
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
@@ -0,0 +1,93 @@
+"""
+Keyset (cursor) pagination for the chat history endpoints.
+
+Pages are selected with ``WHERE (field, id) < (last_field, last_id)`` against
+the ``(user, -updated_at)`` and ``(conversation, timestamp)`` indexes, so deep
+pages cost the same as the first one. Cursors are opaque to clients.
+"""
+
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a malformed cursor."""
+
+
+class InvalidPageSize(ValueError):
+    """Raised when a client sends a malformed ``?limit=``."""
+
+
+def encode_cursor(value, pk):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    raw = f"{value}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, parse=datetime.fromisoformat):
+    """Decode a cursor produced by encode_cursor into ``(value, pk)``"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return parse(value), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+def get_page_size(request, paged_by_default=True):
+    """
+    Read ``?limit=`` from the request, bounded by the configured maximum.
+
+    Endpoints that predate pagination pass ``paged_by_default=False``: a
+    request with neither ``limit`` nor ``cursor`` then gets None (every row),
+    which is what their existing clients expect.
+    """
+    if not paged_by_default and 'limit' not in request.GET and 'cursor' not in request.GET:
+        return None
+    default = getattr(settings, 'CHAT_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'CHAT_MAX_PAGE_SIZE', 100)
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise InvalidPageSize(request.GET.get('limit'))
+    return max(1, min(limit, maximum))
+
+
+def keyset_page(queryset, field, cursor=None, limit=20):
+    """
+    Return one page of ``queryset`` ordered by ``(field, id)`` descending.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    A ``limit`` of None returns every row.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+
+    rows = list(queryset if limit is None else queryset[:limit + 1])
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
+
+
+def keyset_slice(rows, field, cursor=None, limit=20):
+    """
+    In-memory counterpart of keyset_page for rows already loaded in
+    ``(field, id)`` ascending order. Cursors are interchangeable.
+    """
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        rows = [row for row in rows if (getattr(row, field), row.pk) < (value, pk)]
+    page = rows[::-1] if limit is None else rows[::-1][:limit + 1]
+    if limit is None or len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    last = page[-1]
+    return page, encode_cursor(getattr(last, field), last.pk)
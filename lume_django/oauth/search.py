@@ -0,0 +1,170 @@
+"""
+Full-text search over chat history.
+
+On MySQL, queries run against the FULLTEXT index on ``oauth_chatmessage.content``
+(created in migration 0006). Other databases (SQLite in development and tests)
+use MessageSearchTerm, an inverted index that the chat write path updates as
+messages are written; ``manage.py rebuild_search_index`` fills it for older rows.
+"""
+
+import re
+from collections import Counter
+
+from django.db import connections, router
+from django.db.models import Count, Q, Sum
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import ChatMessage, MessageSearchTerm
+from .pagination import decode_cursor, encode_cursor
+
+MAX_TERM_LENGTH = 64
+SNIPPET_RADIUS = 60
+
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'me', 'my', 'of', 'on', 'or', 'the', 'to', 'was', 'with', 'you',
+})
+
+# InnoDB's default FULLTEXT stopwords and innodb_ft_min_token_size: the index
+# never stores these, so requiring one (+term) would make a search match nothing.
+INNODB_STOP_WORDS = frozenset({
+    'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from',
+    'how', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to',
+    'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www',
+})
+INNODB_MIN_TOKEN_SIZE = 3
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into a Counter of normalized search terms"""
+    return Counter(
+        word[:MAX_TERM_LENGTH] for word in _WORD_RE.findall(text.lower())
+        if len(word) > 1 and word not in STOP_WORDS
+    )
+
+
+def uses_fulltext(using=None):
+    """Whether searches on this database go through the MySQL FULLTEXT index"""
+    using = using or router.db_for_read(ChatMessage)
+    return connections[using].vendor == 'mysql'
+
+
+def index_messages(messages, user_id, using):
+    """
+    Add freshly written messages to the inverted index (no-op on MySQL).
+    """
+    if uses_fulltext(using):
+        return
+    rows = [
+        MessageSearchTerm(user_id=user_id, message_id=message.pk, term=term, weight=min(count, 32767))
+        for message in messages
+        for term, count in tokenize(message.content).items()
+    ]
+    MessageSearchTerm.objects.using(using).bulk_create(rows)
+
+
+def _fulltext_match(terms):
+    # Every indexable term is required, like the admin's search_fields.
+    required = ' '.join(
+        f'+{term}' for term in terms if len(term) >= INNODB_MIN_TOKEN_SIZE and term not in INNODB_STOP_WORDS
+    )
+    table = ChatMessage._meta.db_table
+    return RawSQL(f"MATCH ({table}.content) AGAINST (%s IN BOOLEAN MODE)", (required,))
+
+
+def _keyset(score_field, id_field, cursor, parse):
+    score, pk = decode_cursor(cursor, parse=parse)
+    return Q(**{f'{score_field}__lt': score}) | Q(**{score_field: score, f'{id_field}__lt': pk})
+
+
+def _fulltext_page(user, terms, cursor, limit):
+    matches = (
+        ChatMessage.objects.filter(conversation__user=user)
+        .select_related('conversation')
+        .annotate(score=_fulltext_match(terms))
+        .filter(score__gt=0)
+    )
+    if cursor:
+        matches = matches.filter(_keyset('score', 'id', cursor, float))
+    rows = list(matches.order_by('-score', '-id')[:limit + 1])
+    return [(message, message.score) for message in rows]
+
+
+def _all_terms(entries, terms):
+    # One entry per (message, term), so a message has every term when it has len(terms) entries.
+    return entries.filter(term__in=terms).values('message_id').annotate(matched=Count('id')).filter(matched=len(terms))
+
+
+def _inverted_page(user, terms, cursor, limit):
+    # Messages must contain every term; they rank by term frequency.
+    matches = _all_terms(MessageSearchTerm.objects.filter(user=user), terms).annotate(score=Sum('weight'))
+    if cursor:
+        matches = matches.filter(_keyset('score', 'message_id', cursor, int))
+    ranked = list(matches.order_by('-score', '-message_id')[:limit + 1])
+    messages = ChatMessage.objects.select_related('conversation').in_bulk([row['message_id'] for row in ranked])
+    return [(messages[row['message_id']], row['score']) for row in ranked if row['message_id'] in messages]
+
+
+def search_messages(user, query, cursor=None, limit=20):
+    """
+    Rank the user's messages containing every term of ``query``.
+
+    Returns ``(results, next_cursor)`` where results is a list of
+    ``(message, score)`` pairs, best match first.
+    """
+    terms = list(tokenize(query))
+    if not terms:
+        return [], None
+
+    if uses_fulltext():
+        rows = _fulltext_page(user, terms, cursor, limit)
+    else:
+        rows = _inverted_page(user, terms, cursor, limit)
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    message, score = rows[-1]
+    return rows, encode_cursor(score, message.pk)
+
+
+def filter_messages(queryset, query):
+    """
+    Restrict a ChatMessage queryset to messages containing every term of ``query``, unranked.
+    """
+    terms = list(tokenize(query))
+    if not terms:
+        return queryset.none()
+    if uses_fulltext(queryset.db):
+        return queryset.annotate(search_score=_fulltext_match(terms)).filter(search_score__gt=0)
+    return queryset.filter(pk__in=_all_terms(MessageSearchTerm.objects.all(), terms).values('message_id'))
+
+
+def highlight(content, query):
+    """
+    Return an HTML-escaped snippet of ``content`` around the first match,
+    with matched terms wrapped in ``<mark>``.
+    """
+    terms = sorted(tokenize(query), key=len, reverse=True)
+    if not terms:
+        return escape(content[:2 * SNIPPET_RADIUS])
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')', re.IGNORECASE)
+
+    first = pattern.search(content)
+    start = max(0, first.start() - SNIPPET_RADIUS) if first else 0
+    end = min(len(content), start + 2 * SNIPPET_RADIUS + (first.end() - first.start() if first else 0))
+    snippet = content[start:end]
+
+    parts, position = [], 0
+    for match in pattern.finditer(snippet):
+        parts.append(escape(snippet[position:match.start()]))
+        parts.append(f"<mark>{escape(match.group(0))}</mark>")
+        position = match.end()
+    parts.append(escape(snippet[position:]))
+
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(content) else ''
+    return prefix + ''.join(parts) + suffix
@@ -0,0 +1,119 @@
+"""
+Server-Sent Events stream for a chat turn.
+
+Events, in order:
+
+- ``services``: the detected services and the conversation id (null for a
+  new conversation, which is only written with the turn)
+- ``permissions``: whether the user still has to grant access to some services
+- ``actions``: the results of the Google actions, when any ran
+- ``token``: one per assistant token, as soon as it is generated
+- ``done``: the conversation id and the persisted user (and assistant) message
+- ``error``: sent instead of ``done`` if the turn fails mid-stream
+
+The turn is written once, after the last token, through chat.record_turn.
+"""
+
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+
+from integrations.actions import run_actions
+from integrations.jobs import refresh_after_turn
+
+from . import assistant
+from .chat import record_turn
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _message_payload(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def _opening_events(conversation, detected_services, missing):
+    yield sse_event('services', {
+        'conversation_id': conversation.id,
+        'detected_services': detected_services,
+    })
+    yield sse_event('permissions', {
+        'requires_permissions': bool(missing),
+        'missing_permissions': missing,
+    })
+
+
+def _done_event(user_message, assistant_message):
+    return sse_event('done', {
+        'conversation_id': user_message.conversation_id,
+        'user_message': _message_payload(user_message),
+        'assistant_message': _message_payload(assistant_message) if assistant_message else None,
+    })
+
+
+def chat_turn_events(user, conversation, content, detected_services, missing):
+    """
+    Generate the SSE stream for a chat turn (WSGI).
+    """
+    yield from _opening_events(conversation, detected_services, missing)
+    try:
+        if missing:
+            user_message, _ = record_turn(conversation, content, detected_services)
+            yield _done_event(user_message, None)
+            return
+
+        actions = run_actions(user, detected_services, content)
+        if actions:
+            yield sse_event('actions', actions)
+
+        tokens = []
+        for token in assistant.generate_reply_tokens(detected_services, actions):
+            tokens.append(token)
+            yield sse_event('token', {'text': token})
+
+        user_message, assistant_message = record_turn(conversation, content, detected_services, ''.join(tokens))
+        refresh_after_turn(user, actions)
+        yield _done_event(user_message, assistant_message)
+    except Exception as e:
+        logger.error("Chat stream error: %s", e)
+        yield sse_event('error', {'error': str(e)})
+
+
+async def achat_turn_events(user, conversation, content, detected_services, missing):
+    """
+    Generate the SSE stream for a chat turn (ASGI).
+    """
+    for event in _opening_events(conversation, detected_services, missing):
+        yield event
+    try:
+        if missing:
+            user_message, _ = await sync_to_async(record_turn)(conversation, content, detected_services)
+            yield _done_event(user_message, None)
+            return
+
+        actions = await sync_to_async(run_actions)(user, detected_services, content)
+        if actions:
+            yield sse_event('actions', actions)
+
+        tokens = []
+        async for token in assistant.agenerate_reply_tokens(detected_services, actions):
+            tokens.append(token)
+            yield sse_event('token', {'text': token})
+
+        user_message, assistant_message = await sync_to_async(record_turn)(
+            conversation, content, detected_services, ''.join(tokens)
+        )
+        await sync_to_async(refresh_after_turn)(user, actions)
+        yield _done_event(user_message, assistant_message)
+    except Exception as e:
+        logger.error("Chat stream error: %s", e)
+        yield sse_event('error', {'error': str(e)})
@@ -1,3 +1,1002 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qsl
 
-# Create your tests here.
+import httpx
+from asgiref.sync import sync_to_async
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management import call_command
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, override_settings
+from django.utils import timezone
+
+from integrations import quota
+from integrations.fake_google import FakeGoogle, serve
+from lume_django import metrics
+from lume_django.db_router import STICKY_SESSION_KEY, replica_reads
+from lume_django.log import JsonFormatter, SamplingFilter
+from lume_django.ratelimit import DatabaseStore, LocalMemoryStore, get_store, parse_rate
+from lume_django.responses import dumps
+from lume_django.testing import LumeTestCase, LumeTransactionTestCase
+from . import async_views, loadtest
+from .accounts import OAuthStateConsumed, consume_oauth_state
+from .chat import get_or_start_conversation, record_turn
+from .archive import archive_conversation, rehydrate_conversation
+from .models import (
+    User, OAuthState, ChatConversation, ChatMessage, MessageSearchTerm, ServicePermissionRequest,
+    ArchivedConversation,
+)
+from .search import highlight
+
+
+def _json(response):
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return response.json()
+
+
+def _record(name='oauth.views', level=logging.INFO, msg='hello %s', args=('world',), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class LoggingTests(LumeTestCase):
+    def test_json_formatter_includes_extra_fields(self):
+        line = JsonFormatter().format(_record(user_id=7))
+        payload = json.loads(line)
+        self.assertEqual(payload['msg'], 'hello world')
+        self.assertEqual(payload['logger'], 'oauth.views')
+        self.assertEqual(payload['user_id'], 7)
+
+    def test_sampling_filter_uses_longest_prefix(self):
+        sampler = SamplingFilter('oauth=1.0,oauth.views=0.0')
+        self.assertFalse(sampler.filter(_record('oauth.views')))
+        self.assertTrue(sampler.filter(_record('oauth.models')))
+
+    def test_sampling_filter_never_drops_warnings(self):
+        sampler = SamplingFilter({'oauth': 0.0})
+        self.assertTrue(sampler.filter(_record('oauth.views', level=logging.ERROR)))
+
+    def test_user_info_does_not_log_session_contents(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com')
+        self.client.force_login(user)
+        with self.assertLogs('oauth.views', level='DEBUG') as logs:
+            self.client.get('/api/user/info/')
+        output = '\n'.join(logs.output)
+        self.assertIn('session_keys', output)
+        self.assertNotIn(self.client.session.session_key, output)
+
+
+def _fake_flow(scopes=()):
+    credentials = SimpleNamespace(
+        token='access-token',
+        refresh_token='refresh-token',
+        expiry=timezone.now() + timedelta(hours=1),
+        scopes=list(scopes),
+    )
+    return mock.Mock(credentials=credentials)
+
+
+class OAuthCallbackTests(LumeTestCase):
+    user_info = {'id': 'g-123', 'email': 'bob@example.com', 'picture': 'https://example.com/bob.png'}
+
+    def _create_state(self, state, services=None):
+        oauth_state = OAuthState(state=state)
+        oauth_state.set_requested_services(services or {})
+        oauth_state.save()
+        return oauth_state
+
+    def _callback(self, state):
+        with mock.patch('oauth.views.get_google_oauth_flow', return_value=_fake_flow()), \
+                mock.patch('oauth.views.google_api.get_json', return_value=self.user_info):
+            return self.client.get('/oauth/callback/', {'state': state, 'code': 'abc'})
+
+    def test_callback_creates_user_and_spends_state(self):
+        self._create_state('s1')
+        response = self._callback('s1')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('auth_success=true', response['Location'])
+
+        user = User.objects.get(google_id='g-123')
+        self.assertEqual(user.access_token, 'access-token')
+        state = OAuthState.objects.get(state='s1')
+        self.assertTrue(state.used)
+        self.assertEqual(state.user, user)
+
+    def test_callback_logs_user_in(self):
+        self._create_state('s1')
+        with self.assertLogs('oauth.views', level='INFO') as logs:
+            response = self._callback('s1')
+        self.assertIn('auth_success=true', response['Location'])
+        user = User.objects.get(google_id='g-123')
+        self.assertEqual(self.client.session['_auth_user_id'], str(user.pk))
+        record = next(r for r in logs.records if r.msg == "User logged in: %s")
+        self.assertTrue(record.new_user)
+
+    def test_callback_state_cannot_be_reused(self):
+        self._create_state('s1')
+        self._callback('s1')
+        response = self._callback('s1')
+        self.assertIn('error=invalid_state', response['Location'])
+
+    def test_consume_oauth_state_is_single_use(self):
+        state = OAuthState.objects.create(state='s2')
+        consume_oauth_state(state)
+        with self.assertRaises(OAuthStateConsumed):
+            consume_oauth_state(state)
+
+    def test_service_callback_grants_permissions_in_bulk(self):
+        user = User.objects.create_user(username='bob', email='bob@example.com', google_id='g-123')
+        ServicePermissionRequest.objects.create(user=user, service_name='email')
+        state = OAuthState.objects.create(state='s3', user=user)
+        state.set_requested_services({'email': True, 'calendar': True, 'tasks': False})
+        state.save()
+
+        # state+user lookup, state UPDATE, user UPDATE, permission upsert,
+        # plus the savepoint pair around the transaction inside TestCase.
+        with self.assertNumQueries(6), \
+                mock.patch('oauth.views.get_google_oauth_flow', return_value=_fake_flow()):
+            response = self.client.get('/oauth/service-callback/', {'state': 's3', 'code': 'abc'})
+
+        self.assertIn('service_perms_granted=true', response['Location'])
+        user.refresh_from_db()
+        self.assertTrue(user.gmail_permission)
+        self.assertTrue(user.calendar_permission)
+        self.assertFalse(user.tasks_permission)
+        granted = ServicePermissionRequest.objects.filter(user=user, is_granted=True)
+        self.assertEqual(sorted(granted.values_list('service_name', flat=True)), ['calendar', 'email'])
+
+
+def _fake_google(user_info, token_status=200):
+    """httpx transport standing in for Google's token and userinfo endpoints"""
+    def handler(request):
+        if request.url.path == '/token':
+            form = dict(parse_qsl(request.content.decode()))
+            if token_status != 200 or form.get('grant_type') != 'authorization_code':
+                return httpx.Response(token_status, json={'error': 'invalid_grant'})
+            return httpx.Response(200, json={
+                'access_token': f"access-{form['code']}",
+                'refresh_token': 'refresh-token',
+                'expires_in': 3600,
+                'scope': 'openid https://www.googleapis.com/auth/gmail.readonly',
+                'token_type': 'Bearer',
+            })
+        if request.url.path == '/userinfo' and request.headers['Authorization'].startswith('Bearer access-'):
+            return httpx.Response(200, json=user_info)
+        return httpx.Response(404)
+    return httpx.MockTransport(handler)
+
+
+@override_settings(GOOGLE_TOKEN_URI='https://google.test/token', GOOGLE_USERINFO_URI='https://google.test/userinfo')
+class AsyncOAuthCallbackTests(LumeTestCase):
+    user_info = OAuthCallbackTests.user_info
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    async def _call(self, view, path, params, token_status=200):
+        request = self.factory.get(path, params)
+        SessionMiddleware(lambda request: None).process_request(request)
+        client = httpx.AsyncClient(transport=_fake_google(self.user_info, token_status))
+        with mock.patch('oauth.google_async.get_client', return_value=client):
+            return await view(request)
+
+    async def test_callback_creates_user_and_spends_state(self):
+        await OAuthState.objects.acreate(state='a1', requested_services='{}')
+        response = await self._call(async_views.oauth_callback, '/oauth/callback/', {'state': 'a1', 'code': 'abc'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('auth_success=true', response['Location'])
+
+        user = await User.objects.aget(google_id='g-123')
+        self.assertEqual(user.access_token, 'access-abc')
+        self.assertEqual(user.refresh_token, 'refresh-token')
+        self.assertIn('gmail.readonly', user.granted_scopes)
+        state = await OAuthState.objects.aget(state='a1')
+        self.assertTrue(state.used)
+        self.assertEqual(state.user_id, user.pk)
+
+    async def test_rejected_token_exchange_leaves_state_unused(self):
+        await OAuthState.objects.acreate(state='a2', requested_services='{}')
+        response = await self._call(
+            async_views.oauth_callback, '/oauth/callback/', {'state': 'a2', 'code': 'abc'}, token_status=400
+        )
+        self.assertIn('error=auth_failed', response['Location'])
+        self.assertFalse((await OAuthState.objects.aget(state='a2')).used)
+        self.assertFalse(await User.objects.filter(google_id='g-123').aexists())
+
+    async def test_service_callback_grants_permissions(self):
+        user = await User.objects.acreate(username='bob', email='bob@example.com', google_id='g-123')
+        await OAuthState.objects.acreate(state='a3', user=user, requested_services=json.dumps({'email': True}))
+        response = await self._call(
+            async_views.service_permission_callback, '/oauth/service-callback/', {'state': 'a3', 'code': 'xyz'}
+        )
+        self.assertIn('service_perms_granted=true', response['Location'])
+        user = await User.objects.aget(pk=user.pk)
+        self.assertTrue(user.gmail_permission)
+        self.assertEqual(user.access_token, 'access-xyz')
+
+    async def test_rejects_other_methods(self):
+        response = await async_views.oauth_callback(self.factory.post('/oauth/callback/'))
+        self.assertEqual(response.status_code, 405)
+
+
+class SendMessageTests(LumeTestCase):
+    calendar_only = {'email': False, 'calendar': True, 'tasks': False, 'keep': False}
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='carol', email='carol@example.com', calendar_permission=True
+        )
+        self.client.force_login(self.user)
+
+    def _send(self, message, conversation_id=None):
+        payload = {'message': message, 'conversation_id': conversation_id}
+        return self.client.post('/api/chat/send/', json.dumps(payload), content_type='application/json')
+
+    def test_record_turn_statement_count(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='Plans')
+        # SAVEPOINT, the conversation row lock, one INSERT for both messages,
+        # one INSERT into the search index (SQLite has no FULLTEXT), one
+        # UPDATE, RELEASE.
+        with self.assertNumQueries(6):
+            user_message, assistant_message = record_turn(
+                conversation, 'Schedule a meeting', self.calendar_only, 'Done'
+            )
+        self.assertIsNotNone(user_message.pk)
+        self.assertIsNotNone(assistant_message.pk)
+        self.assertEqual(user_message.get_detected_services(), self.calendar_only)
+
+    def test_record_turn_inserts_a_new_conversation(self):
+        conversation = get_or_start_conversation(self.user, None, 'Schedule a meeting')
+        self.assertIsNone(conversation.pk)
+        # SAVEPOINT, the conversation INSERT, one INSERT for both messages,
+        # one INSERT into the search index, one UPDATE, RELEASE.
+        with self.assertNumQueries(6):
+            user_message, _ = record_turn(conversation, 'Schedule a meeting', self.calendar_only, 'Done')
+        stored = ChatConversation.objects.get(pk=conversation.pk)
+        self.assertEqual((stored.title, stored.message_count), ('Schedule a meeting', 2))
+        self.assertEqual(user_message.conversation_id, stored.pk)
+
+    def test_record_turn_without_bulk_insert_returning(self):
+        # MySQL, with both messages stamped in the same clock tick
+        conversation = ChatConversation.objects.create(user=self.user, title='Plans')
+        now = timezone.now()
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False), \
+                mock.patch('django.utils.timezone.now', return_value=now):
+            user_message, assistant_message = record_turn(
+                conversation, 'Schedule a meeting', self.calendar_only, 'Done'
+            )
+        self.assertEqual(user_message.timestamp, assistant_message.timestamp)
+        self.assertEqual(ChatMessage.objects.get(pk=user_message.pk).role, 'user')
+        self.assertEqual(ChatMessage.objects.get(pk=assistant_message.pk).role, 'assistant')
+        self.assertFalse(MessageSearchTerm.objects.filter(message=None).exists())
+        self.assertTrue(MessageSearchTerm.objects.filter(message=user_message, term='meeting').exists())
+
+    def test_detected_services_round_trip_as_bitmask(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='Plans')
+        user_message, _ = record_turn(conversation, 'Schedule a meeting', self.calendar_only, 'Done')
+
+        stored = ChatMessage.objects.get(pk=user_message.pk)
+        self.assertEqual(stored.detected_services, 2)
+        self.assertEqual(stored.get_detected_services(), self.calendar_only)
+        self.assertEqual(list(ChatMessage.objects.with_service('calendar')), [stored])
+        self.assertFalse(ChatMessage.objects.with_service('email').exists())
+
+    def test_unknown_service_bits_are_ignored(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='Plans')
+        user_message, _ = record_turn(conversation, 'Schedule a meeting', self.calendar_only, 'Done')
+        ChatMessage.objects.filter(pk=user_message.pk).update(detected_services=16 | 2)
+        self.assertEqual(ChatMessage.objects.get(pk=user_message.pk).get_detected_services(), self.calendar_only)
+
+    def test_send_message_writes_both_messages(self):
+        response = self._send('Schedule a meeting tomorrow')
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertTrue(data['detected_services']['calendar'])
+
+        conversation = ChatConversation.objects.get(pk=data['conversation_id'])
+        roles = list(conversation.messages.values_list('role', flat=True))
+        self.assertEqual(roles, ['user', 'assistant'])
+        self.assertEqual(data['assistant_message']['id'], conversation.messages.get(role='assistant').id)
+
+    def test_send_message_reports_missing_permissions(self):
+        response = self._send('Send an email to Alice')
+        data = response.json()
+        self.assertTrue(data['requires_permissions'])
+        self.assertEqual(data['missing_permissions'], ['email'])
+        self.assertEqual(ChatMessage.objects.filter(conversation_id=data['conversation_id']).count(), 1)
+
+    def test_failed_detection_writes_nothing(self):
+        with mock.patch('oauth.views.detect_services', side_effect=RuntimeError('boom')):
+            response = self._send('Schedule a meeting tomorrow')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(ChatConversation.objects.exists())
+
+
+class ConversationListingTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dave', email='dave@example.com')
+        self.client.force_login(self.user)
+
+    def _listing(self):
+        return {c['id']: c['message_count'] for c in self.client.get('/api/chat/conversations/').json()['conversations']}
+
+    def test_listing_uses_maintained_counts(self):
+        for i in range(5):
+            conversation = ChatConversation.objects.create(user=self.user, title=f'c{i}', message_count=0)
+            record_turn(conversation, 'hello', {}, 'hi')
+
+        # Session load and save (4), user, the list version for the ETag, the
+        # backfill check and the listing, independent of the number of conversations.
+        with self.assertNumQueries(8):
+            counts = self._listing()
+        self.assertEqual(set(counts.values()), {2})
+
+    def test_listing_falls_back_to_live_counts(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='legacy')
+        ChatMessage.objects.create(conversation=conversation, role='user', content='old')
+        ChatConversation.objects.create(user=self.user, title='legacy 2')
+
+        with self.assertNumQueries(8):
+            counts = self._listing()
+        self.assertEqual(counts[conversation.id], 1)
+
+    def test_backfill_command(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='legacy')
+        message = ChatMessage.objects.create(conversation=conversation, role='user', content='old')
+
+        call_command('backfill_conversation_stats', stdout=mock.Mock())
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 1)
+        self.assertEqual(conversation.last_message_at, message.timestamp)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTests(LumeTestCase):
+    # "replica" is a separate test database that nothing replicates into, so
+    # rows written to the primary only show up if the read went there.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rita', email='rita@example.com')
+        self.user.save(using='replica')
+        self.client.force_login(self.user)
+
+    def _titles(self):
+        return [c['title'] for c in self.client.get('/api/chat/conversations/').json()['conversations']]
+
+    def test_history_reads_go_to_replica(self):
+        ChatConversation.objects.create(user=self.user, title='primary only', message_count=0)
+        ChatConversation.objects.using('replica').create(user=self.user, title='replicated', message_count=0)
+        self.assertEqual(self._titles(), ['replicated'])
+
+    def test_reads_stick_to_primary_after_send(self):
+        self.client.post(
+            '/api/chat/send/', json.dumps({'message': 'Hello there'}), content_type='application/json'
+        )
+        self.assertEqual(self._titles(), ['Hello there'])
+        self.assertEqual(ChatConversation.objects.using('replica').count(), 0)
+
+    def test_stickiness_expires(self):
+        with self.settings(REPLICA_STICKY_SECONDS=0):
+            self.client.post(
+                '/api/chat/send/', json.dumps({'message': 'Hello there'}), content_type='application/json'
+            )
+        self.assertEqual(self._titles(), [])
+
+    def test_users_and_oauth_state_stay_on_primary(self):
+        @replica_reads
+        def view(request):
+            return {
+                model: router.db_for_read(model)
+                for model in (User, OAuthState, ChatConversation, ChatMessage)
+            }
+
+        request = SimpleNamespace(session={})
+        self.assertEqual(view(request), {
+            User: 'default', OAuthState: 'default', ChatConversation: 'replica', ChatMessage: 'replica',
+        })
+        self.assertEqual(router.db_for_read(ChatConversation), 'default')
+        self.assertEqual(router.db_for_write(ChatConversation), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_session_write_without_replicas(self):
+        self.client.post(
+            '/api/chat/send/', json.dumps({'message': 'Hello there'}), content_type='application/json'
+        )
+        self.assertNotIn(STICKY_SESSION_KEY, self.client.session)
+
+
+class PaginationTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='erin', email='erin@example.com')
+        self.client.force_login(self.user)
+
+    def _walk(self, url, key):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            data = _json(self.client.get(url, params))
+            seen.append([item['id'] for item in data[key]])
+            cursor = data['next_cursor']
+            if not cursor:
+                return seen
+
+    def test_conversations_are_paged_newest_first(self):
+        ids = [ChatConversation.objects.create(user=self.user, title=str(i), message_count=0).id for i in range(7)]
+        pages = self._walk('/api/chat/conversations/', 'conversations')
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), list(reversed(ids)))
+
+    def test_messages_load_older_pages(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='long', message_count=0)
+        for i in range(4):
+            record_turn(conversation, f'question {i}', {}, f'answer {i}')
+        ids = list(conversation.messages.order_by('timestamp', 'id').values_list('id', flat=True))
+
+        pages = self._walk(f'/api/chat/conversations/{conversation.id}/', 'messages')
+        # Each page is in display order; later pages hold older messages.
+        self.assertEqual(pages[0], ids[-3:])
+        self.assertEqual(sum(reversed(pages), []), ids)
+
+    @override_settings(CHAT_PAGE_SIZE=2)
+    def test_unpaginated_without_limit_or_cursor(self):
+        conversation = ChatConversation.objects.create(user=self.user, title='long', message_count=0)
+        for i in range(2):
+            ChatConversation.objects.create(user=self.user, title=str(i), message_count=0)
+            record_turn(conversation, f'question {i}', {}, f'answer {i}')
+
+        data = _json(self.client.get('/api/chat/conversations/'))
+        self.assertEqual(len(data['conversations']), 3)
+        self.assertFalse(data['has_more'])
+        data = _json(self.client.get(f'/api/chat/conversations/{conversation.id}/'))
+        self.assertEqual(len(data['messages']), 4)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/chat/conversations/', {'cursor': '!!not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid cursor')
+
+    def test_invalid_limit_is_rejected(self):
+        response = self.client.get('/api/chat/conversations/', {'limit': 'ten'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid limit')
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def _fake_tokens(detected_services, actions=None):
+    yield from ['Sure, ', 'booked ', 'it.']
+
+
+class SendMessageStreamTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='frank', email='frank@example.com', calendar_permission=True
+        )
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        self.payload = json.dumps({'message': 'Schedule a meeting'})
+
+    def _check_events(self, events):
+        names = [name for name, _ in events]
+        self.assertEqual(names, ['services', 'permissions', 'token', 'token', 'token', 'done'])
+        self.assertTrue(events[0][1]['detected_services']['calendar'])
+        self.assertFalse(events[1][1]['requires_permissions'])
+
+        # The conversation is new, so it only exists once the turn is written
+        self.assertIsNone(events[0][1]['conversation_id'])
+        done = events[-1][1]
+        self.assertEqual(done['assistant_message']['content'], 'Sure, booked it.')
+        conversation = ChatConversation.objects.get(pk=done['conversation_id'])
+        self.assertEqual(list(conversation.messages.values_list('content', flat=True)),
+                         ['Schedule a meeting', 'Sure, booked it.'])
+
+    @mock.patch('oauth.assistant.generate_reply_tokens', _fake_tokens)
+    def test_stream_under_wsgi(self):
+        response = self.client.post('/api/chat/send/stream/', self.payload, content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self._check_events(_parse_sse(b''.join(response.streaming_content).decode()))
+
+    @mock.patch('oauth.assistant.generate_reply_tokens', _fake_tokens)
+    async def test_stream_under_asgi(self):
+        response = await self.async_client.post(
+            '/api/chat/send/stream/', self.payload, content_type='application/json'
+        )
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = _parse_sse(body)
+        await sync_to_async(self._check_events)(events)
+
+    def test_stream_stops_at_missing_permissions(self):
+        payload = json.dumps({'message': 'Email the report to Alice'})
+        response = self.client.post('/api/chat/send/stream/', payload, content_type='application/json')
+        events = _parse_sse(b''.join(response.streaming_content).decode())
+        self.assertEqual([name for name, _ in events], ['services', 'permissions', 'done'])
+        self.assertEqual(events[1][1]['missing_permissions'], ['email'])
+        self.assertIsNone(events[2][1]['assistant_message'])
+
+
+class SearchTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gina', email='gina@example.com')
+        self.client.force_login(self.user)
+        self.conversation = ChatConversation.objects.create(user=self.user, title='Trips', message_count=0)
+
+    def _search(self, **params):
+        return self.client.get('/api/chat/search/', params).json()
+
+    def test_results_are_ranked_and_highlighted(self):
+        record_turn(self.conversation, 'Book a flight to Paris', {}, 'Flights to Paris, Paris and more Paris')
+        record_turn(self.conversation, 'Flight to Paris: which flight?', {}, 'Which hotel?')
+
+        data = self._search(q='paris flight')
+        contents = [r['highlight'] for r in data['results']]
+        # Every term has to match: the reply mentions Paris but not "flight"
+        self.assertEqual(len(contents), 2)
+        self.assertEqual(contents[0], '<mark>Flight</mark> to <mark>Paris</mark>: which <mark>flight</mark>?')
+        self.assertEqual(contents[1], 'Book a <mark>flight</mark> to <mark>Paris</mark>')
+
+    def test_results_are_paginated_and_private(self):
+        for i in range(5):
+            record_turn(self.conversation, f'budget review {i}', {}, 'ok')
+        other = User.objects.create_user(username='hank', email='hank@example.com')
+        record_turn(ChatConversation.objects.create(user=other, message_count=0), 'budget secrets', {}, 'ok')
+
+        first = self._search(q='budget', limit=3)
+        second = self._search(q='budget', limit=3, cursor=first['next_cursor'])
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        ids = [r['message_id'] for r in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 5)
+        self.assertTrue(all(r['conversation_id'] == self.conversation.id for r in first['results']))
+
+    def test_highlight_escapes_html(self):
+        self.assertEqual(highlight('<b>lunch</b> today', 'lunch'), '&lt;b&gt;<mark>lunch</mark>&lt;/b&gt; today')
+
+    def test_rebuild_search_index(self):
+        message = ChatMessage.objects.create(conversation=self.conversation, role='user', content='Quarterly report')
+        call_command('rebuild_search_index', stdout=mock.Mock())
+        terms = set(MessageSearchTerm.objects.filter(message=message).values_list('term', flat=True))
+        self.assertEqual(terms, {'quarterly', 'report'})
+        self.assertEqual(self._search(q='report')['results'][0]['message_id'], message.id)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(username='root', email='root@example.com', password='x')
+        record_turn(self.conversation, 'Renew passport', {}, 'Sure')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/oauth/chatmessage/', {'q': 'passport'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get('/admin/oauth/chatmessage/', {'q': 'passport visa'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+
+class ArchiveTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ivy', email='ivy@example.com', calendar_permission=True)
+        self.client.force_login(self.user)
+        self.conversation = ChatConversation.objects.create(user=self.user, title='Old', message_count=0)
+        for i in range(3):
+            record_turn(self.conversation, f'Schedule meeting {i}', {'calendar': True}, f'Reply {i}')
+        self.original = list(self.conversation.messages.order_by('timestamp', 'id').values_list(
+            'id', 'content', 'timestamp', 'detected_services'
+        ))
+
+    def _messages(self, **params):
+        return _json(self.client.get(f'/api/chat/conversations/{self.conversation.id}/', params))
+
+    def test_archive_moves_rows_into_compressed_blob(self):
+        before = self._messages(limit=4)
+
+        archive = archive_conversation(self.conversation)
+        self.assertEqual(archive.message_count, 6)
+        self.assertLess(archive.compressed_bytes, archive.raw_bytes)
+        self.assertFalse(ChatMessage.objects.filter(conversation=self.conversation).exists())
+
+        # Reads are served from the archive with the same pages and cursors.
+        after = self._messages(limit=4)
+        self.assertEqual(after['messages'], before['messages'])
+        older = self._messages(limit=4, cursor=after['next_cursor'])
+        self.assertEqual([m['id'] for m in older['messages']], [row[0] for row in self.original[:2]])
+
+    def test_rehydrate_restores_rows(self):
+        archive_conversation(self.conversation)
+        rehydrate_conversation(self.conversation)
+
+        restored = list(self.conversation.messages.order_by('timestamp', 'id').values_list(
+            'id', 'content', 'timestamp', 'detected_services'
+        ))
+        self.assertEqual(restored, self.original)
+        self.assertFalse(ArchivedConversation.objects.exists())
+        self.assertFalse(ChatConversation.objects.get(pk=self.conversation.pk).is_archived)
+
+    def test_sending_to_archived_conversation_rehydrates_it(self):
+        archive_conversation(self.conversation)
+        payload = json.dumps({'message': 'Schedule one more meeting', 'conversation_id': self.conversation.id})
+        self.client.post('/api/chat/send/', payload, content_type='application/json')
+        self.assertEqual(self.conversation.messages.count(), 8)
+
+    def test_archive_command_reports_savings(self):
+        ChatConversation.objects.filter(pk=self.conversation.pk).update(
+            updated_at=timezone.now() - timedelta(days=120)
+        )
+        out = mock.Mock()
+        call_command('archive_conversations', '--inactive-days=90', stdout=out)
+        self.assertIn('Archived 6 messages from 1 conversations', out.write.call_args[0][0])
+        self.assertTrue(ChatConversation.objects.get(pk=self.conversation.pk).is_archived)
+
+    def test_archive_skips_conversation_with_a_newer_turn(self):
+        stale = ChatConversation.objects.get(pk=self.conversation.pk)
+        record_turn(self.conversation, 'One more meeting', {'calendar': True}, 'Done')
+        self.assertIsNone(archive_conversation(stale))
+        self.assertEqual(ChatMessage.objects.filter(conversation=self.conversation).count(), 8)
+
+    def test_turn_recorded_after_archiving_rehydrates(self):
+        # The conversation was loaded, then archived before the turn was written
+        stale = ChatConversation.objects.get(pk=self.conversation.pk)
+        archive_conversation(self.conversation)
+        record_turn(stale, 'One more meeting', {'calendar': True}, 'Done')
+        self.assertFalse(ChatConversation.objects.get(pk=self.conversation.pk).is_archived)
+        self.assertEqual(ChatMessage.objects.filter(conversation=self.conversation).count(), 8)
+
+    def test_archived_messages_leave_search_until_rehydrated(self):
+        def search():
+            return _json(self.client.get('/api/chat/search/', {'q': 'meeting'}))['results']
+
+        self.assertEqual(len(search()), 3)
+        archive_conversation(self.conversation)
+        self.assertEqual(search(), [])
+        rehydrate_conversation(self.conversation)
+        self.assertEqual(len(search()), 3)
+
+
+class ConditionalGetTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='jack', email='jack@example.com')
+        self.client.force_login(self.user)
+        self.conversation = ChatConversation.objects.create(user=self.user, title='Notes', message_count=0)
+        record_turn(self.conversation, 'hello', {}, 'hi')
+
+    def _revalidate(self, url, queries):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+        # Session load and save (4) and the user, plus the validator lookups.
+        with self.assertNumQueries(5 + queries):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        return first['ETag']
+
+    def test_user_info_not_modified(self):
+        etag = self._revalidate('/api/user/info/', queries=0)
+        User.objects.filter(pk=self.user.pk).update(gmail_permission=True, updated_at=timezone.now())
+        self.assertEqual(self.client.get('/api/user/info/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_conversation_messages_not_modified(self):
+        url = f'/api/chat/conversations/{self.conversation.id}/'
+        etag = self._revalidate(url, queries=1)
+        record_turn(self.conversation, 'again', {}, 'hi again')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_conversation_list_not_modified(self):
+        etag = self._revalidate('/api/chat/conversations/', queries=1)
+        record_turn(self.conversation, 'again', {}, 'hi again')
+        self.assertEqual(self.client.get('/api/chat/conversations/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(CHAT_VERSION_CACHE='default')
+    def test_conversation_list_version_is_cached(self):
+        etag = self._revalidate('/api/chat/conversations/', queries=0)
+        record_turn(get_or_start_conversation(self.user, None, 'Another'), 'Another', {}, 'hi')
+        self.assertEqual(self.client.get('/api/chat/conversations/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ResponseCompressionTests(LumeTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='kim', email='kim@example.com')
+        self.client.force_login(self.user)
+        self.conversation = ChatConversation.objects.create(user=self.user, title='Long', message_count=0)
+        for i in range(30):
+            record_turn(self.conversation, f'question number {i}', {}, f'answer number {i}')
+        self.url = f'/api/chat/conversations/{self.conversation.id}/'
+
+    def test_datetimes_encode_like_isoformat(self):
+        now = timezone.now()
+        self.assertEqual(json.loads(dumps({'at': now})), {'at': now.isoformat()})
+
+    def test_message_stream_is_gzipped_when_accepted(self):
+        plain = _json(self.client.get(self.url))
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(json.loads(body), plain)
+        self.assertEqual(len(plain['messages']), 60)
+
+    @override_settings(API_COMPRESSION_MIN_BYTES=10 ** 6)
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/api/chat/conversations/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue(response.json()['success'])
+
+    def test_gzip_refused_with_zero_quality(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_STORE='local')
+class RateLimitTests(LumeTestCase):
+    def setUp(self):
+        get_store().clear()
+        self.user = User.objects.create_user(username='erin', email='erin@example.com')
+
+    def _send(self):
+        return self.client.post(
+            '/api/chat/send/', json.dumps({'message': 'Hello there'}), content_type='application/json'
+        )
+
+    @override_settings(RATE_LIMITS={'send_message': {'user': '2/min'}})
+    def test_send_message_throttled_per_user(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self._send().status_code, 200)
+        self.assertEqual(self._send().status_code, 200)
+
+        response = self._send()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.json()['retry_after'], 30)
+        self.assertEqual(ChatMessage.objects.filter(role='user').count(), 2)
+
+        # Another user has their own bucket.
+        other = User.objects.create_user(username='finn', email='finn@example.com')
+        self.client.force_login(other)
+        self.assertEqual(self._send().status_code, 200)
+
+    @override_settings(RATE_LIMITS={'send_message': {'user': '1/min', 'ip': '2/min'}})
+    def test_rejected_request_does_not_drain_the_ip_bucket(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self._send().status_code, 200)
+        for _ in range(3):
+            self.assertEqual(self._send().status_code, 429)
+
+        # Only the first request took from the shared per-IP bucket.
+        other = User.objects.create_user(username='finn', email='finn@example.com')
+        self.client.force_login(other)
+        self.assertEqual(self._send().status_code, 200)
+
+    @override_settings(RATE_LIMITS={'initiate_oauth': {'ip': '1/hour'}})
+    def test_initiate_oauth_throttled_per_ip(self):
+        flow = mock.Mock()
+        flow.authorization_url.return_value = ('https://accounts.example.com/auth', 'state')
+        with mock.patch('oauth.views.get_google_oauth_flow', return_value=flow):
+            first = self.client.post('/api/oauth/initiate/', '{}', content_type='application/json')
+            second = self.client.post('/api/oauth/initiate/', '{}', content_type='application/json')
+            other_ip = self.client.post(
+                '/api/oauth/initiate/', '{}', content_type='application/json', REMOTE_ADDR='10.0.0.2'
+            )
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second['Retry-After'], '3600')
+        self.assertEqual(other_ip.status_code, 200)
+        self.assertEqual(OAuthState.objects.count(), 2)
+
+    def test_buckets_refill(self):
+        for store, clock in ((LocalMemoryStore(), 'time.monotonic'), (DatabaseStore(), 'time.time')):
+            with self.subTest(store=type(store).__name__), mock.patch(clock) as now:
+                capacity, refill = parse_rate('2/10s')
+                now.return_value = 1000.0
+                self.assertEqual(store.take('k', capacity, refill), (True, 0.0))
+                self.assertEqual(store.take('k', capacity, refill), (True, 0.0))
+                allowed, retry_after = store.take('k', capacity, refill)
+                self.assertFalse(allowed)
+                self.assertAlmostEqual(retry_after, 5.0)
+
+                now.return_value = 1005.0
+                self.assertEqual(store.take('k', capacity, refill)[0], True)
+                self.assertEqual(store.take('k', capacity, refill)[0], False)
+
+    def test_local_store_evicts_least_recently_used(self):
+        store = LocalMemoryStore()
+        store.max_keys = 3
+        capacity, refill = parse_rate('1/hour')
+        store.take('hot', capacity, refill)
+        for i in range(10):
+            store.take(f'spray-{i}', capacity, refill)
+            store.take('hot', capacity, refill)
+        self.assertEqual(len(store._buckets), 3)
+        self.assertEqual(list(store._buckets)[-1], 'hot')
+        # Still empty: its bucket survived the spray
+        self.assertFalse(store.take('hot', capacity, refill)[0])
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('30/min'), (30, 0.5))
+        self.assertEqual(parse_rate('5 / 10s'), (5, 0.5))
+        with self.assertRaises(ValueError):
+            parse_rate('30 per minute')
+
+
+class MetricsTests(LumeTestCase):
+    def setUp(self):
+        metrics.get_store().clear()
+        self.user = User.objects.create_user(username='gus', email='gus@example.com')
+
+    def _scrape(self, **headers):
+        staff = User.objects.create_user(username='ops', email='ops@example.com', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_recorded_per_url_name(self):
+        self.client.force_login(self.user)
+        self.client.post('/api/chat/send/', json.dumps({'message': 'Hello there'}), content_type='application/json')
+        self.client.get('/no-such-page/')
+        text = self._scrape()
+        self.assertIn('lume_http_requests_total{view="oauth:send_message",method="POST",status="200"} 1', text)
+        self.assertIn('lume_http_requests_total{view="<unmatched>",method="GET",status="404"} 1', text)
+        self.assertIn('lume_http_request_duration_seconds_bucket{view="oauth:send_message",le="+Inf"} 1', text)
+        self.assertIn('# TYPE lume_http_request_duration_seconds histogram', text)
+        # The turn's queries were counted
+        self.assertIn('lume_http_db_queries_bucket{view="oauth:send_message",le="0.0"} 0', text)
+        self.assertIn('lume_http_db_queries_count{view="oauth:send_message"} 1', text)
+        self.assertIn('lume_http_response_size_bytes_count{view="oauth:send_message"} 1', text)
+
+    def test_histogram_buckets_are_cumulative_and_ordered(self):
+        metrics.observe('lume_http_db_queries', 3, view='v')
+        metrics.observe('lume_http_db_queries', 30, view='v')
+        lines = [line for line in metrics.render(metrics.registry.snapshot()).splitlines() if '_bucket' in line]
+        self.assertEqual([line.rsplit(' ', 1)[1] for line in lines], ['0', '0', '0', '1', '1', '1', '2', '2', '2'])
+        self.assertIn('lume_http_db_queries_sum{view="v"} 33\n', metrics.render(metrics.registry.snapshot()))
+        self.assertTrue(lines[-1].startswith('lume_http_db_queries_bucket{view="v",le="+Inf"}'))
+
+    def test_endpoint_is_protected(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.logout()
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3crét').status_code, 403)
+
+    async def test_async_requests_flush_off_the_event_loop(self):
+        threads = []
+        with mock.patch.object(metrics, '_flush', lambda: threads.append(threading.get_ident())):
+            await self.async_client.get('/no-such-page/')
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_google_calls_are_exported(self):
+        metrics.observe('lume_google_api_request_duration_seconds', 0.2, api='gmail', status=200)
+        quota.record('gmail', throttled=1, retries=1)
+        text = self._scrape()
+        self.assertIn('lume_google_api_request_duration_seconds_count{api="gmail",status="200"} 1', text)
+        self.assertIn('lume_google_api_throttled_total{api="gmail"} 1', text)
+
+    def test_file_store_adds_up_worker_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_STORE='files', METRICS_DIR=directory):
+            key = 'lume_http_requests_total{view="x",method="GET",status="200"}'
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+                json.dump({key: 2}, f)
+            metrics.inc('lume_http_requests_total', view='x', method='GET', status=200)
+            self.assertEqual(metrics.get_store().collect()[key], 3)
+            self.assertTrue(os.path.exists(os.path.join(directory, f'metrics-{os.getpid()}.json')))
+            metrics.get_store().clear()
+
+    async def test_async_requests_are_recorded(self):
+        async def view(request):
+            await User.objects.acount()
+            return HttpResponse('ok')
+
+        request = AsyncRequestFactory().get('/x/')
+        request.resolver_match = SimpleNamespace(view_name='async_view')
+        response = await metrics.MetricsMiddleware(view)(request)
+        self.assertEqual(response.status_code, 200)
+        samples = metrics.registry.snapshot()
+        self.assertEqual(samples['lume_http_requests_total{view="async_view",method="GET",status="200"}'], 1)
+        self.assertEqual(samples['lume_http_db_queries_bucket{view="async_view",le="1.0"}'], 1)
+
+
+class LoadTestTests(LumeTransactionTestCase):
+    # The WSGI runner drives requests from worker threads, which need to see
+    # each other's commits.
+
+    def setUp(self):
+        self.google = FakeGoogle()
+        self.google.seed(messages=5, events=3)
+        server = serve(self.google)
+        self.addCleanup(server.shutdown)
+        settings = override_settings(**server.settings())
+        settings.enable()
+        self.addCleanup(settings.disable)
+        environ = mock.patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1', 'OAUTHLIB_RELAX_TOKEN_SCOPE': '1'})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def assertCompleted(self, summary, messages):
+        self.assertEqual(summary['journeys'], {'completed': 1})
+        self.assertEqual(summary['errors'], 0)
+        views = summary['views']
+        self.assertEqual(views['send_message']['requests'], messages)
+        self.assertEqual(views['get_conversation_messages']['requests'], 1)
+        self.assertGreater(views['oauth_callback']['db_queries'], 0)
+        self.assertLessEqual(views['oauth_callback']['p50_ms'], views['oauth_callback']['p99_ms'])
+
+    def test_flow_keeps_state(self):
+        from .views import get_google_oauth_flow
+
+        auth_url, state = get_google_oauth_flow(state='s1').authorization_url()
+        self.assertEqual(state, 's1')
+        self.assertIn('state=s1', auth_url)
+
+    def test_wsgi_journey(self):
+        stats = loadtest.run('wsgi', ['lt-wsgi@example.com'], concurrency=1, messages=2)
+        self.assertCompleted(stats.summary(), 2)
+        user = User.objects.get(google_id='lt-wsgi')
+        self.assertTrue(user.has_service_permission('email'))
+        self.assertEqual(user.conversations.get().messages.count(), 4)
+        # The first message ran a Gmail action
+        self.assertIn('gmail', [api for api, method, path in self.google.calls])
+        self.assertEqual(len(stats.session_keys), 1)
+
+    def test_asgi_journey(self):
+        stats = loadtest.run('asgi', ['lt-asgi@example.com'], concurrency=1, messages=1)
+        self.assertCompleted(stats.summary(), 1)
+        self.assertTrue(User.objects.get(google_id='lt-asgi').has_service_permission('calendar'))
+        # The async callbacks are only routed for the run
+        self.assertEqual(self.client.get('/oauth/callback/').resolver_match.func.__module__, 'oauth.views')
+
+    def test_failed_step_ends_journey(self):
+        with mock.patch('oauth.views.google_api.get_json', side_effect=RuntimeError('down')):
+            summary = loadtest.run('wsgi', ['lt-down@example.com'], concurrency=1).summary()
+        self.assertEqual(summary['journeys'], {'failed': 1})
+        self.assertEqual(summary['views']['oauth_callback']['errors'], {'redirect: auth_failed': 1})
+        self.assertNotIn('send_message', summary['views'])
+
+    def test_command_reports_and_cleans_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            stdout = io.StringIO()
+            call_command(
+                'loadtest', '--users', '2', '--concurrency', '1', '--messages', '1', '--latency-ms', '0',
+                '--json', path, stdout=stdout,
+            )
+            with open(path) as f:
+                results = json.load(f)
+        self.assertEqual(set(results), {'wsgi', 'asgi'})
+        self.assertEqual(results['asgi']['journeys'], {'completed': 2})
+        self.assertIn('search_chat_messages', stdout.getvalue())
+        self.assertFalse(User.objects.filter(google_id__startswith='loadtest-').exists())
+
+    def test_db_queries_from_metrics(self):
+        before = loadtest.db_queries({
+            'lume_http_db_queries_sum{view="oauth:send_message"}': 10,
+            'lume_http_db_queries_count{view="oauth:send_message"}': 2,
+        })
+        after = loadtest.db_queries({
+            'lume_http_db_queries_sum{view="oauth:send_message"}': 40,
+            'lume_http_db_queries_count{view="oauth:send_message"}': 5,
+            'lume_http_db_queries_bucket{view="oauth:send_message",le="1.0"}': 5,
+        })
+        self.assertEqual(loadtest.queries_per_request(before, after), {'send_message': 10})
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4], 99), 4)
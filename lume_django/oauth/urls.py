@@ -1,14 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'oauth'
 
+# asgi.py turns on OAUTH_ASYNC_CALLBACKS so logins don't hold a thread while waiting on Google
+callbacks = async_views if settings.OAUTH_ASYNC_CALLBACKS else views
+
 urlpatterns = [
     # OAuth endpoints
     path('api/oauth/initiate/', views.initiate_oauth, name='initiate_oauth'),
-    path('oauth/callback/', views.oauth_callback, name='oauth_callback'),
+    path('oauth/callback/', callbacks.oauth_callback, name='oauth_callback'),
     path('api/oauth/request-service-permissions/', views.request_service_permissions, name='request_service_permissions'),
-    path('oauth/service-callback/', views.service_permission_callback, name='service_permission_callback'),
+    path('oauth/service-callback/', callbacks.service_permission_callback, name='service_permission_callback'),
     
     # User endpoints
     path('api/user/info/', views.get_user_info, name='get_user_info'),
@@ -16,6 +20,8 @@ urlpatterns = [
     
     # Chat endpoints
     path('api/chat/send/', views.send_message, name='send_message'),
+    path('api/chat/send/stream/', views.send_message_stream, name='send_message_stream'),
     path('api/chat/conversations/', views.get_conversations, name='get_conversations'),
     path('api/chat/conversations/<int:conversation_id>/', views.get_conversation_messages, name='get_conversation_messages'),
+    path('api/chat/search/', views.search_chat_messages, name='search_chat_messages'),
 ]
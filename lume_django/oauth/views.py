@@ -1,20 +1,37 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.contrib.auth import login, logout
 from django.conf import settings
-from django.utils import timezone
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 import google.auth.transport.requests
 import json
 import secrets
 import logging
 from datetime import timedelta
-from .models import User, OAuthState, ChatConversation, ChatMessage, ServicePermissionRequest
+from .models import User, OAuthState, ChatConversation
+from .accounts import OAuthStateConsumed, provision_google_user, grant_service_permissions
+from .chat import get_or_start_conversation, missing_permissions, build_assistant_reply, record_turn
+from .pagination import InvalidCursor, InvalidPageSize, get_page_size, keyset_page, keyset_slice
+from .archive import load_archived_messages
+from .conditional import (
+    user_info_etag, user_info_last_modified, conversation_list_etag,
+    conversation_messages_etag, conversation_messages_last_modified,
+)
+from .streaming import chat_turn_events, achat_turn_events
+from .search import search_messages, highlight
 from service_detector.google_services_detector import detect_services
+from integrations import google_api
+from integrations.actions import run_actions
+from integrations.jobs import refresh_after_turn, sync_contacts, warm_up_later
+from lume_django.db_router import pin_to_primary, replica_reads
+from lume_django.log import mapping_keys
+from lume_django.ratelimit import rate_limit
+from lume_django.responses import json_response, stream_json_response
 
 logger = logging.getLogger(__name__)
 
@@ -54,26 +71,27 @@ def get_google_oauth_flow(scopes=None, state=None):
         "web": {
             "client_id": getattr(settings, 'GOOGLE_CLIENT_ID', ''),
             "client_secret": getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_uri": getattr(settings, 'GOOGLE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
+            "token_uri": getattr(settings, 'GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
             "redirect_uris": [getattr(settings, 'GOOGLE_REDIRECT_URI', 'http://localhost:8000/oauth/callback/')]
         }
     }
     
+    # The state has to reach the OAuth session: setting flow.state afterwards
+    # leaves authorization_url() to make up its own
     flow = Flow.from_client_config(
         client_config,
         scopes=scopes,
-        redirect_uri=client_config["web"]["redirect_uris"][0]
+        redirect_uri=client_config["web"]["redirect_uris"][0],
+        state=state,
     )
     
-    if state:
-        flow.state = state
-    
     return flow
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('initiate_oauth')
 def initiate_oauth(request):
     """
     Stage 1: Initiate OAuth with base permissions only
@@ -99,7 +117,7 @@ def initiate_oauth(request):
             prompt='consent'
         )
         
-        return JsonResponse({
+        return json_response(request, {
             'success': True,
             'auth_url': auth_url,
             'state': state,
@@ -108,8 +126,58 @@ def initiate_oauth(request):
         })
     
     except Exception as e:
-        logger.error(f"OAuth initiation error: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error("OAuth initiation error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
+
+
+def complete_google_login(request, oauth_state, user_info, credentials):
+    """
+    Provision the Google user, log them in and redirect back to the frontend.
+    Shared by the sync and async OAuth callbacks.
+    """
+    # Create or update user and mark state as used, in one transaction
+    try:
+        user, created = provision_google_user(oauth_state, user_info, credentials)
+    except OAuthStateConsumed:
+        return redirect(f"{settings.FRONTEND_URL}?error=invalid_state")
+    
+    # Log user in
+    login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+    
+    logger.info("User logged in: %s", user.pk, extra={'user_id': user.pk, 'new_user': created})
+    if settings.CONTACTS_SYNC_ON_LOGIN:
+        sync_contacts.enqueue(user.pk, dedup_key=f'contacts:{user.pk}')
+    warm_up_later(user, User.SERVICE_PERMISSION_FIELDS)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Session keys after login: %s", mapping_keys(request.session))
+    
+    # Check if we need to request additional permissions
+    detected_services = oauth_state.get_requested_services()
+    needs_additional_perms = any(detected_services.values())
+    
+    if needs_additional_perms:
+        # Redirect to request additional permissions
+        redirect_url = f"{settings.FRONTEND_URL}?auth_success=true&state={oauth_state.state}&needs_service_perms=true"
+    else:
+        redirect_url = f"{settings.FRONTEND_URL}?auth_success=true"
+    
+    logger.debug("Redirecting to: %s", redirect_url)
+    response = redirect(redirect_url)
+    
+    # Explicitly set session cookie to ensure it persists
+    if request.session.session_key:
+        response.set_cookie(
+            key=settings.SESSION_COOKIE_NAME or 'sessionid',
+            value=request.session.session_key,
+            max_age=settings.SESSION_COOKIE_AGE,
+            path='/',
+            domain=settings.SESSION_COOKIE_DOMAIN,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=settings.SESSION_COOKIE_HTTPONLY,
+            samesite=settings.SESSION_COOKIE_SAMESITE
+        )
+    
+    return response
 
 
 @csrf_exempt
@@ -131,7 +199,7 @@ def oauth_callback(request):
         
         # Verify state
         try:
-            oauth_state = OAuthState.objects.get(state=state, used=False)
+            oauth_state = OAuthState.objects.only('id', 'state', 'requested_services').get(state=state, used=False)
         except OAuthState.DoesNotExist:
             return redirect(f"{settings.FRONTEND_URL}?error=invalid_state")
         
@@ -141,73 +209,12 @@ def oauth_callback(request):
         credentials = flow.credentials
         
         # Get user info
-        user_info_service = build('oauth2', 'v2', credentials=credentials)
-        user_info = user_info_service.userinfo().get().execute()
-        
-        # Create or update user
-        user, created = User.objects.get_or_create(
-            google_id=user_info['id'],
-            defaults={
-                'username': user_info['email'].split('@')[0],
-                'email': user_info['email'],
-                'profile_picture': user_info.get('picture'),
-            }
-        )
-        
-        if not created:
-            user.profile_picture = user_info.get('picture')
-        
-        # Store tokens
-        user.access_token = credentials.token
-        user.refresh_token = credentials.refresh_token or user.refresh_token
-        user.token_expires_at = credentials.expiry
-        user.set_scopes(credentials.scopes or [])
-        user.last_login_at = timezone.now()
-        user.save()
-        
-        # Mark state as used
-        oauth_state.used = True
-        oauth_state.user = user
-        oauth_state.save()
-        
-        # Log user in
-        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
-        
-        logger.info(f"User logged in: {user.email}")
-        logger.info(f"Session key after login: {request.session.session_key}")
-        logger.info(f"Session items: {dict(request.session.items())}")
-        
-        # Check if we need to request additional permissions
-        detected_services = oauth_state.get_requested_services()
-        needs_additional_perms = any(detected_services.values())
-        
-        if needs_additional_perms:
-            # Redirect to request additional permissions
-            redirect_url = f"{settings.FRONTEND_URL}?auth_success=true&state={state}&needs_service_perms=true"
-        else:
-            redirect_url = f"{settings.FRONTEND_URL}?auth_success=true"
-        
-        logger.info(f"Redirecting to: {redirect_url}")
-        response = redirect(redirect_url)
-        
-        # Explicitly set session cookie to ensure it persists
-        if request.session.session_key:
-            response.set_cookie(
-                key=settings.SESSION_COOKIE_NAME or 'sessionid',
-                value=request.session.session_key,
-                max_age=settings.SESSION_COOKIE_AGE,
-                path='/',
-                domain=settings.SESSION_COOKIE_DOMAIN,
-                secure=settings.SESSION_COOKIE_SECURE,
-                httponly=settings.SESSION_COOKIE_HTTPONLY,
-                samesite=settings.SESSION_COOKIE_SAMESITE
-            )
+        user_info = google_api.get_json(credentials.token, 'oauth2', '/oauth2/v2/userinfo')
         
-        logger.info(f"Response cookies: {response.cookies}")
-        return response
+        return complete_google_login(request, oauth_state, user_info, credentials)
     
     except Exception as e:
-        logger.error(f"OAuth callback error: {e}")
+        logger.error("OAuth callback error: %s", e)
         return redirect(f"{settings.FRONTEND_URL}?error=auth_failed")
 
 
@@ -227,10 +234,10 @@ def request_service_permissions(request):
             oauth_state = OAuthState.objects.get(state=state)
             user = oauth_state.user
         except OAuthState.DoesNotExist:
-            return JsonResponse({'error': 'Invalid state'}, status=400)
+            return json_response(request, {'error': 'Invalid state'}, status=400)
         
         if not user:
-            return JsonResponse({'error': 'User not found'}, status=400)
+            return json_response(request, {'error': 'User not found'}, status=400)
         
         # Build scopes for requested services
         scopes = BASE_SCOPES.copy()
@@ -256,7 +263,7 @@ def request_service_permissions(request):
             login_hint=user.email
         )
         
-        return JsonResponse({
+        return json_response(request, {
             'success': True,
             'auth_url': auth_url,
             'state': new_state,
@@ -265,8 +272,8 @@ def request_service_permissions(request):
         })
     
     except Exception as e:
-        logger.error(f"Service permission request error: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error("Service permission request error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
 
 
 @csrf_exempt
@@ -280,64 +287,46 @@ def service_permission_callback(request):
         code = request.GET.get('code')
         
         # Get OAuth state
-        oauth_state = OAuthState.objects.get(state=state, used=False)
-        user = oauth_state.user
+        oauth_state = OAuthState.objects.select_related('user').get(state=state, used=False)
         
         # Exchange code for tokens
         flow = get_google_oauth_flow(state=state)
         flow.fetch_token(code=code)
         credentials = flow.credentials
         
-        # Update user tokens
-        user.access_token = credentials.token
-        if credentials.refresh_token:
-            user.refresh_token = credentials.refresh_token
-        user.token_expires_at = credentials.expiry
-        user.set_scopes(credentials.scopes or [])
-        
-        # Update service permissions
-        requested_services = oauth_state.get_requested_services()
-        for service, enabled in requested_services.items():
-            if enabled:
-                setattr(user, f'{service}_permission', True)
-                ServicePermissionRequest.objects.update_or_create(
-                    user=user,
-                    service_name=service,
-                    defaults={
-                        'is_granted': True,
-                        'granted_at': timezone.now()
-                    }
-                )
-        
-        user.save()
-        oauth_state.used = True
-        oauth_state.save()
+        # Update user tokens and service permissions, and mark state as used
+        services = grant_service_permissions(oauth_state, credentials)
+        warm_up_later(oauth_state.user, services, granted=True)
         
         return redirect(f"{settings.FRONTEND_URL}?service_perms_granted=true")
     
     except Exception as e:
-        logger.error(f"Service permission callback error: {e}")
+        logger.error("Service permission callback error: %s", e)
         return redirect(f"{settings.FRONTEND_URL}?error=service_perm_failed")
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_info_etag, last_modified_func=user_info_last_modified)
 def get_user_info(request):
     """
     Get current user information
     """
     try:
-        logger.info(f"get_user_info called - Session key: {request.session.session_key}")
-        logger.info(f"is_authenticated: {request.user.is_authenticated}")
-        logger.info(f"User: {request.user}")
-        logger.info(f"Session data: {dict(request.session.items())}")
-        logger.info(f"Cookies: {request.COOKIES}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "get_user_info authenticated=%s session_keys=%s cookies=%s",
+                request.user.is_authenticated,
+                mapping_keys(request.session),
+                mapping_keys(request.COOKIES),
+            )
         
         if not request.user.is_authenticated:
-            return JsonResponse({'authenticated': False}, status=401)
+            return json_response(request, {'authenticated': False}, status=401)
         
         user = request.user
-        return JsonResponse({
+        return json_response(request, {
             'authenticated': True,
             'user': {
                 'id': user.id,
@@ -353,8 +342,8 @@ def get_user_info(request):
             }
         })
     except Exception as e:
-        logger.error(f"Get user info error: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error("Get user info error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
 
 
 @csrf_exempt
@@ -365,169 +354,280 @@ def logout_user(request):
     """
     try:
         logout(request)
-        return JsonResponse({'success': True})
+        return json_response(request, {'success': True})
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+        return json_response(request, {'error': str(e)}, status=500)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('send_message')
 def send_message(request):
     """
     Process user message and save to conversation history
     """
     try:
         if not request.user.is_authenticated:
-            return JsonResponse({'error': 'Not authenticated'}, status=401)
+            return json_response(request, {'error': 'Not authenticated'}, status=401)
         
         data = json.loads(request.body)
         message_content = data.get('message', '')
         conversation_id = data.get('conversation_id')
         
         if not message_content:
-            return JsonResponse({'error': 'Message is required'}, status=400)
+            return json_response(request, {'error': 'Message is required'}, status=400)
         
         user = request.user
         
-        # Get or create conversation
-        if conversation_id:
-            try:
-                conversation = ChatConversation.objects.get(id=conversation_id, user=user)
-            except ChatConversation.DoesNotExist:
-                conversation = ChatConversation.objects.create(
-                    user=user,
-                    title=message_content[:50]
-                )
-        else:
-            conversation = ChatConversation.objects.create(
-                user=user,
-                title=message_content[:50]
-            )
+        # Look up the conversation; a new one is written with the turn
+        conversation = get_or_start_conversation(user, conversation_id, message_content)
+        # Read-your-writes: keep this user's history reads off the replicas for a moment
+        pin_to_primary(request)
         
-        # Save user message
-        user_message = ChatMessage.objects.create(
-            conversation=conversation,
-            role='user',
-            content=message_content
-        )
-        
-        # Detect services
+        # Detect services before anything is written
         detected_services = detect_services(message_content)
-        user_message.set_detected_services(detected_services)
-        user_message.save()
         
         # Check if user has required permissions
-        missing_permissions = []
-        for service, detected in detected_services.items():
-            if detected:
-                permission_field = f'{service}_permission'
-                if not getattr(user, permission_field, False):
-                    missing_permissions.append(service)
-        
-        if missing_permissions:
+        missing = missing_permissions(user, detected_services)
+        
+        if missing:
             # Need to request additional permissions
-            return JsonResponse({
+            user_message, _ = record_turn(conversation, message_content, detected_services)
+            return json_response(request, {
                 'success': True,
                 'conversation_id': conversation.id,
                 'message_id': user_message.id,
                 'requires_permissions': True,
-                'missing_permissions': missing_permissions,
+                'missing_permissions': missing,
                 'detected_services': detected_services
             })
         
-        # TODO: Process message with AI and execute actions
-        # For now, just return a simple response
-        assistant_response = f"I detected the following services: {', '.join([k for k, v in detected_services.items() if v])}. Integration with Google APIs is pending."
-        
-        assistant_message = ChatMessage.objects.create(
-            conversation=conversation,
-            role='assistant',
-            content=assistant_response
+        # Independent services run concurrently, bounded by ACTION_DEADLINE_SECONDS
+        actions = run_actions(user, detected_services, message_content)
+        assistant_response = build_assistant_reply(detected_services, actions)
+        user_message, assistant_message = record_turn(
+            conversation, message_content, detected_services, assistant_response
         )
+        refresh_after_turn(user, actions)
         
-        conversation.updated_at = timezone.now()
-        conversation.save()
-        
-        return JsonResponse({
+        return json_response(request, {
             'success': True,
             'conversation_id': conversation.id,
             'user_message': {
                 'id': user_message.id,
                 'content': user_message.content,
-                'timestamp': user_message.timestamp.isoformat()
+                'timestamp': user_message.timestamp
             },
             'assistant_message': {
                 'id': assistant_message.id,
                 'content': assistant_message.content,
-                'timestamp': assistant_message.timestamp.isoformat()
+                'timestamp': assistant_message.timestamp
             },
-            'detected_services': detected_services
+            'detected_services': detected_services,
+            'actions': actions,
         })
     
     except Exception as e:
-        logger.error(f"Send message error: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error("Send message error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('send_message')
+def send_message_stream(request):
+    """
+    Streaming variant of send_message: emits detected services, permission
+    requirements and assistant tokens as Server-Sent Events
+    """
+    try:
+        if not request.user.is_authenticated:
+            return json_response(request, {'error': 'Not authenticated'}, status=401)
+        
+        data = json.loads(request.body)
+        message_content = data.get('message', '')
+        conversation_id = data.get('conversation_id')
+        
+        if not message_content:
+            return json_response(request, {'error': 'Message is required'}, status=400)
+        
+        user = request.user
+        conversation = get_or_start_conversation(user, conversation_id, message_content)
+        pin_to_primary(request)
+        detected_services = detect_services(message_content)
+        missing = missing_permissions(user, detected_services)
+        
+        # Under ASGI hand Django an async iterator so tokens are not buffered
+        events = achat_turn_events if isinstance(request, ASGIRequest) else chat_turn_events
+        response = StreamingHttpResponse(
+            events(user, conversation, message_content, detected_services, missing),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    except Exception as e:
+        logger.error("Send message stream error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conversation_list_etag)
 def get_conversations(request):
     """
     Get user's conversation history
     """
     try:
         if not request.user.is_authenticated:
-            return JsonResponse({'error': 'Not authenticated'}, status=401)
+            return json_response(request, {'error': 'Not authenticated'}, status=401)
         
-        conversations = ChatConversation.objects.filter(user=request.user)
+        try:
+            conversations, next_cursor = keyset_page(
+                ChatConversation.objects.filter(user=request.user).with_message_counts(),
+                'updated_at',
+                cursor=request.GET.get('cursor'),
+                limit=get_page_size(request, paged_by_default=False),
+            )
+        except InvalidPageSize:
+            return json_response(request, {'error': 'Invalid limit'}, status=400)
+        except InvalidCursor:
+            return json_response(request, {'error': 'Invalid cursor'}, status=400)
         
-        return JsonResponse({
+        return json_response(request, {
             'success': True,
             'conversations': [{
                 'id': conv.id,
                 'title': conv.title,
-                'created_at': conv.created_at.isoformat(),
-                'updated_at': conv.updated_at.isoformat(),
+                'created_at': conv.created_at,
+                'updated_at': conv.updated_at,
                 'message_count': conv.get_message_count()
-            } for conv in conversations]
+            } for conv in conversations],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
         })
     except Exception as e:
-        logger.error(f"Get conversations error: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error("Get conversations error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
+
+
+def _message_json(msg):
+    return {
+        'id': msg.id,
+        'role': msg.role,
+        'content': msg.content,
+        'timestamp': msg.timestamp,
+        'detected_services': msg.get_detected_services()
+    }
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conversation_messages_etag, last_modified_func=conversation_messages_last_modified)
 def get_conversation_messages(request, conversation_id):
     """
     Get messages for a specific conversation
     """
     try:
         if not request.user.is_authenticated:
-            return JsonResponse({'error': 'Not authenticated'}, status=401)
+            return json_response(request, {'error': 'Not authenticated'}, status=401)
         
         try:
             conversation = ChatConversation.objects.get(id=conversation_id, user=request.user)
         except ChatConversation.DoesNotExist:
-            return JsonResponse({'error': 'Conversation not found'}, status=404)
+            return json_response(request, {'error': 'Conversation not found'}, status=404)
         
-        messages = conversation.messages.all()
+        # Newest page first; ``cursor`` loads the page of older messages.
+        # Archived threads are read from their compressed blob.
+        try:
+            if conversation.is_archived:
+                messages, next_cursor = keyset_slice(
+                    load_archived_messages(conversation),
+                    'timestamp',
+                    cursor=request.GET.get('cursor'),
+                    limit=get_page_size(request, paged_by_default=False),
+                )
+            else:
+                messages, next_cursor = keyset_page(
+                    conversation.messages.all(),
+                    'timestamp',
+                    cursor=request.GET.get('cursor'),
+                    limit=get_page_size(request, paged_by_default=False),
+                )
+        except InvalidPageSize:
+            return json_response(request, {'error': 'Invalid limit'}, status=400)
+        except InvalidCursor:
+            return json_response(request, {'error': 'Invalid cursor'}, status=400)
+        messages.reverse()
+        
+        return stream_json_response(
+            request,
+            {
+                'success': True,
+                'conversation': {
+                    'id': conversation.id,
+                    'title': conversation.title,
+                    'created_at': conversation.created_at,
+                },
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+            },
+            'messages',
+            messages,
+            _message_json,
+        )
+    except Exception as e:
+        logger.error("Get conversation messages error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@replica_reads
+def search_chat_messages(request):
+    """
+    Search the current user's chat history
+    """
+    try:
+        if not request.user.is_authenticated:
+            return json_response(request, {'error': 'Not authenticated'}, status=401)
         
-        return JsonResponse({
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return json_response(request, {'error': 'Query is required'}, status=400)
+        
+        try:
+            results, next_cursor = search_messages(
+                request.user,
+                query,
+                cursor=request.GET.get('cursor'),
+                limit=get_page_size(request),
+            )
+        except InvalidPageSize:
+            return json_response(request, {'error': 'Invalid limit'}, status=400)
+        except InvalidCursor:
+            return json_response(request, {'error': 'Invalid cursor'}, status=400)
+        
+        return json_response(request, {
             'success': True,
-            'conversation': {
-                'id': conversation.id,
-                'title': conversation.title,
-                'created_at': conversation.created_at.isoformat(),
-            },
-            'messages': [{
-                'id': msg.id,
+            'query': query,
+            'results': [{
+                'message_id': msg.id,
+                'conversation_id': msg.conversation_id,
+                'conversation_title': msg.conversation.title,
                 'role': msg.role,
-                'content': msg.content,
-                'timestamp': msg.timestamp.isoformat(),
-                'detected_services': msg.get_detected_services()
-            } for msg in messages]
+                'timestamp': msg.timestamp,
+                'score': score,
+                'highlight': highlight(msg.content, query),
+            } for msg, score in results],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
         })
     except Exception as e:
-        logger.error(f"Get conversation messages error: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error("Search messages error: %s", e)
+        return json_response(request, {'error': str(e)}, status=500)
@@ -0,0 +1,72 @@
+import json
+
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .models import ProfileReport
+
+
+@admin.register(ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'mode', 'trigger')
+    list_filter = ('mode', 'trigger', 'view_name')
+    search_fields = ('path', 'view_name')
+    readonly_fields = (
+        'created_at', 'method', 'path', 'view_name', 'user', 'status_code', 'mode', 'trigger',
+        'duration_ms', 'query_count', 'query_ms', 'downloads', 'stages', 'slowest_queries',
+    )
+    exclude = ('collapsed', 'report')
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        download = self.admin_site.admin_view(self.download)
+        return [
+            path('<int:pk>/download/<str:kind>/', download, name='profiling_profilereport_download'),
+        ] + super().get_urls()
+
+    def download(self, request, pk, kind):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        report = get_object_or_404(ProfileReport, pk=pk)
+        if kind == 'collapsed':
+            # Input for flamegraph.pl or speedscope
+            response = HttpResponse(report.collapsed + '\n', content_type='text/plain; charset=utf-8')
+            filename = f'profile-{pk}.folded'
+        elif kind == 'json':
+            response = HttpResponse(json.dumps(report.report, indent=2), content_type='application/json')
+            filename = f'profile-{pk}.json'
+        else:
+            return HttpResponse(status=404)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.display(description='Download')
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">Collapsed stacks</a> · <a href="{}">JSON</a>',
+            reverse('admin:profiling_profilereport_download', args=[obj.pk, 'collapsed']),
+            reverse('admin:profiling_profilereport_download', args=[obj.pk, 'json']),
+        )
+
+    @admin.display(description='Stages')
+    def stages(self, obj):
+        return format_html_join(
+            '\n', '<div>{}: {} ms ({} calls)</div>',
+            ((name, stage['ms'], stage['calls']) for name, stage in obj.report.get('stages', {}).items()),
+        )
+
+    @admin.display(description='Slowest queries')
+    def slowest_queries(self, obj):
+        return format_html_join(
+            '\n', '<div><b>{} ms</b> [{}] <code>{}</code></div>',
+            ((query['ms'], query['alias'], query['sql']) for query in obj.report.get('queries', [])[:20]),
+        )
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profiling.profiler import MODES, SAMPLE, sign_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed X-Lume-Profile header value that profiles the requests carrying it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=MODES, default=SAMPLE, help="Profiler to run (default: sample)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(sign_token(options['mode']))
+        max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        self.stderr.write(f"Valid for {max_age} seconds; send it as the X-Lume-Profile header")
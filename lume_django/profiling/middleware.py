@@ -0,0 +1,161 @@
+"""
+Opt-in request profiling.
+
+A request is profiled when:
+
+- it carries ``X-Lume-Profile: <token>``, a signed token from
+  ``manage.py profile_token`` (valid for ``PROFILING_TOKEN_MAX_AGE``);
+- a staff user adds ``?_profile=1`` (or ``=sample`` / ``=cprofile``);
+- it is picked at random, with probability ``PROFILING_SAMPLE_RATE``
+  (always with the sampling profiler).
+
+Its stacks, SQL queries and detector stages are stored as a ProfileReport,
+browsable in the admin, and its id returned in ``X-Lume-Profile-Id``. The
+profile covers the request until the view returns (for streaming responses,
+until the stream starts). Other requests only pay for the trigger checks.
+"""
+
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import profiler
+from .models import ProfileReport
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_LUME_PROFILE'
+QUERY_FLAG = '_profile'
+
+
+def _flag_mode(request):
+    value = request.GET.get(QUERY_FLAG)
+    if value == profiler.CPROFILE:
+        return profiler.CPROFILE
+    return profiler.SAMPLE
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+def _requested(request):
+    """Mode asked for by a valid signed header, or None"""
+    token = request.META.get(HEADER)
+    if not token:
+        return None
+    mode = profiler.check_token(token)
+    if mode is None:
+        logger.warning("Ignoring invalid profiling token for %s", request.path)
+    return mode
+
+
+def _flagged(request):
+    # Checked on the raw query string first, so other requests do not parse it
+    return QUERY_FLAG in request.META.get('QUERY_STRING', '') and QUERY_FLAG in request.GET
+
+
+def _trigger(request, rate, is_staff):
+    """(mode, trigger) if this request should be profiled, else None"""
+    mode = _requested(request)
+    if mode is not None:
+        return mode, 'header'
+    if _flagged(request) and is_staff(request):
+        return _flag_mode(request), 'flag'
+    if rate and random.random() < rate:
+        return profiler.SAMPLE, 'sampled'
+    return None
+
+
+def save_report(request, response, profile, duration):
+    """Store the profile of a finished request; returns the report, or None if it could not be saved"""
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    try:
+        report = ProfileReport.objects.create(
+            method=request.method,
+            path=request.path[:255],
+            view_name=match.view_name[:100] if match is not None else '',
+            user=user if user is not None and user.is_authenticated else None,
+            status_code=response.status_code,
+            mode=profile.mode,
+            trigger=profile.trigger,
+            duration_ms=duration * 1000,
+            query_count=profile.query_count,
+            query_ms=profile.query_seconds * 1000,
+            collapsed=profile.collapsed,
+            report=profile.report(),
+        )
+        days = getattr(settings, 'PROFILING_RETENTION_DAYS', 7)
+        ProfileReport.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+    except Exception:
+        logger.exception("Could not save the profile of %s %s", request.method, request.path)
+        return None
+    logger.info("Profiled %s %s: report %s (%.0f ms)", request.method, request.path, report.pk, duration * 1000)
+    return report
+
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it; place it after AuthenticationMiddleware"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', True)
+        self.rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.enabled and _trigger(request, self.rate, _is_staff)
+        if not trigger:
+            return self.get_response(request)
+
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            profiler.install(connection)
+        profile = profiler.Profile(*trigger)
+        started = time.perf_counter()
+        with profiler.activate(profile):
+            profile.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.stop()
+        report = save_report(request, response, profile, time.perf_counter() - started)
+        if report is not None:
+            response['X-Lume-Profile-Id'] = str(report.pk)
+        return response
+
+    async def __acall__(self, request):
+        # request.user is lazy and hits the database, so it is only checked (in a thread) for flagged requests
+        is_staff = await sync_to_async(_is_staff)(request) if self.enabled and _flagged(request) else False
+        trigger = self.enabled and _trigger(request, self.rate, lambda request: is_staff)
+        if not trigger:
+            return await self.get_response(request)
+
+        # Only the sampler can follow a coroutine; it samples the event loop's thread
+        profile = profiler.Profile(profiler.SAMPLE, trigger[1])
+        started = time.perf_counter()
+        with profiler.activate(profile):
+            profile.start(threading.get_ident())
+            try:
+                response = await self.get_response(request)
+            finally:
+                profile.stop()
+        report = await sync_to_async(save_report)(request, response, profile, time.perf_counter() - started)
+        if report is not None:
+            response['X-Lume-Profile-Id'] = str(report.pk)
+        return response
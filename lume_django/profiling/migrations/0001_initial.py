@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileReport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("method", models.CharField(max_length=10)),
+                ("path", models.CharField(max_length=255)),
+                ("view_name", models.CharField(blank=True, max_length=100)),
+                ("status_code", models.PositiveSmallIntegerField()),
+                (
+                    "mode",
+                    models.CharField(
+                        choices=[
+                            ("sample", "Statistical sampling"),
+                            ("cprofile", "cProfile"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("trigger", models.CharField(max_length=10)),
+                ("duration_ms", models.FloatField()),
+                ("query_count", models.PositiveIntegerField(default=0)),
+                ("query_ms", models.FloatField(default=0)),
+                ("collapsed", models.TextField(blank=True)),
+                ("report", models.JSONField(default=dict)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
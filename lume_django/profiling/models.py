@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import models
+
+
+class ProfileReport(models.Model):
+    """
+    One profiled request (see profiling/middleware.py).
+    """
+    SAMPLE = 'sample'
+    CPROFILE = 'cprofile'
+    MODE_CHOICES = [
+        (SAMPLE, 'Statistical sampling'),
+        (CPROFILE, 'cProfile'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    view_name = models.CharField(max_length=100, blank=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+    status_code = models.PositiveSmallIntegerField()
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    trigger = models.CharField(max_length=10)  # header, flag or sampled
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    query_ms = models.FloatField(default=0)
+    # Flamegraph input: one "frame;frame;frame weight" line per stack
+    collapsed = models.TextField(blank=True)
+    # Queries, stages and (cProfile) top functions
+    report = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
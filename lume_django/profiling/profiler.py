@@ -0,0 +1,221 @@
+"""
+Per-request profiles: call stacks, SQL queries and named stages.
+
+A Profile is active for the duration of one request (see middleware.py) and
+reachable through a context variable, so code can mark stages of its own work
+with ``stage(name)``; when no profile is active that is a shared no-op context
+manager, and the SQL hook returns after one context variable lookup.
+
+Two stack profilers:
+
+- ``sample``: a thread reads the request thread's stack every
+  ``PROFILING_SAMPLE_INTERVAL`` seconds. Cheap enough to leave on for sampled
+  production traffic; used for async requests too, where it samples the event
+  loop thread (so it also sees whatever else the loop runs meanwhile).
+- ``cprofile``: deterministic, with exact call counts but noticeable overhead.
+  Its collapsed stacks only have two levels (caller;callee weighted by time),
+  as cProfile does not record full stacks.
+"""
+
+import contextlib
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.db.backends.signals import connection_created
+
+SAMPLE = 'sample'
+CPROFILE = 'cprofile'
+MODES = (SAMPLE, CPROFILE)
+
+MAX_QUERIES = 200  # kept per report, slowest first
+MAX_SQL_LENGTH = 2000
+MAX_FUNCTIONS = 50
+
+_TOKEN_SALT = 'lume.profiling'
+
+_active = ContextVar('lume_profile', default=None)
+_null = contextlib.nullcontext()
+
+
+def current():
+    """The profile of the running request, or None"""
+    return _active.get()
+
+
+def stage(name):
+    """Context manager timing a named stage of the current request when it is profiled"""
+    profile = _active.get()
+    if profile is None:
+        return _null
+    return profile.stage(name)
+
+
+def sign_token(mode=SAMPLE):
+    """Value for the ``X-Lume-Profile`` header, valid for ``PROFILING_TOKEN_MAX_AGE`` seconds"""
+    return signing.TimestampSigner(salt=_TOKEN_SALT).sign(mode)
+
+
+def check_token(token):
+    """The mode a header token asks for, or None if it is invalid or expired"""
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+    try:
+        mode = signing.TimestampSigner(salt=_TOKEN_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def _frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class Sampler(threading.Thread):
+    """Collects the stacks of thread ``thread_id`` until stopped"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, mode, trigger):
+        self.mode = mode
+        self.trigger = trigger
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.stages = {}  # name -> [calls, seconds]
+        self.collapsed = ''
+        self.functions = []
+        self.samples = 0
+        self._profiler = None
+        self._sampler = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += time.perf_counter() - started
+
+    def add_query(self, sql, seconds, alias):
+        self.query_count += 1
+        self.query_seconds += seconds
+        self.queries.append({'sql': sql[:MAX_SQL_LENGTH], 'ms': round(seconds * 1000, 3), 'alias': alias})
+
+    def start(self, thread_id=None):
+        if self.mode == CPROFILE:
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+                return
+            except ValueError:
+                # Python 3.12+ allows one cProfile at a time per process
+                self._profiler = None
+                self.mode = SAMPLE
+        if self.mode == SAMPLE:
+            interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)
+            self._sampler = Sampler(thread_id or threading.get_ident(), interval)
+            self._sampler.start()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._collect_cprofile(pstats.Stats(self._profiler))
+            self._profiler = None
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.samples = self._sampler.samples
+            self.collapsed = '\n'.join(f'{stack} {count}' for stack, count in self._sampler.stacks.most_common())
+            self._sampler = None
+
+    def _collect_cprofile(self, stats):
+        def name(func):
+            filename, line, function = func
+            return f"{filename}:{line}:{function}" if line else function
+
+        functions = []
+        edges = Counter()
+        for func, (calls, primitive, own, cumulative, callers) in stats.stats.items():
+            functions.append({
+                'function': name(func),
+                'calls': calls,
+                'own_ms': round(own * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+            })
+            for caller, (_, _, caller_own, _) in callers.items():
+                # Microseconds, as flamegraph weights are integers
+                edges[f'{name(caller)};{name(func)}'] += int(caller_own * 1e6)
+        functions.sort(key=lambda f: f['cumulative_ms'], reverse=True)
+        self.functions = functions[:MAX_FUNCTIONS]
+        self.collapsed = '\n'.join(f'{stack} {weight}' for stack, weight in edges.most_common() if weight)
+
+    def report(self):
+        """JSON part of the stored report"""
+        return {
+            'stages': {
+                name: {'calls': calls, 'ms': round(seconds * 1000, 3)}
+                for name, (calls, seconds) in self.stages.items()
+            },
+            'queries': sorted(self.queries, key=lambda q: q['ms'], reverse=True)[:MAX_QUERIES],
+            'functions': self.functions,
+            'samples': self.samples,
+        }
+
+
+@contextlib.contextmanager
+def activate(profile):
+    token = _active.set(profile)
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+
+
+def _capture_query(execute, sql, params, many, context):
+    profile = _active.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started, context['connection'].alias)
+
+
+def install(connection, **kwargs):
+    if _capture_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_capture_query)
+
+
+connection_created.connect(install)
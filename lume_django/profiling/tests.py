@@ -0,0 +1,160 @@
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.management import call_command
+from django.test import AsyncClient, override_settings
+
+from lume_django.testing import LumeTestCase
+from . import profiler
+from .models import ProfileReport
+
+DETECT_URL = '/api/service-detector/api/detect-services/'
+
+
+@override_settings(PROFILING_SAMPLE_INTERVAL=0.001)
+class ProfilingTests(LumeTestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', is_staff=True)
+        self.user = User.objects.create_user(username='user', email='user@example.com')
+
+    def detect(self, query='', **headers):
+        return self.client.post(
+            DETECT_URL + query, json.dumps({'text': 'Email Alice and create a task'}),
+            content_type='application/json', **headers,
+        )
+
+    def test_not_triggered_records_nothing(self):
+        response = self.detect()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Lume-Profile-Id', response)
+        self.assertFalse(ProfileReport.objects.exists())
+        self.assertIsNone(profiler.current())
+
+    def test_stage_is_noop_outside_a_profile(self):
+        self.assertIs(profiler.stage('a'), profiler.stage('b'))
+
+    def test_staff_flag_profiles_request(self):
+        self.client.force_login(self.staff)
+        response = self.detect('?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        report = ProfileReport.objects.get(pk=response['X-Lume-Profile-Id'])
+        self.assertEqual((report.mode, report.trigger), (profiler.SAMPLE, 'flag'))
+        self.assertEqual(report.view_name, 'detect_services')
+        self.assertEqual(report.user, self.staff)
+        self.assertEqual(
+            set(report.report['stages']), {'detector.normalize', 'detector.split', 'detector.match'},
+        )
+        self.assertEqual(len(report.report['queries']), report.query_count)
+
+    def test_queries_are_captured(self):
+        profile = profiler.Profile(profiler.SAMPLE, 'flag')
+        with profiler.activate(profile):
+            list(ProfileReport.objects.all())
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        ProfileReport.objects.count()  # after the profile: not captured
+        self.assertEqual(profile.query_count, 2)
+        queries = profile.report()['queries']
+        self.assertIn('profiling_profilereport', ' '.join(q['sql'] for q in queries))
+        self.assertEqual({q['alias'] for q in queries}, {'default'})
+
+    def test_sampler_collapses_stacks(self):
+        profile = profiler.Profile(profiler.SAMPLE, 'flag')
+        profile.start()
+        time.sleep(0.05)
+        profile.stop()
+        self.assertGreater(profile.samples, 0)
+        stack, count = profile.collapsed.splitlines()[0].rsplit(' ', 1)
+        self.assertIn(f'{__name__}:test_sampler_collapses_stacks', stack.split(';'))
+        self.assertEqual(int(count), profile.samples)
+
+    def test_flag_ignored_for_non_staff(self):
+        self.client.force_login(self.user)
+        response = self.detect('?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Lume-Profile-Id', response)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_signed_header_profiles_request(self):
+        response = self.detect(HTTP_X_LUME_PROFILE=profiler.sign_token(profiler.CPROFILE))
+        report = ProfileReport.objects.get(pk=response['X-Lume-Profile-Id'])
+        self.assertEqual((report.mode, report.trigger), (profiler.CPROFILE, 'header'))
+        self.assertIsNone(report.user)
+        functions = [f['function'] for f in report.report['functions']]
+        self.assertTrue(any('detect_services' in f for f in functions))
+        self.assertIn(';', report.collapsed)
+
+    def test_tampered_or_expired_header_is_ignored(self):
+        token = profiler.sign_token()
+        with self.assertLogs('profiling.middleware', 'WARNING') as logs:
+            self.detect(HTTP_X_LUME_PROFILE=token + 'x')
+            with mock.patch('django.core.signing.time.time', return_value=time.time() + 7200):
+                self.detect(HTTP_X_LUME_PROFILE=token)
+            # Signed with another salt
+            self.detect(HTTP_X_LUME_PROFILE=signing.TimestampSigner().sign('sample'))
+        self.assertEqual(len(logs.records), 3)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sample_rate(self):
+        response = self.detect()
+        report = ProfileReport.objects.get(pk=response['X-Lume-Profile-Id'])
+        self.assertEqual((report.mode, report.trigger), (profiler.SAMPLE, 'sampled'))
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        self.client.force_login(self.staff)
+        self.detect('?_profile=1', HTTP_X_LUME_PROFILE=profiler.sign_token())
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_old_reports_are_purged(self):
+        old = ProfileReport.objects.create(
+            method='GET', path='/', status_code=200, mode='sample', trigger='flag', duration_ms=1,
+        )
+        ProfileReport.objects.filter(pk=old.pk).update(created_at=old.created_at - timedelta(days=8))
+        self.detect(HTTP_X_LUME_PROFILE=profiler.sign_token())
+        self.assertFalse(ProfileReport.objects.filter(pk=old.pk).exists())
+        self.assertEqual(ProfileReport.objects.count(), 1)
+
+    async def test_async_request(self):
+        client = AsyncClient()
+        response = await client.post(
+            DETECT_URL, json.dumps({'text': 'Schedule a meeting'}), content_type='application/json',
+            headers={'X-Lume-Profile': profiler.sign_token(profiler.CPROFILE)},
+        )
+        self.assertEqual(response.status_code, 200)
+        report = await ProfileReport.objects.aget(pk=response['X-Lume-Profile-Id'])
+        # Coroutines can only be sampled
+        self.assertEqual(report.mode, profiler.SAMPLE)
+        self.assertIn('detector.match', report.report['stages'])
+
+    def test_admin_downloads(self):
+        response = self.detect(HTTP_X_LUME_PROFILE=profiler.sign_token(profiler.CPROFILE))
+        pk = response['X-Lume-Profile-Id']
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+
+        response = self.client.get(f'/admin/profiling/profilereport/{pk}/change/')
+        self.assertContains(response, 'detector.match')
+        response = self.client.get(f'/admin/profiling/profilereport/{pk}/download/collapsed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(';', response.content.decode())
+        response = self.client.get(f'/admin/profiling/profilereport/{pk}/download/json/')
+        self.assertIn('stages', json.loads(response.content))
+
+        self.client.force_login(self.user)
+        response = self.client.get(f'/admin/profiling/profilereport/{pk}/download/json/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_profile_token_command(self):
+        stdout = StringIO()
+        call_command('profile_token', '--mode', 'cprofile', stdout=stdout, stderr=StringIO())
+        token = stdout.getvalue().strip()
+        self.assertEqual(profiler.check_token(token), profiler.CPROFILE)
+
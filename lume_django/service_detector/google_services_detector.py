@@ -29,10 +29,18 @@ Integration with Django:
     ]
 """
 
+import contextlib
 import re
 from typing import Dict, List, Set
 import logging
 
+try:
+    from profiling.profiler import stage
+except ImportError:
+    # Standalone use, outside the Django project: stages are not timed
+    def stage(name):
+        return contextlib.nullcontext()
+
 # Configure logging for Django
 logger = logging.getLogger(__name__)
 
@@ -200,26 +208,29 @@ def detect_services(text: str, use_spacy: bool = False) -> Dict[str, bool]:
         return result
     
     # Normalize input
-    normalized_text = _normalize_text(text)
+    with stage('detector.normalize'):
+        normalized_text = _normalize_text(text)
     
     # Split into clauses
-    if use_spacy:
-        try:
-            clauses = _split_by_spacy(normalized_text)
-        except ImportError:
-            logger.warning("spaCy not available, falling back to simple splitting")
-            clauses = _split_by_conjunctions(normalized_text)
-        except Exception as e:
-            logger.error(f"spaCy parsing failed: {e}, falling back to simple splitting")
+    with stage('detector.split'):
+        if use_spacy:
+            try:
+                clauses = _split_by_spacy(normalized_text)
+            except ImportError:
+                logger.warning("spaCy not available, falling back to simple splitting")
+                clauses = _split_by_conjunctions(normalized_text)
+            except Exception as e:
+                logger.error("spaCy parsing failed: %s, falling back to simple splitting", e)
+                clauses = _split_by_conjunctions(normalized_text)
+        else:
             clauses = _split_by_conjunctions(normalized_text)
-    else:
-        clauses = _split_by_conjunctions(normalized_text)
     
     # Detect services in each clause
-    for clause in clauses:
-        for service, keywords in SERVICE_KEYWORDS.items():
-            if _detect_service_in_clause(clause, service, keywords):
-                result[service] = True
+    with stage('detector.match'):
+        for clause in clauses:
+            for service, keywords in SERVICE_KEYWORDS.items():
+                if _detect_service_in_clause(clause, service, keywords):
+                    result[service] = True
     
     return result
 
@@ -298,9 +309,11 @@ def detect_services_view_helper(text: str, request=None) -> Dict[str, bool]:
     if request:
         user = getattr(request, 'user', None)
         user_id = user.id if user and user.is_authenticated else 'anonymous'
-        logger.info(f"Service detection for user {user_id}: {result} | Text: {text[:100]}")
+        logger.info("Service detection for user %s: %s", user_id, result, extra={'user_id': user_id})
     else:
-        logger.info(f"Service detection: {result} | Text: {text[:100]}")
+        logger.info("Service detection: %s", result)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Service detection text: %s", text[:100])
     
     return result
 
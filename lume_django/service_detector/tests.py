@@ -1,3 +1,24 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import override_settings
+
+from lume_django.ratelimit import get_store
+from lume_django.testing import LumeTestCase
+
+
+class AnalyzeIntentTests(LumeTestCase):
+    def _analyze(self, text):
+        return self.client.post('/api/service-detector/api/detect-services/', json.dumps({'text': text}), content_type='application/json')
+
+    def test_detects_services(self):
+        data = self._analyze('Email the report and add it to my calendar').json()
+        self.assertTrue(data['services']['email'])
+        self.assertTrue(data['services']['calendar'])
+
+    @override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS={'analyze_intent': {'ip': '1/min'}})
+    def test_throttled_per_ip(self):
+        get_store().clear()
+        self.assertEqual(self._analyze('Check my tasks').status_code, 200)
+        response = self._analyze('Check my tasks')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
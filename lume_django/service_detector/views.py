@@ -1,11 +1,13 @@
-from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
+from lume_django.ratelimit import rate_limit
+from lume_django.responses import json_response
 from .google_services_detector import detect_services
 
 @csrf_exempt  # For testing only - remove in production!
 @require_http_methods(["POST"])
+@rate_limit('analyze_intent')
 def analyze_intent(request):
     try:
         # Parse JSON body
@@ -13,24 +15,24 @@ def analyze_intent(request):
         text = data.get('text', '')
         
         if not text:
-            return JsonResponse({
+            return json_response(request, {
                 'error': 'Text parameter is required'
             }, status=400)
         
         # Detect services
         services = detect_services(text)
         
-        return JsonResponse({
+        return json_response(request, {
             'success': True,
             'text': text,
             'services': services
         })
     
     except json.JSONDecodeError:
-        return JsonResponse({
+        return json_response(request, {
             'error': 'Invalid JSON'
         }, status=400)
     except Exception as e:
-        return JsonResponse({
+        return json_response(request, {
             'error': str(e)
         }, status=500)
\ No newline at end of file